@@ -1,117 +1,126 @@
-import json, os, uuid
-from datetime import datetime, UTC
-from openai import OpenAI
-from elevenlabs import ElevenLabs, play
-import sounddevice as sd
-from scipy.io.wavfile import write
+import uuid
+from src.john.core import (
+    ask_llm_stream, log_event, flush_log, get_system_prompt, get_model,
+    listen_and_transcribe, tts_enabled, get_input_budget,
+    summarize_turns, get_summary_min_tokens, prewarm_in_background,
+    begin_trace, log_timing, route_intent, log_routed, set_speak, get_speak, reload_config, recall,
+    reply_model, settings
+)
+from src.john import metrics
+from src.john.context import ContextWindow, RollingSummarizer
+from src.john.speech import SpeechPipeline
 
-# --- load config (key + model) ---
-with open("config.json", "r", encoding="utf-8") as f:
-    cfg = json.load(f)
+CLI_VOICE_ID = "kqVT88a5QfII1HNAEPTJ"  # the CLI's own voice, unless config.json sets VOICE_ID
 
-client = OpenAI(api_key=cfg["OPENAI_API_KEY"])
-MODEL = cfg.get("MODEL", "gpt-5-nano")
-SPEAK = bool(cfg.get("SPEAK", False))
-
-# --- load system prompt ---
-with open("system_prompt.txt", "r", encoding="utf-8") as f:
-    SYSTEM_PROMPT = f.read().strip()
-
-# --- init ElevenLabs ---
-eleven = ElevenLabs(api_key=cfg.get("ELEVEN_API_KEY"))
-
-def say(text: str):
-    if not SPEAK or not cfg.get("ELEVEN_API_KEY"):
-        return
-    try:
-        audio = eleven.text_to_speech.convert(
-            voice_id="kqVT88a5QfII1HNAEPTJ",  # pick any from your ElevenLabs dashboard
-            model_id="eleven_multilingual_v2",
-            text=text
-        )
-        play(audio)
-    except Exception as e:
-        print(f"[TTS error] {e}")
-
-
-# --- logging helpers ---
-LOG_DIR = "logs"
-HISTORY_PATH = os.path.join(LOG_DIR, "history.jsonl")
-
-def _ensure_logs():
-    os.makedirs(LOG_DIR, exist_ok=True)
-
-def log_event(event: dict):
-    """Append one JSON object (with auto ts) to logs/history.jsonl."""
-    _ensure_logs()
-    event = {**event, "ts": datetime.now(UTC).isoformat()}
-    with open(HISTORY_PATH, "a", encoding="utf-8") as f:
-        f.write(json.dumps(event, ensure_ascii=False) + "\n")   
-
-# --- LLM call ---
-def ask_llm(messages: list[dict]) -> str:
-    resp = client.chat.completions.create(
-        model=MODEL,
-        messages=messages,
-        max_completion_tokens=400,       # GPT-5 Nano uses this (not max_tokens)
-        reasoning_effort="minimal"       # cheap/fast
-    )
-    return resp.choices[0].message.content
-
-def record_audio(filename="input.wav", duration=5, samplerate=16000):
-    """Record audio from the mic and save as WAV."""
-    print(f"[Recording for {duration} seconds...]")
-    audio = sd.rec(int(duration * samplerate), samplerate=samplerate, channels=1, dtype='int16')
-    sd.wait()  # Wait until recording is finished
-    write(filename, samplerate, audio)
-    print("[Recording complete]")
-    return filename
-
-def transcribe_audio(path: str) -> str:
-    """Send audio file to OpenAI Whisper and return text."""
-    with open(path, "rb") as f:
-        transcript = client.audio.transcriptions.create(
-            model="gpt-4o-mini-transcribe",  # cheap + accurate
-            file=f
-        )
-    return transcript.text.strip()
 
 def chat_loop():
     print("John is ready. Type 'exit' to quit.")
+    settings.default_voice_id = CLI_VOICE_ID
+    prewarm_in_background()  # clients + connections ready before the first question
     session = uuid.uuid4().hex
 
     # seed with system prompt, and log it
-    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-    log_event({"session": session, "role": "system", "content": SYSTEM_PROMPT, "model": MODEL})
+    context = ContextWindow(get_system_prompt(), get_input_budget())
+    summarizer = RollingSummarizer(context, summarize_turns, get_summary_min_tokens())
+    log_event({"session": session, "role": "system", "content": get_system_prompt(), "model": get_model()})
 
+    speech = None  # the reply still being spoken, if any
     while True:
         choice = input("Type your message or press Enter to talk: ").strip()
+        # typing or talking over John cuts him off
+        if speech and speech.active:
+            speech.cancel()
+            log_event({"session": session, "role": "meta", "event": "barge_in"})
+        trace = begin_trace()  # per-stage timings, attached to the logged events
         if choice == "":
-            wav_path = record_audio(duration=5)  # record 5 seconds
-            user_text = transcribe_audio(wav_path)
+            user_text = listen_and_transcribe()  # stops on its own when you pause
+            if user_text is None:
+                continue
             print(f"You (voice): {user_text}")
         else:
             user_text = choice
-        if user_text.lower() in {"exit", "quit", "q"}:
-            print("John: Bye!")
-            log_event({"session": session, "role": "meta", "event": "end"})
-            break
-
-        messages.append({"role": "user", "content": user_text})
-        log_event({"session": session, "role": "user", "content": user_text})
-
-        # keep costs low: trim old turns (keep system + last ~14)
-        if len(messages) > 16:
-            messages = [messages[0]] + messages[-14:]
-
-        reply = ask_llm(messages)
-        messages.append({"role": "assistant", "content": reply})
-        log_event({"session": session, "role": "assistant", "content": reply, "model": MODEL})
-        print(f"John: {reply}")
-        say(reply)  # speak the reply if enable
+        # commands and trivial questions are handled locally, without an LLM call
+        hit = route_intent(user_text)
+        if hit is not None:
+            log_routed(session, user_text, hit, trace)
+            if hit.action == "exit":
+                print("John: Bye!")
+                log_event({"session": session, "role": "meta", "event": "end"})
+                break
+            if hit.action == "clear":
+                context.reset(get_system_prompt())
+                summarizer.reset()
+                log_event({"session": session, "role": "meta", "event": "end"})
+                session = uuid.uuid4().hex
+                log_event({"session": session, "role": "system", "content": get_system_prompt(), "model": get_model()})
+                print("[Chat history cleared]")
+            elif hit.action in ("speech_on", "speech_off", "toggle_speech"):
+                set_speak(hit.action == "speech_on" or (hit.action == "toggle_speech" and not get_speak()))
+                print(f"[Speech {'ON' if get_speak() else 'OFF'}]")
+            elif hit.action == "reload":
+                config = reload_config()
+                print(f"[Config reloaded - model: {config['model']}, speech: {'ON' if config['speak'] else 'OFF'}]")
+            else:
+                print(f"John: {hit.reply}")
+                summarizer.add(context.add("user", user_text))
+                summarizer.add(context.add("assistant", hit.reply))
+                log_event({"session": session, "role": "user", "content": user_text})
+                log_event({"session": session, "role": "assistant", "content": hit.reply, "model": "local"})
+                if tts_enabled():
+                    speech = SpeechPipeline(on_barge_in=lambda: print("\n[Interrupted - press Enter to talk]"))
+                    speech.feed(hit.reply)
+                    speech.close()
+            continue
+
+        # notes from earlier sessions go after the system prompt; then, to keep
+        # costs low, the oldest turns are dropped once the token budget is hit
+        context.set_memory(recall(user_text, session))
+        summarizer.add(context.add("user", user_text))
+        log_event({"session": session, "role": "user", "content": user_text, **metrics.fields(trace)})
+
+        # print tokens as they arrive, speak each sentence as soon as it's complete
+        speech = SpeechPipeline(
+            on_done=lambda: log_timing(session, trace, "speech"),
+            on_barge_in=lambda: print("\n[Interrupted - press Enter to talk]"),
+        ) if tts_enabled() else None
+        print("John: ", end="", flush=True)
+        parts = []
+        stream = ask_llm_stream(context.messages())
+        try:
+            for delta in stream:
+                print(delta, end="", flush=True)
+                parts.append(delta)
+                if speech:
+                    speech.feed(delta)
+        except KeyboardInterrupt:
+            # Ctrl+C stops the reply: the stream is closed, nothing more is spoken.
+            # What was said so far stays in the context, so turns keep alternating
+            stream.close()
+            if speech:
+                speech.cancel()
+            print(" …")
+            partial = "".join(parts).rstrip() + " …"
+            summarizer.add(context.add("assistant", partial.lstrip()))
+            fields = metrics.fields(trace)
+            log_event({"session": session, "role": "assistant", "content": partial.lstrip(),
+                       "model": reply_model(fields), "interrupted": True, **fields})
+            log_event({"session": session, "role": "meta", "event": "barge_in"})
+            continue
+        print()
+        reply = "".join(parts)
+        summarizer.add(context.add("assistant", reply))
+        fields = metrics.fields(trace)
+        log_event({"session": session, "role": "assistant", "content": reply, "model": reply_model(fields),
+                   **fields})
+        summarizer.kick()  # evicted turns -> running summary, in the background
+        if speech:
+            speech.close()  # keeps talking while you type; a new turn cuts it off
 
 def main():
-    chat_loop()
+    try:
+        chat_loop()
+    finally:
+        flush_log()
 
 if __name__ == "__main__":
     main()
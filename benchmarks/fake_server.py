@@ -0,0 +1,223 @@
+# benchmarks/fake_server.py
+"""
+Local stand-in for the OpenAI and ElevenLabs endpoints John uses, so the
+assistant can be benchmarked without API keys, cost or network noise.
+
+    python benchmarks/fake_server.py --port 8911 --latency-ms 300 --tokens-per-s 60
+
+Point the app at it with "OPENAI_BASE_URL": "http://127.0.0.1:8911/v1" and
+"ELEVEN_BASE_URL": "http://127.0.0.1:8911" in config.json (any API key).
+
+Endpoints:
+    POST /v1/chat/completions        streaming (SSE) and non-streaming
+    POST /v1/audio/transcriptions    fixed text
+    POST /v1/text-to-speech/<voice>  silent audio, ~1 s per 15 characters (mp3 or
+                                     raw PCM per ?output_format=; /stream too)
+    GET  /v1/models                  warm-up
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = ("Sure. Here is a short answer from the benchmark server. It has a few "
+         "sentences, so speech can start before the reply is done. That is all.")
+
+class Profile:
+    """
+    What the fake providers do: `latency_ms` (+ up to `jitter_ms`) before
+    the first byte, `tokens_per_s` while streaming, and `error_rate` of
+    requests answered with 429 (Retry-After: `retry_after_s`) or, for
+    `server_error_share` of them, 500.
+    """
+    def __init__(self, latency_ms: float = 200, jitter_ms: float = 50, tokens_per_s: float = 80,
+                 error_rate: float = 0.0, server_error_share: float = 0.2,
+                 retry_after_s: float = 0.2, reply: str = REPLY, seed: int | None = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tokens_per_s = tokens_per_s
+        self.error_rate = error_rate
+        self.server_error_share = server_error_share
+        self.retry_after_s = retry_after_s
+        self.reply = reply
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def wait_first_byte(self):
+        with self._lock:
+            jitter = self._rng.uniform(0, self.jitter_ms)
+        time.sleep((self.latency_ms + jitter) / 1000)
+
+    def draw_error(self) -> int | None:
+        """Status code to fail this request with, or None."""
+        with self._lock:
+            self.requests += 1
+            if self._rng.random() >= self.error_rate:
+                return None
+            self.errors += 1
+            return 500 if self._rng.random() < self.server_error_share else 429
+
+    def tokens(self) -> list[str]:
+        # roughly one token per word (keeping the separating spaces)
+        words = self.reply.split(" ")
+        return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeProviders/1.0"
+
+    @property
+    def profile(self) -> Profile:
+        return self.server.profile
+
+    def log_message(self, format, *args):
+        pass
+
+    # --- helpers ---
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _send(self, status: int, body: bytes, ctype: str = "application/json", headers: dict | None = None):
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status: int, obj: dict, headers: dict | None = None):
+        self._send(status, json.dumps(obj).encode(), headers=headers)
+
+    def _fail(self, status: int):
+        if status == 429:
+            ra = self.profile.retry_after_s
+            self._json(429, {"error": {"message": "Rate limit reached (fake)", "type": "rate_limit_exceeded"}},
+                       headers={"Retry-After": f"{ra:g}", "retry-after-ms": str(int(ra * 1000))})
+        else:
+            self._json(status, {"error": {"message": "Injected server error (fake)", "type": "server_error"}})
+
+    # --- routes ---
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/v1/models", "/models"):
+            self._json(200, {"object": "list", "data": [{"id": "fake", "object": "model"}], "models": []})
+        else:
+            self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        body = self._body()
+        url = urlsplit(self.path)
+        path = url.path
+        status = self.profile.draw_error()
+        self.profile.wait_first_byte()
+        if status is not None:
+            return self._fail(status)
+        if path == "/v1/chat/completions":
+            req = json.loads(body or b"{}")
+            if req.get("stream"):
+                return self._chat_stream(req)
+            return self._chat(req)
+        if path == "/v1/audio/transcriptions":
+            return self._json(200, {"text": "What is the weather like today?"})
+        if path.startswith("/v1/text-to-speech/"):
+            fmt = parse_qs(url.query).get("output_format", ["mp3_44100_128"])[0]
+            return self._tts(json.loads(body or b"{}"), fmt)
+        self._json(404, {"error": {"message": "not found"}})
+
+    def _chat(self, req: dict):
+        tokens = self.profile.tokens()
+        if self.profile.tokens_per_s > 0:
+            time.sleep(len(tokens) / self.profile.tokens_per_s)
+        self._json(200, {
+            "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+            "model": req.get("model", "fake"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "".join(tokens)}}],
+            "usage": {"prompt_tokens": _prompt_tokens(req), "completion_tokens": len(tokens),
+                      "total_tokens": _prompt_tokens(req) + len(tokens)},
+        })
+
+    def _chat_stream(self, req: dict):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        base = {"id": "chatcmpl-fake", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": req.get("model", "fake")}
+        gap = 1 / self.profile.tokens_per_s if self.profile.tokens_per_s > 0 else 0
+        tokens = self.profile.tokens()
+        try:
+            for i, tok in enumerate(tokens):
+                if i:
+                    time.sleep(gap)
+                delta = {"content": tok, **({"role": "assistant"} if i == 0 else {})}
+                self._chunk({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+            self._chunk({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            if (req.get("stream_options") or {}).get("include_usage"):
+                self._chunk({**base, "choices": [], "usage": {
+                    "prompt_tokens": _prompt_tokens(req), "completion_tokens": len(tokens),
+                    "total_tokens": _prompt_tokens(req) + len(tokens)}})
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # client closed the stream early
+
+    def _chunk(self, obj: dict):
+        self._write_chunk(b"data: " + json.dumps(obj).encode() + b"\n\n")
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _tts(self, req: dict, fmt: str):
+        seconds = max(0.5, len(req.get("text", "")) / 15)
+        if fmt.startswith("pcm_"):
+            rate = int(fmt.split("_")[1])
+            return self._send(200, b"\x00\x00" * int(seconds * rate), ctype="audio/pcm")
+        # MPEG-1 layer III frames of silence at 128 kbit/s (417 bytes, ~26 ms each)
+        frame = b"\xff\xfb\x90\x64" + b"\x00" * 413
+        self._send(200, frame * int(seconds / 0.026), ctype="audio/mpeg")
+
+def _prompt_tokens(req: dict) -> int:
+    return sum(len(str(m.get("content", ""))) // 4 + 4 for m in req.get("messages", []))
+
+def start(host: str = "127.0.0.1", port: int = 0, profile: Profile | None = None) -> ThreadingHTTPServer:
+    """Start the fake server on a daemon thread; `port=0` picks a free port (see .server_port)."""
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.profile = profile or Profile()
+    threading.Thread(target=server.serve_forever, name="fake-providers", daemon=True).start()
+    return server
+
+def add_profile_args(ap: argparse.ArgumentParser):
+    ap.add_argument("--latency-ms", type=float, default=200, help="time to first byte")
+    ap.add_argument("--jitter-ms", type=float, default=50)
+    ap.add_argument("--tokens-per-s", type=float, default=80, help="streaming speed (0 = instant)")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="share of requests that fail (429 / 500)")
+    ap.add_argument("--retry-after-s", type=float, default=0.2)
+    ap.add_argument("--seed", type=int)
+
+def profile_from_args(args) -> Profile:
+    return Profile(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, tokens_per_s=args.tokens_per_s,
+                   error_rate=args.error_rate, retry_after_s=args.retry_after_s, seed=args.seed)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8911)
+    add_profile_args(ap)
+    args = ap.parse_args(argv)
+    server = start(args.host, args.port, profile_from_args(args))
+    print(f"Fake OpenAI/ElevenLabs on http://{args.host}:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
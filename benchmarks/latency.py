@@ -0,0 +1,256 @@
+# benchmarks/latency.py
+"""
+Latency / throughput benchmark of the core API against the local fake
+providers (benchmarks/fake_server.py): no API keys, no cost, no network.
+
+    python benchmarks/latency.py                          # 4 sessions x 10 turns
+    python benchmarks/latency.py --sessions 16 --error-rate 0.05 --json bench.json
+    python benchmarks/latency.py --json new.json --compare bench.json
+
+Scenarios: ask_llm, ask_llm_stream (time to first token), transcribe_audio,
+synthesize (what say() sends; playback is left out) and a full voice turn
+(transcribe -> streamed reply fed to the app's speech.SpeechPipeline, with
+time to first audio; the pipeline plays into a null sink that takes audio
+as fast as it comes, so no sound device is needed). Each reports p50/p95/p99 in ms, errors and throughput at
+--sessions concurrent sessions. Settings and logs go to a temp dir, so the
+local config.json is never read.
+"""
+import io
+import os
+import sys
+import json
+import time
+import wave
+import argparse
+import tempfile
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_server  # noqa: E402
+from src.john import core, metrics  # noqa: E402
+from src.john.speech import SpeechPipeline  # noqa: E402
+
+SCENARIOS = ("ask_llm", "ask_llm_stream", "transcribe_audio", "synthesize", "voice_turn")
+MESSAGES = [
+    {"role": "system", "content": core.DEFAULT_PROMPT},
+    {"role": "user", "content": "Give me a quick tip for a productive morning."},
+]
+
+def _speech_wav(seconds: float = 2.0, rate: int = 16000) -> io.BytesIO:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b"\x00\x00" * int(seconds * rate))
+    buf.name = "speech.wav"
+    return buf
+
+class NullPlayer:
+    """Stands in for audio.PCMPlayer: takes every chunk at once and reports it played."""
+    def __init__(self, samplerate: int):
+        self.samplerate = samplerate
+        self.position = 0
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def write(self, data: bytes) -> bool:
+        self.position += len(data) // 2
+        return True
+
+    def played(self, position: int) -> bool:
+        return True
+
+    def drain(self):
+        pass
+
+    def stop(self):
+        pass
+
+def _configure(url: str, tmp: str, sessions: int):
+    cfg = {
+        "OPENAI_API_KEY": "fake", "ELEVEN_API_KEY": "fake",
+        "OPENAI_BASE_URL": f"{url}/v1", "ELEVEN_BASE_URL": url,
+        "SPEAK": True, "HTTP_WARMUP": False,
+        "TTS_CACHE_MB": 0, "LLM_CACHE": False,  # every call must reach the server
+        "LOG_DIR": os.path.join(tmp, "history"),
+        "OPENAI_HTTP": {"max_connections": max(10, sessions * 2), "max_keepalive": max(5, sessions * 2)},
+        "ELEVEN_HTTP": {"max_connections": max(10, sessions * 2), "max_keepalive": max(5, sessions * 2)},
+    }
+    path = os.path.join(tmp, "config.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(cfg, f)
+    core.settings.config_path = path
+    core.settings.prompt_path = os.path.join(tmp, "system_prompt.txt")  # missing -> default prompt
+    core.reload_config()
+    core._player = NullPlayer(core.pcm_rate())  # the shared player SpeechPipeline writes to
+
+# --- one call per scenario; each returns {"e2e": s, ...} ---
+def run_ask_llm() -> dict:
+    t0 = time.perf_counter()
+    core.ask_llm(MESSAGES)
+    return {"e2e": time.perf_counter() - t0}
+
+def run_ask_llm_stream() -> dict:
+    t0 = time.perf_counter()
+    ttft = None
+    for _ in core.ask_llm_stream(MESSAGES):
+        if ttft is None:
+            ttft = time.perf_counter() - t0
+    return {"ttft": ttft, "e2e": time.perf_counter() - t0}
+
+def run_transcribe_audio() -> dict:
+    wav = _speech_wav()
+    t0 = time.perf_counter()
+    core.transcribe_audio(wav)
+    return {"e2e": time.perf_counter() - t0}
+
+def run_synthesize() -> dict:
+    t0 = time.perf_counter()
+    core.synthesize("Here is a short answer from the benchmark.")
+    return {"e2e": time.perf_counter() - t0}
+
+def run_voice_turn() -> dict:
+    wav = _speech_wav()
+    trace = metrics.use(metrics.Trace())  # the pipeline's threads mark first_audio on it
+    t0 = trace.t0
+    text = core.transcribe_audio(wav)
+    messages = MESSAGES[:1] + [{"role": "user", "content": text}]
+    ttft = None
+    pipeline = SpeechPipeline()
+    try:
+        for delta in core.ask_llm_stream(messages):
+            if ttft is None:
+                ttft = time.perf_counter() - t0
+            pipeline.feed(delta)
+        pipeline.close()
+        pipeline.wait()
+    finally:
+        if pipeline.active:
+            pipeline.cancel()  # the turn failed: stop the pipeline's threads
+        metrics.use(None)
+    first_audio = trace.take().get("timing", {}).get("first_audio_ms")
+    return {"ttft": ttft, "first_audio": first_audio / 1000 if first_audio is not None else None,
+            "e2e": time.perf_counter() - t0}
+
+RUNNERS = {name: globals()[f"run_{name}"] for name in SCENARIOS}
+
+# --- driver ---
+def _pct(values: list[float], p: float) -> float:
+    data = sorted(values)
+    return data[min(len(data) - 1, int(p / 100 * len(data)))]
+
+def _dist(values: list[float]) -> dict:
+    values = [v for v in values if v is not None]
+    if not values:
+        return {}
+    return {f"p{p}": round(_pct(values, p) * 1000, 1) for p in (50, 95, 99)}
+
+def run_scenario(name: str, sessions: int, turns: int) -> dict:
+    runner = RUNNERS[name]
+    records, errors = [], []
+    lock = threading.Lock()
+
+    def session():
+        for _ in range(turns):
+            try:
+                r = runner()
+                with lock:
+                    records.append(r)
+            except Exception as e:
+                with lock:
+                    errors.append(f"{type(e).__name__}: {e}")
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=session) for _ in range(sessions)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    result = {"calls": len(records), "errors": len(errors),
+              "throughput_per_s": round(len(records) / wall, 2) if wall else 0.0}
+    for metric in ("ttft", "first_audio", "e2e"):
+        dist = _dist([r.get(metric) for r in records])
+        if dist:
+            result[f"{metric}_ms"] = dist
+    if errors:
+        result["first_error"] = errors[0]
+    return result
+
+def compare(current: dict, baseline: dict):
+    """Print the relative change of every percentile against an earlier results file."""
+    print(f"\nvs {baseline.get('label', 'baseline')}:")
+    for name, res in current["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old:
+            continue
+        for metric, dist in res.items():
+            if not metric.endswith("_ms") or metric not in old:
+                continue
+            changes = []
+            for p, v in dist.items():
+                before = old[metric].get(p)
+                if before:
+                    changes.append(f"{p} {before:.0f}->{v:.0f} ({(v - before) / before:+.0%})")
+            print(f"  {name:17} {metric:15} " + "  ".join(changes))
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sessions", type=int, default=4, help="concurrent sessions")
+    ap.add_argument("--turns", type=int, default=10, help="calls per session and scenario")
+    ap.add_argument("--scenario", action="append", choices=SCENARIOS, help="run only these (repeatable)")
+    ap.add_argument("--url", help="use an already running fake server instead of starting one")
+    ap.add_argument("--label", help="name stored in the results file")
+    ap.add_argument("--json", help="write results to this file")
+    ap.add_argument("--compare", help="earlier results file to compare against")
+    fake_server.add_profile_args(ap)
+    args = ap.parse_args(argv)
+
+    server = None
+    url = args.url
+    if url is None:
+        server = fake_server.start(profile=fake_server.profile_from_args(args))
+        url = f"http://127.0.0.1:{server.server_port}"
+
+    with tempfile.TemporaryDirectory(prefix="john-bench-") as tmp:
+        _configure(url.rstrip("/"), tmp, args.sessions)
+        results = {
+            "label": args.label or time.strftime("%Y-%m-%d %H:%M:%S"),
+            "params": {"sessions": args.sessions, "turns": args.turns, "latency_ms": args.latency_ms,
+                       "jitter_ms": args.jitter_ms, "tokens_per_s": args.tokens_per_s,
+                       "error_rate": args.error_rate, "external_server": bool(args.url)},
+            "scenarios": {},
+        }
+        for name in args.scenario or SCENARIOS:
+            res = run_scenario(name, args.sessions, args.turns)
+            results["scenarios"][name] = res
+            parts = [f"{res['calls']} ok", f"{res['errors']} err", f"{res['throughput_per_s']}/s"]
+            for metric in ("ttft_ms", "first_audio_ms", "e2e_ms"):
+                if metric in res:
+                    d = res[metric]
+                    parts.append(f"{metric[:-3]} {d['p50']}/{d['p95']}/{d['p99']}")
+            print(f"{name:17} " + "  ".join(parts))
+        results["limits"] = core.get_limit_stats()
+        if server is not None:
+            results["server"] = {"requests": server.profile.requests, "injected_errors": server.profile.errors}
+            server.shutdown()
+        core.flush_log()
+
+    print("(ms as p50/p95/p99)")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# benchmarks/startup.py
+"""
+Startup benchmark: import time of src.john.core and time until the GUI
+window has been drawn, each measured in a fresh interpreter.
+
+    python benchmarks/startup.py                 # current tree
+    python benchmarks/startup.py --rev 83e30e7   # any commit, branch or tag, for before/after
+    python benchmarks/startup.py --rev HEAD~1
+    python benchmarks/startup.py --json out.json
+
+Run it from the repo root (config.json / system_prompt.txt are read from
+the working directory, as the app does).
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+IMPORT_SNIPPET = """
+import sys, time
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+import src.john.core
+print(time.perf_counter() - t0)
+"""
+
+WINDOW_SNIPPET = """
+import sys, time
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+import tkinter as tk
+import gui
+root = tk.Tk()
+app = gui.JohnGUI(root)
+root.update()
+print(time.perf_counter() - t0)
+root.destroy()
+"""
+
+def _measure(snippet: str, root: str, repeat: int) -> list[float] | str:
+    times = []
+    for _ in range(repeat):
+        r = subprocess.run([sys.executable, "-c", snippet.format(root=root)],
+                           capture_output=True, text=True)
+        if r.returncode != 0:
+            return r.stderr.strip().splitlines()[-1] if r.stderr.strip() else f"exit {r.returncode}"
+        times.append(float(r.stdout.strip().splitlines()[-1]))
+    return times
+
+def _summary(times) -> dict:
+    if isinstance(times, str):
+        return {"error": times}
+    return {"median_ms": round(statistics.median(times) * 1000, 1),
+            "min_ms": round(min(times) * 1000, 1), "runs": len(times)}
+
+def run(root: str, repeat: int) -> dict:
+    return {
+        "import_core": _summary(_measure(IMPORT_SNIPPET, root, repeat)),
+        "time_to_window": _summary(_measure(WINDOW_SNIPPET, root, repeat)),
+    }
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rev", help="git revision to measure instead of the working tree")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--json", help="write results to this file")
+    args = ap.parse_args(argv)
+
+    root = os.getcwd()
+    tmp = None
+    if args.rev:
+        tmp = tempfile.mkdtemp(prefix="john-startup-")
+        subprocess.run(["git", "worktree", "add", "--detach", tmp, args.rev], check=True, capture_output=True)
+        root = tmp
+    try:
+        results = {"rev": args.rev or "working tree", **run(root, args.repeat)}
+    finally:
+        if tmp:
+            subprocess.run(["git", "worktree", "remove", "--force", tmp], capture_output=True)
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    for name in ("import_core", "time_to_window"):
+        r = results[name]
+        line = r["error"] if "error" in r else f"{r['median_ms']} ms median ({r['min_ms']} min, {r['runs']} runs)"
+        print(f"{name:16} {line}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,23 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 from tkinter.scrolledtext import ScrolledText
-import threading
+import asyncio
 import queue
+import threading
+import time
+import uuid
+from datetime import datetime
 from src.john.core import (
-    ask_llm, say, get_system_prompt, get_model,
-    record_audio, transcribe_audio,
-    reload_config, set_speak, get_speak
+    log_event, flush_log, get_system_prompt, get_model,
+    tts_enabled, get_input_budget, get_request_timeout, get_transcript_lines,
+    summarize_turns, get_summary_min_tokens,
+    reload_config, set_speak, get_speak, prewarm_in_background,
+    begin_trace, log_timing, route_intent, log_routed, recall, reply_model, get_log_dir
 )
+from src.john import metrics
+from src.john.context import ContextWindow, RollingSummarizer
+from src.john.speech import SpeechPipeline
+from src.john.aio import get_engine, ask_llm_stream_async, listen_and_transcribe_async
 
 class ModernButton(tk.Button):
     """Custom styled button with hover effects"""
@@ -52,6 +62,9 @@ class ModernButton(tk.Button):
         self.config(bg=self.original_bg)
 
 class JohnGUI:
+    FRAME_MS = 16        # queued events and text are applied at most once per frame
+    IDLE_POLL_MS = 250   # safety net in case a wakeup event couldn't be posted
+
     def __init__(self, root):
         self.root = root
         self.root.title(f"John AI Assistant - {get_model()}")
@@ -95,15 +108,49 @@ class JohnGUI:
         
         # Initialize state
         self.q = queue.Queue()
+        self._wake_pending = threading.Event()
+        self._drain_scheduled = False
+        self._last_drain = 0.0
+        self._out = []              # (text, tag) waiting for the next render
+        self._render_scheduled = False
+        self._trimmed = False
+        self.max_lines = get_transcript_lines()
         self.busy = False
-        self.messages = [{"role": "system", "content": get_system_prompt()}]
+        self.context = ContextWindow(get_system_prompt(), get_input_budget())
+        self.summarizer = RollingSummarizer(self.context, summarize_turns, get_summary_min_tokens())
+        self._start_session()
         self.recording = False
+        self.streaming = False
+        self._turn = None      # engine future of the running voice/LLM turn
+        self._speech = None    # SpeechPipeline of the last reply
+        self._turn_id = 0      # bumped on barge-in; stale results are ignored
         
-        # Start polling
-        self.root.after(100, self._poll_queue)
+        # Workers wake the UI with a virtual event; a slow poll backs it up
+        self.root.bind("<<JohnWake>>", lambda e: self._schedule_drain())
+        self.root.after(self.IDLE_POLL_MS, self._poll_queue)
+        
+        # Load SDKs, clients and the audio stack once the window is drawn
+        self.root.after_idle(prewarm_in_background)
         
         # Bind keyboard shortcuts
         self._bind_shortcuts()
+        
+        # Log the end of the session and flush the log on close
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+
+    def _start_session(self):
+        """Begin a new logged session"""
+        self.session = uuid.uuid4().hex
+        log_event({"session": self.session, "role": "system", "content": get_system_prompt(), "model": get_model()})
+
+    def _on_close(self):
+        """Handle window close"""
+        log_event({"session": self.session, "role": "meta", "event": "end"})
+        if self._speech is not None:
+            self._speech.cancel()
+        get_engine().stop()
+        flush_log()
+        self.root.destroy()
 
     def _create_header(self):
         """Create the header section with title and controls"""
@@ -339,12 +386,19 @@ class JohnGUI:
         tk.Label(settings_window, text=settings_text, font=("Segoe UI", 10),
                 bg=self.colors['bg'], fg=self.colors['text']).pack(pady=20)
 
-    def _reload_config(self, window):
-        """Reload configuration"""
+    def _reload_config(self, window=None):
+        """Reload configuration (from the settings window, or a typed "reload")"""
         try:
             config = reload_config()
-            messagebox.showinfo("Success", f"Config reloaded!\nModel: {config['model']}\nSpeech: {'ON' if config['speak'] else 'OFF'}")
-            window.destroy()
+            if window is not None:
+                messagebox.showinfo("Success", f"Config reloaded!\nModel: {config['model']}\nSpeech: {'ON' if config['speak'] else 'OFF'}")
+                window.destroy()
+            else:
+                self._append_chat("System", f"Config reloaded - model: {config['model']}, "
+                                            f"speech: {'ON' if config['speak'] else 'OFF'}", tag="system")
+            self.context.budget = get_input_budget()
+            self.max_lines = get_transcript_lines()
+            self.summarizer.min_tokens = get_summary_min_tokens()
             # Update UI elements
             self.root.title(f"John AI Assistant - {get_model()}")
             self.speech_btn.config(
@@ -357,11 +411,21 @@ class JohnGUI:
     def _clear_chat(self):
         """Clear the chat area"""
         if messagebox.askyesno("Clear Chat", "Are you sure you want to clear the chat history?"):
-            self.chat_area.config(state='normal')
-            self.chat_area.delete(1.0, tk.END)
-            self.chat_area.config(state='disabled')
-            self.messages = [{"role": "system", "content": get_system_prompt()}]
-            self._append_chat("System", "Chat history cleared", tag="system")
+            self._reset_chat()
+
+    def _reset_chat(self):
+        """Drop the transcript and context and start a new session"""
+        self._barge_in()
+        self._out.clear()
+        self.chat_area.config(state='normal')
+        self.chat_area.delete(1.0, tk.END)
+        self.chat_area.config(state='disabled')
+        self._trimmed = False
+        self.context.reset(get_system_prompt())
+        self.summarizer.reset()
+        log_event({"session": self.session, "role": "meta", "event": "end"})
+        self._start_session()
+        self._append_chat("System", "Chat history cleared", tag="system")
 
     def _toggle_speech(self):
         """Toggle speech on/off"""
@@ -373,34 +437,47 @@ class JohnGUI:
         )
 
     def send_voice(self):
-        """Handle voice input"""
-        if self.busy or self.recording:
+        """Handle voice input (while recording, the button stops it)"""
+        if self.recording:
+            self._barge_in()
+            self._append_chat("System", "Voice input cancelled", tag="meta")
             return
+        # talking over John cuts him off
+        self._barge_in()
         
         self.recording = True
-        self._append_chat("System", "🎤 Recording for 5 seconds...", tag="meta")
-        self._set_busy(True, "Recording...")
+        self._append_chat("System", "🎤 Listening... (stops when you pause)", tag="meta")
+        self._set_busy(True, "Listening...")
         self.talk_btn.config(text="⏹️ Stop", bg=self.colors['danger'])
         
-        threading.Thread(target=self._worker_voice, daemon=True).start()
+        self._turn = get_engine().submit(self._voice_task(self._turn_id), timeout=get_request_timeout())
 
-    def _worker_voice(self):
-        """Background worker for voice processing"""
+    async def _voice_task(self, turn):
+        """Voice capture + transcription on the engine loop"""
+        trace = begin_trace()
         try:
-            wav = record_audio(duration=5)
-            text = transcribe_audio(wav)
-            self.q.put(("voice_ok", text))
+            # segments are transcribed while you're still talking
+            text = await listen_and_transcribe_async()
+            if text is None:
+                self._post(("err", "No speech detected", turn))
+                return
+            self._post(("voice_ok", (text, trace), turn))
+        except asyncio.CancelledError:
+            self._post(("err", "Voice input cancelled or timed out", turn))
+            raise
         except Exception as e:
-            self.q.put(("err", str(e)))
+            self._post(("err", str(e), turn))
 
     def send_message(self, event=None):
         """Handle text message sending"""
-        if self.busy:
+        if self.recording:
             return
 
         user_text = self.entry.get().strip()
         if not user_text or user_text == self.placeholder_text:
             return
+        # a new message while John is answering replaces that answer
+        self._barge_in()
         
         self.entry.delete(0, tk.END)
         self._show_placeholder()
@@ -409,96 +486,262 @@ class JohnGUI:
 
         # Show user message
         self._append_chat("You", user_text, tag="you")
-        self.messages.append({"role": "user", "content": user_text})
-        
-        # Trim message history
-        if len(self.messages) > 16:
-            self.messages = [self.messages[0]] + self.messages[-14:]
+        trace = begin_trace()
+        if self._route(user_text, trace):
+            return
+        # notes from earlier sessions, then the message; trimmed to the token budget
+        self.context.set_memory(recall(user_text, self.session))
+        self.summarizer.add(self.context.add("user", user_text))
+        log_event({"session": self.session, "role": "user", "content": user_text})
 
         # Process in background
-        snapshot = list(self.messages)
         self._set_busy(True, "Thinking...")
-        threading.Thread(target=self._worker_llm, args=(snapshot,), daemon=True).start()
+        self._start_reply(trace)
 
-    def _worker_llm(self, messages_snapshot):
-        """Background worker for LLM processing"""
+    def _route(self, user_text, trace=None) -> bool:
+        """Handle commands and trivial questions locally; True if no LLM call is needed"""
+        trace = metrics.use(trace) if trace is not None else begin_trace()
+        hit = route_intent(user_text)
+        if hit is None:
+            return False
+        log_routed(self.session, user_text, hit, trace)
+        if hit.action == "exit":
+            self._on_close()
+            return True
+        if hit.action == "clear":
+            self._reset_chat()
+        elif hit.action in ("speech_on", "speech_off", "toggle_speech"):
+            if hit.action == "toggle_speech" or (hit.action == "speech_on") != get_speak():
+                self._toggle_speech()
+            self._append_chat("System", f"Speech {'ON' if get_speak() else 'OFF'}", tag="system")
+        elif hit.action == "reload":
+            self._reload_config()
+        else:
+            self._append_chat("John", hit.reply, tag="john")
+            self.summarizer.add(self.context.add("user", user_text))
+            self.summarizer.add(self.context.add("assistant", hit.reply))
+            log_event({"session": self.session, "role": "user", "content": user_text})
+            log_event({"session": self.session, "role": "assistant", "content": hit.reply, "model": "local"})
+            if tts_enabled():
+                turn = self._turn_id
+                self._speech = SpeechPipeline(on_barge_in=lambda: self._post(("barge_in", None, turn)))
+                self._speech.feed(hit.reply)
+                self._speech.close()
+        self._set_busy(False)
+        return True
+
+    def _start_reply(self, trace=None):
+        """Stream a reply to the current context on the engine loop"""
+        # a voice turn keeps timing on the trace its recording started
+        trace = metrics.use(trace) if trace is not None else begin_trace()
+        session, turn = self.session, self._turn_id
+        # speak sentence by sentence while the reply is still streaming
+        self._speech = SpeechPipeline(
+            on_done=lambda: log_timing(session, trace, "speech"),
+            on_barge_in=lambda: self._post(("barge_in", None, turn)),
+        ) if tts_enabled() else None
+        self._turn = get_engine().submit(self._llm_task(self.context.messages(), trace, self._speech, turn),
+                                         timeout=get_request_timeout())
+
+    async def _llm_task(self, messages_snapshot, trace, speech, turn):
+        """Streamed LLM call on the engine loop; results go back through the queue"""
+        metrics.use(trace)
         try:
-            reply = ask_llm(messages_snapshot)
-            self.q.put(("ok", reply))
+            parts = []
+            async for delta in ask_llm_stream_async(messages_snapshot):
+                parts.append(delta)
+                self._post(("delta", delta, turn))
+                if speech:
+                    speech.feed(delta)
+            self._post(("ok", ("".join(parts), trace), turn))
+        except asyncio.CancelledError:
+            # cancelling closes the stream; nothing queued gets spoken either
+            if speech:
+                speech.cancel()
+            self._post(("err", "Request cancelled or timed out", turn))
+            raise
         except Exception as e:
-            self.q.put(("err", str(e)))
+            self._post(("err", str(e), turn))
+        finally:
+            if speech:
+                speech.close()
+
+    def _barge_in(self):
+        """Cut John off: cancel the running turn and stop talking"""
+        cut = False
+        self._turn_id += 1  # results still queued for the old turn are dropped
+        turn, self._turn = self._turn, None
+        if turn is not None and not turn.done():
+            turn.cancel()
+            cut = not self.recording
+        speech, self._speech = self._speech, None
+        if speech is not None and speech.active:
+            speech.cancel()
+            cut = True
+        if self.streaming:
+            self._write(" …", "john")
+            self._end_stream()
+        if cut:
+            log_event({"session": self.session, "role": "meta", "event": "barge_in"})
+        self.recording = False
+        self.talk_btn.config(text="🎤 Voice", bg=self.colors['success'])
+        self._set_busy(False)
+
+    def _post(self, item):
+        """Queue a (kind, payload, turn) result from any thread and wake the UI once"""
+        self.q.put(item)
+        if not self._wake_pending.is_set():
+            self._wake_pending.set()
+            try:
+                self.root.event_generate("<<JohnWake>>", when="tail")
+            except (RuntimeError, tk.TclError):
+                pass  # Tcl without thread support, or closing: the idle poll picks it up
 
     def _poll_queue(self):
-        """Poll the message queue for results"""
-        try:
-            kind, payload = self.q.get_nowait()
-        except queue.Empty:
-            self.root.after(100, self._poll_queue)
+        """Backup poll; normally workers wake the UI themselves"""
+        if not self.q.empty():
+            self._schedule_drain()
+        self.root.after(self.IDLE_POLL_MS, self._poll_queue)
+
+    def _schedule_drain(self):
+        """Drain on the next frame boundary (one pass per frame at most)"""
+        if self._drain_scheduled:
             return
+        self._drain_scheduled = True
+        wait = self.FRAME_MS - (time.monotonic() - self._last_drain) * 1000
+        self.root.after(max(0, int(wait)), self._drain_queue)
 
+    def _drain_queue(self):
+        """Handle every queued event in one pass"""
+        self._drain_scheduled = False
+        self._last_drain = time.monotonic()
+        self._wake_pending.clear()  # events posted from here on send a new wakeup
+        while True:
+            try:
+                kind, payload, turn = self.q.get_nowait()
+            except queue.Empty:
+                break
+            if turn == self._turn_id:
+                self._handle_event(kind, payload)
+
+    def _handle_event(self, kind, payload):
+        """Apply one worker result to the UI"""
+        if kind == "delta":
+            self._append_stream("John", payload, tag="john")
+            return
+        if kind == "barge_in":
+            # the user started talking over John: listen to them
+            self.send_voice()
+            return
+
+        self._turn = None
         if kind == "ok":
-            reply = payload
-            self.messages.append({"role": "assistant", "content": reply})
-            self._append_chat("John", reply, tag="john")
-            
-            # Speak the reply if enabled
-            if get_speak():
-                threading.Thread(target=say, args=(reply,), daemon=True).start()
+            reply, trace = payload
+            self.summarizer.add(self.context.add("assistant", reply))
+            fields = metrics.fields(trace)
+            log_event({"session": self.session, "role": "assistant", "content": reply,
+                       "model": reply_model(fields), **fields})
+            if self.streaming:
+                self._end_stream()
+            else:
+                self._append_chat("John", reply, tag="john")
+            # reply is on screen; fold evicted turns into the summary in the background
+            self.summarizer.kick()
                 
         elif kind == "voice_ok":
-            user_text = payload
+            user_text, trace = payload
             self._append_chat("You", user_text, tag="you")
-            self.messages.append({"role": "user", "content": user_text})
-            
-            if len(self.messages) > 16:
-                self.messages = [self.messages[0]] + self.messages[-14:]
+            self.recording = False
+            self.talk_btn.config(text="🎤 Voice", bg=self.colors['success'])
+            if self._route(user_text, trace):
+                return
+            self.context.set_memory(recall(user_text, self.session))
+            self.summarizer.add(self.context.add("user", user_text))
+            log_event({"session": self.session, "role": "user", "content": user_text, **metrics.fields(trace)})
 
             # Process voice input
-            snapshot = list(self.messages)
             self._set_busy(True, "Thinking...")
-            threading.Thread(target=self._worker_llm, args=(snapshot,), daemon=True).start()
+            self._start_reply(trace)
+            return
             
         elif kind == "err":
+            if self.streaming:
+                self._end_stream()
             self._append_chat("System", f"Error: {payload}", tag="error")
 
         # Reset UI state
-        self._set_busy(False)
         self.recording = False
+        self._set_busy(False)
         self.talk_btn.config(text="🎤 Voice", bg=self.colors['success'])
-        
-        self.root.after(100, self._poll_queue)
 
     def _set_busy(self, busy: bool, text: str = ""):
-        """Set the busy state of the UI"""
+        """Set the busy state of the UI; typing stays open so the user can cut in"""
         self.busy = busy
-        state = tk.DISABLED if busy else tk.NORMAL
+        state = tk.DISABLED if self.recording else tk.NORMAL
         
         self.entry.config(state=state)
         self.send_btn.config(state=state)
-        self.talk_btn.config(state=state)
         
         if not busy:
-            self.entry.config(state=tk.NORMAL)
             self._show_placeholder()
         
         self.status_lbl.config(text=text if text else "Ready")
 
     def _append_chat(self, speaker, text, tag=None):
         """Append a message to the chat area"""
-        self.chat_area.config(state='normal')
-        
-        # Add timestamp
-        from datetime import datetime
         timestamp = datetime.now().strftime("%H:%M")
-        
-        if tag:
-            self.chat_area.insert(tk.END, f"[{timestamp}] {speaker}: {text}\n", tag)
+        self._write(f"[{timestamp}] {speaker}: {text}\n", tag)
+
+    def _append_stream(self, speaker, text, tag=None):
+        """Append a streamed chunk to the open line, opening it if needed"""
+        if not self.streaming:
+            timestamp = datetime.now().strftime("%H:%M")
+            self._write(f"[{timestamp}] {speaker}: ", tag)
+            self.streaming = True
+        self._write(text, tag)
+
+    def _end_stream(self):
+        """Close the open streamed line"""
+        self._write("\n")
+        self.streaming = False
+
+    def _write(self, text, tag=None):
+        """Buffer text for the chat area; it is inserted on the next frame"""
+        if self._out and self._out[-1][1] == tag:
+            self._out[-1] = (self._out[-1][0] + text, tag)
         else:
-            self.chat_area.insert(tk.END, f"[{timestamp}] {speaker}: {text}\n")
-        
+            self._out.append((text, tag))
+        if not self._render_scheduled:
+            self._render_scheduled = True
+            self.root.after(self.FRAME_MS, self._render)
+
+    def _render(self):
+        """Insert all buffered text in one widget update and keep the transcript bounded"""
+        self._render_scheduled = False
+        if not self._out:
+            return
+        out, self._out = self._out, []
+        self.chat_area.config(state='normal')
+        for text, tag in out:
+            self.chat_area.insert(tk.END, text, tag or ())
+        self._trim_transcript()
         self.chat_area.config(state='disabled')
         self.chat_area.see(tk.END)
 
+    def _trim_transcript(self):
+        """Drop the oldest lines once the transcript is 10% over max_lines"""
+        if self.max_lines <= 0:
+            return
+        lines = int(self.chat_area.index("end-1c").split(".")[0])
+        if lines <= self.max_lines * 1.1:
+            return
+        # trimming in steps keeps it to one delete every few hundred lines
+        first = 2 if self._trimmed else 1  # keep the notice on line 1
+        self.chat_area.delete(f"{first}.0", f"{lines - self.max_lines + first}.0")
+        if not self._trimmed:
+            self.chat_area.insert("1.0", f"[Earlier messages: python -m src.john.history --dir {get_log_dir()} show {self.session}]\n", "meta")
+            self._trimmed = True
+
 if __name__ == "__main__":
     root = tk.Tk()
     app = JohnGUI(root)
@@ -0,0 +1,263 @@
+# src/john/aio.py
+"""
+Async engine: one event loop on one background thread running the
+AsyncOpenAI / AsyncElevenLabs clients. Front-ends hand it coroutines with
+submit() and get a concurrent.futures.Future back, so a Tkinter (or any
+sync) caller never blocks and no thread is started per request.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+
+from . import core, metrics
+from .cache import make_key, normalize_text
+
+class Engine:
+    """An asyncio loop on a daemon thread, with timeouts and cancellation."""
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._tasks = set()
+        self._thread = threading.Thread(target=self._run, name="john-engine", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro, timeout: float | None = None) -> Future:
+        """
+        Schedule `coro` on the engine loop. Cancelling the returned future
+        cancels the task; `timeout` cancels it with TimeoutError.
+        """
+        async def guarded():
+            task = asyncio.current_task()
+            self._tasks.add(task)
+            try:
+                if timeout is None:
+                    return await coro
+                async with asyncio.timeout(timeout):
+                    return await coro
+            finally:
+                self._tasks.discard(task)
+        return asyncio.run_coroutine_threadsafe(guarded(), self.loop)
+
+    def run(self, coro, timeout: float | None = None):
+        """Blocking helper for sync callers."""
+        return self.submit(coro, timeout).result()
+
+    def cancel_all(self):
+        """Cancel every task still running on the engine."""
+        def cancel():
+            for task in list(self._tasks):
+                task.cancel()
+        self.loop.call_soon_threadsafe(cancel)
+
+    def stop(self):
+        self.cancel_all()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=2)
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine() -> Engine:
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = Engine()
+        return _engine
+
+# --- async clients (bound to the engine loop, rebuilt when their settings change) ---
+_aclients = {}  # provider -> (signature, client, httpx.AsyncClient)
+
+def _make_async_http(provider: str):
+    import httpx
+    opts = core._http_options(provider)
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=int(opts["max_connections"]),
+            max_keepalive_connections=int(opts["max_keepalive"]),
+            keepalive_expiry=float(opts["keepalive_s"]),
+        ),
+        timeout=core._timeout(provider),
+    )
+
+def _retire_async_http(cached):
+    """Close a replaced pool on the engine loop, after calls still using it had time to finish."""
+    if cached is None:
+        return
+    http = cached[2]
+    loop = asyncio.get_running_loop()
+    loop.call_later(float(core._HTTP_DEFAULTS["read_timeout"]), lambda: loop.create_task(http.aclose()))
+
+def get_async_client():
+    """The engine's AsyncOpenAI client."""
+    sig = core._client_signature("OPENAI")
+    cached = _aclients.get("OPENAI")
+    if cached is None or cached[0] != sig:
+        from openai import AsyncOpenAI
+        http = _make_async_http("OPENAI")
+        client = AsyncOpenAI(
+            api_key=core.settings.get("OPENAI_API_KEY"),
+            base_url=core._base_url("OPENAI"),
+            http_client=http,
+            timeout=core._timeout("OPENAI"),
+            max_retries=0,
+        )
+        _retire_async_http(cached)
+        _aclients["OPENAI"] = cached = (sig, client, http)
+    return cached[1]
+
+def get_async_eleven():
+    """The engine's AsyncElevenLabs client."""
+    sig = core._client_signature("ELEVEN")
+    cached = _aclients.get("ELEVEN")
+    if cached is None or cached[0] != sig:
+        from elevenlabs import AsyncElevenLabs
+        http = _make_async_http("ELEVEN")
+        client = AsyncElevenLabs(
+            api_key=core.settings.get("ELEVEN_API_KEY"),
+            base_url=core._base_url("ELEVEN"),
+            httpx_client=http,
+            timeout=float(core._http_options("ELEVEN")["read_timeout"]),
+        )
+        _retire_async_http(cached)
+        _aclients["ELEVEN"] = cached = (sig, client, http)
+    return cached[1]
+
+# --- async core API ---
+async def ask_llm_async(messages: list[dict], decision=None) -> str:
+    """Async ask_llm (same cache and model routing)."""
+    parts = [delta async for delta in ask_llm_stream_async(messages, decision)]
+    return "".join(parts)
+
+async def ask_llm_stream_async(messages: list[dict], decision=None):
+    """Async generator of reply deltas. Cancelling the consumer closes the stream."""
+    # cache setup and lookups touch the disk: keep them off the loop
+    await asyncio.to_thread(core._ensure_caches)
+    cache = core.llm_cache
+    decision = decision or core.plan_llm(messages)
+    key = core._llm_cache_key(messages, decision) if cache is not None else None
+    if key is not None:
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            yield cached
+            return
+    loop = asyncio.get_running_loop()
+    t0 = loop.time()
+    stream = await core.get_gate("OPENAI").acall(lambda: get_async_client().chat.completions.create(
+        messages=messages,
+        **decision.params(),
+        stream=True,
+        stream_options={"include_usage": True},
+    ), hedge=True, discard=lambda s: s.close(), stage="llm", track="llm_open")
+    parts = []
+    try:
+        async for chunk in stream:
+            if chunk.usage is not None:
+                metrics.add_usage(decision.model, chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if not parts:
+                    metrics.record("llm_ttft", loop.time() - t0)
+                parts.append(delta)
+                yield delta
+    finally:
+        await stream.close()
+    metrics.record("llm", loop.time() - t0)
+    if key is not None and parts:
+        await asyncio.to_thread(cache.put, key, "".join(parts), loop.time() - t0)
+
+async def transcribe_audio_async(audio) -> str:
+    """Async transcribe_audio for a file path or in-memory WAV."""
+    if isinstance(audio, (str, bytes)) or hasattr(audio, "__fspath__"):
+        with open(audio, "rb") as f:
+            data, name = f.read(), str(audio)
+    else:
+        data, name = audio.getvalue(), getattr(audio, "name", "speech.wav")
+    name, data = await asyncio.to_thread(core.prepare_upload, name, data)
+    with metrics.span("stt"):
+        tr = await core.get_gate("OPENAI").acall(lambda: get_async_client().audio.transcriptions.create(
+            model="gpt-4o-mini-transcribe",
+            file=(name, data),
+        ), hedge=True, stage="stt")
+    return tr.text.strip()
+
+async def listen_and_transcribe_async() -> str | None:
+    """
+    Async listen_and_transcribe: the mic loop runs in a worker thread, and
+    each closed segment is transcribed on the engine loop (at most
+    STT_WORKERS at once) while recording continues.
+    """
+    loop = asyncio.get_running_loop()
+    limit = asyncio.Semaphore(int(core.settings.get("STT_WORKERS", 2)))
+    futures = []
+
+    async def one(wav):
+        async with limit:
+            return await transcribe_audio_async(wav)
+
+    def on_segment(wav):
+        futures.append(asyncio.run_coroutine_threadsafe(one(wav), loop))
+
+    recorder = core._make_recorder()
+    try:
+        with metrics.span("record"):
+            await asyncio.to_thread(
+                recorder.record_segments, on_segment,
+                gap_s=float(core.settings.get("STT_SEGMENT_GAP_S", 0.35)),
+                min_segment_s=float(core.settings.get("STT_MIN_SEGMENT_S", 2.0)),
+            )
+        texts = [await asyncio.wrap_future(f) for f in futures]
+    except asyncio.CancelledError:
+        recorder.stop()
+        for f in futures:
+            f.cancel()
+        raise
+    if not futures:
+        return None
+    return " ".join(t for t in texts if t)
+
+async def synthesize_async(text: str) -> bytes:
+    """Async synthesize (same on-disk cache)."""
+    await asyncio.to_thread(core._ensure_caches)
+    cache = core.tts_cache
+    text = normalize_text(text)
+    s = core.settings
+    key = make_key(text, s.voice_id, s.tts_model, s.tts_format)
+    if cache is not None:
+        audio = await asyncio.to_thread(cache.get, key)
+        if audio is not None:
+            return audio
+
+    async def convert():
+        parts = []
+        async for chunk in get_async_eleven().text_to_speech.convert(
+            voice_id=s.voice_id,
+            model_id=s.tts_model,
+            output_format=s.tts_format,
+            text=text
+        ):
+            parts.append(chunk)
+        return b"".join(parts)
+
+    with metrics.span("tts_synth"):
+        audio = await core.get_gate("ELEVEN").acall(convert, hedge=True, stage="tts")
+    if cache is not None:
+        await asyncio.to_thread(cache.put, key, audio)
+    return audio
+
+async def say_async(text: str):
+    """Async say: synthesis on the loop, blocking playback in a worker thread."""
+    if not core.tts_enabled():
+        return
+    try:
+        audio = await synthesize_async(text)
+        await asyncio.to_thread(core.play_audio, audio)
+    except asyncio.CancelledError:
+        core.stop_playback()  # the worker thread can't be cancelled, the player can
+        raise
+    except Exception as e:
+        print(f"[TTS error] {e}")
@@ -0,0 +1,298 @@
+# src/john/audio.py
+import io
+import time
+import queue
+import threading
+
+import numpy as np
+import sounddevice as sd
+from scipy.io.wavfile import write
+
+class RingBuffer:
+    """Fixed-size int16 ring buffer; keeps the most recent `size` samples."""
+    def __init__(self, size: int):
+        self.buf = np.zeros(size, dtype=np.int16)
+        self.size = size
+        self.pos = 0
+        self.full = False
+
+    def write(self, samples: np.ndarray):
+        n = len(samples)
+        if n >= self.size:
+            self.buf[:] = samples[-self.size:]
+            self.pos, self.full = 0, True
+            return
+        end = self.pos + n
+        if end <= self.size:
+            self.buf[self.pos:end] = samples
+        else:
+            split = self.size - self.pos
+            self.buf[self.pos:] = samples[:split]
+            self.buf[:n - split] = samples[split:]
+        self.full = self.full or end >= self.size
+        self.pos = end % self.size
+
+    def read(self) -> np.ndarray:
+        """Contents in chronological order."""
+        if not self.full:
+            return self.buf[:self.pos].copy()
+        return np.concatenate((self.buf[self.pos:], self.buf[:self.pos]))
+
+    def clear(self):
+        self.pos, self.full = 0, False
+
+def frame_features(frame: np.ndarray) -> tuple[float, float]:
+    """RMS energy and zero-crossing rate of one int16 frame."""
+    x = frame.astype(np.float32)
+    rms = float(np.sqrt(np.mean(x * x))) if len(x) else 0.0
+    zcr = float(np.mean(np.signbit(x[1:]) != np.signbit(x[:-1]))) if len(x) > 1 else 0.0
+    return rms, zcr
+
+def to_wav(samples: np.ndarray, samplerate: int) -> io.BytesIO:
+    """Encode int16 samples as an in-memory WAV file."""
+    buf = io.BytesIO()
+    write(buf, samplerate, samples)
+    buf.seek(0)
+    buf.name = "speech.wav"  # lets the upload infer the format
+    return buf
+
+class VADRecorder:
+    """
+    Capture one utterance from the mic using energy / zero-crossing VAD.
+    Recording starts when speech is detected (keeping `pre_roll_s` of audio
+    from before the onset) and stops after `silence_s` of trailing silence,
+    after `max_s` seconds, or when stop() is called.
+    """
+    def __init__(self, samplerate: int = 16000, frame_ms: int = 30,
+                 pre_roll_s: float = 0.3, silence_s: float = 0.8,
+                 max_s: float = 15.0, start_timeout_s: float = 8.0,
+                 min_rms: float = 300.0):
+        self.samplerate = samplerate
+        self.frame_len = int(samplerate * frame_ms / 1000)
+        self.pre_roll = RingBuffer(max(1, int(pre_roll_s * samplerate)))
+        self.silence_frames = max(1, int(silence_s * 1000 / frame_ms))
+        self.max_frames = int(max_s * 1000 / frame_ms)
+        self.start_timeout_frames = int(start_timeout_s * 1000 / frame_ms)
+        self.min_rms = min_rms
+        self.onset_frames = 3  # consecutive voiced frames needed to start
+        self.noise = min_rms / 3  # running noise floor estimate
+        self._stop = threading.Event()
+
+    def stop(self):
+        """End the recording early (e.g. from a Stop button)."""
+        self._stop.set()
+
+    def is_speech(self, frame: np.ndarray) -> bool:
+        rms, zcr = frame_features(frame)
+        threshold = max(self.min_rms, self.noise * 3)
+        # voiced speech is loud; quieter frames with many zero crossings are fricatives
+        voiced = rms > threshold or (rms > threshold / 2 and zcr > 0.25)
+        if not voiced:
+            self.noise = 0.95 * self.noise + 0.05 * rms
+        return voiced
+
+    def _frames(self):
+        """Yield fixed-size int16 frames from an InputStream until stopped."""
+        q = queue.Queue()
+
+        def callback(indata, frames, time_info, status):
+            q.put(indata[:, 0].copy())
+
+        with sd.InputStream(samplerate=self.samplerate, channels=1, dtype="int16",
+                            blocksize=self.frame_len, callback=callback):
+            while not self._stop.is_set():
+                try:
+                    yield q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+
+    def wait_for_speech(self) -> bool:
+        """Block until someone starts talking (True) or stop() is called (False)."""
+        voiced_run = 0
+        frames = self._frames()
+        try:
+            for frame in frames:
+                voiced_run = voiced_run + 1 if self.is_speech(frame) else 0
+                if voiced_run >= self.onset_frames:
+                    return True
+        finally:
+            frames.close()
+        return False
+
+    def record(self) -> io.BytesIO | None:
+        """Block until one utterance is captured; None if nobody spoke."""
+        chunks = []
+        if not self._capture(lambda frame, speech: chunks.append(frame), lambda: None):
+            return None
+        return to_wav(np.concatenate(chunks), self.samplerate)
+
+    def record_segments(self, on_segment, gap_s: float = 0.35, min_segment_s: float = 2.0) -> int:
+        """
+        Capture one utterance, cutting it at short pauses (>= `gap_s` once the
+        current piece is at least `min_segment_s` long). `on_segment(wav)` is
+        called with each closed piece while recording continues, so the
+        caller can start transcribing early. Returns the number of segments.
+        """
+        gap_frames = max(1, int(gap_s * self.samplerate / self.frame_len))
+        min_samples = int(min_segment_s * self.samplerate)
+        chunks = []
+        state = {"samples": 0, "silent": 0, "voiced": False, "count": 0}
+
+        def emit():
+            if chunks and state["voiced"]:
+                on_segment(to_wav(np.concatenate(chunks), self.samplerate))
+                state["count"] += 1
+            chunks.clear()
+            state.update(samples=0, silent=0, voiced=False)
+
+        def on_frame(frame, speech):
+            chunks.append(frame)
+            state["samples"] += len(frame)
+            state["voiced"] = state["voiced"] or speech
+            state["silent"] = 0 if speech else state["silent"] + 1
+            if state["silent"] >= gap_frames and state["samples"] >= min_samples:
+                emit()
+
+        self._capture(on_frame, emit)
+        return state["count"]
+
+    def _capture(self, on_frame, on_end) -> bool:
+        """
+        Run the VAD loop, passing the pre-roll and every frame after the onset
+        to `on_frame(frame, is_speech)`, then call `on_end`.
+        Returns False if no speech was detected.
+        """
+        self._stop.clear()
+        self.pre_roll.clear()
+        started = False
+        voiced_run = silent_run = n = 0
+        frames = self._frames()
+        try:
+            for frame in frames:
+                n += 1
+                speech = self.is_speech(frame)
+                if not started:
+                    self.pre_roll.write(frame)
+                    voiced_run = voiced_run + 1 if speech else 0
+                    if voiced_run >= self.onset_frames:
+                        started = True
+                        on_frame(self.pre_roll.read(), True)
+                        n = 0
+                    elif n >= self.start_timeout_frames:
+                        break
+                    continue
+                on_frame(frame, speech)
+                silent_run = 0 if speech else silent_run + 1
+                if silent_run >= self.silence_frames or n >= self.max_frames:
+                    break
+        finally:
+            frames.close()  # closes the InputStream
+        if started:
+            on_end()
+        return started
+
+class PCMPlayer:
+    """
+    One long-lived output stream fed from a ring buffer of 16-bit mono PCM.
+    write() queues samples as they arrive (blocking while the buffer is
+    full); the sound card callback pulls from it and plays silence when it
+    runs dry, so consecutive utterances follow each other without gaps and
+    without a player process per clip. stop() discards everything queued.
+    """
+    def __init__(self, samplerate: int = 24000, buffer_s: float = 30.0):
+        self.samplerate = samplerate
+        self.buf = np.zeros(int(buffer_s * samplerate), dtype=np.int16)
+        self.size = len(self.buf)
+        self._written = 0  # samples ever written / handed to the device
+        self._played = 0
+        self._generation = 0  # bumped by stop() to wake and fail waiters
+        self._carry = b""  # odd trailing byte of a chunk
+        self._cond = threading.Condition()
+        self._stream = None
+
+    def open(self):
+        """Start the output stream (done by the first write() otherwise)."""
+        with self._cond:
+            if self._stream is None:
+                self._stream = sd.OutputStream(samplerate=self.samplerate, channels=1, dtype="int16",
+                                               latency="low", callback=self._callback)
+                self._stream.start()
+
+    def close(self):
+        self.stop()
+        with self._cond:
+            stream, self._stream = self._stream, None
+        if stream is not None:
+            stream.stop()
+            stream.close()
+
+    @property
+    def playing(self) -> bool:
+        return self._written > self._played
+
+    @property
+    def position(self) -> int:
+        """Samples written so far: pass it to played() later to know when they are out."""
+        return self._written
+
+    def played(self, position: int) -> bool:
+        """True once playback has passed `position` (or stop() dropped what was before it)."""
+        return self._played >= position
+
+    def write(self, data: bytes) -> bool:
+        """Queue PCM bytes for playback; False if stop() was called meanwhile."""
+        self.open()
+        with self._cond:
+            data, self._carry = self._carry + data, b""
+            if len(data) % 2:
+                data, self._carry = data[:-1], data[-1:]
+            samples = np.frombuffer(data, dtype="<i2")
+            generation, pos = self._generation, 0
+            while pos < len(samples):
+                if generation != self._generation:
+                    return False
+                room = self.size - (self._written - self._played)
+                if room == 0:
+                    self._cond.wait(0.1)
+                    continue
+                n = min(room, len(samples) - pos)
+                start = self._written % self.size
+                first = min(n, self.size - start)
+                self.buf[start:start + first] = samples[pos:pos + first]
+                self.buf[:n - first] = samples[pos + first:pos + n]
+                self._written += n
+                pos += n
+            return True
+
+    def drain(self) -> bool:
+        """Block until everything written so far has played; False if stopped."""
+        with self._cond:
+            target, generation = self._written, self._generation
+            while self._played < target and generation == self._generation:
+                self._cond.wait(0.1)
+            if generation != self._generation:
+                return False
+            latency = self._stream.latency if self._stream is not None else 0
+        time.sleep(latency)  # the last block is still in the device buffer
+        return True
+
+    def stop(self):
+        """Drop all queued audio at once (barge-in)."""
+        with self._cond:
+            self._played = self._written
+            self._carry = b""
+            self._generation += 1
+            self._cond.notify_all()
+
+    def _callback(self, outdata, frames, time_info, status):
+        with self._cond:
+            n = min(frames, self._written - self._played)
+            start = self._played % self.size
+            first = min(n, self.size - start)
+            outdata[:first, 0] = self.buf[start:start + first]
+            outdata[first:n, 0] = self.buf[:n - first]
+            outdata[n:] = 0
+            self._played += n
+            if n:
+                self._cond.notify_all()
+
@@ -0,0 +1,236 @@
+# src/john/batch.py
+"""
+Batch / offline mode: run a JSONL file of prompts through John.
+
+    python -m src.john.batch prompts.jsonl -o results.jsonl --workers 8 [--tts out/audio]
+
+Each input line is one item: a single prompt, a multi-turn conversation
+(played turn by turn, each reply fed back like in the chat loop) or a
+ready-made message list to answer:
+
+    {"id": "greet-1", "prompt": "Who are you?"}
+    {"id": "persona-3", "turns": ["Hi, I'm Sam.", "What's my name?"]}
+    {"id": "raw-1", "messages": [{"role": "user", "content": "..."}]}
+
+"text", "body" or "content" are accepted for "prompt", and "request_id"
+for "id" (lines without an id get their line number). The system prompt
+is system_prompt.txt unless the item has a "system" key.
+
+Items run on a bounded pool of workers (the provider gates still apply)
+and each result is appended to the output as soon as it is done, with its
+timing and token usage, so `python -m src.john.metrics --file results.jsonl`
+reports latency and cost for the run. Re-running with the same output
+skips ids that already completed; failed items are tried again.
+"""
+import os
+import sys
+import json
+import time
+import wave
+import argparse
+import threading
+from datetime import datetime, UTC
+from concurrent.futures import ThreadPoolExecutor
+
+from . import core, metrics
+from .context import ContextWindow
+
+_TEXT_KEYS = ("prompt", "text", "body", "content")
+
+def read_items(path: str):
+    """Yield (id, item) for every JSON line of the input file."""
+    with open(path, "r", encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                print(f"[batch] line {n}: not JSON, skipped", file=sys.stderr)
+                continue
+            if isinstance(item, str):
+                item = {"prompt": item}
+            elif not isinstance(item, dict):
+                print(f"[batch] line {n}: not an object or a string, skipped", file=sys.stderr)
+                continue
+            yield str(item.get("id", item.get("request_id", n))), item
+
+def completed_ids(path: str) -> set[str]:
+    """Ids that already have a successful result in an output file."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue  # cut off by an interruption
+            if "error" not in rec and "id" in rec:
+                done.add(str(rec["id"]))
+    return done
+
+def user_turns(item: dict) -> list[str] | None:
+    if isinstance(item.get("turns"), list):
+        return [str(t) for t in item["turns"]]
+    for key in _TEXT_KEYS:
+        if isinstance(item.get(key), str):
+            return [item[key]]
+    return None
+
+class ResultWriter:
+    """Append one JSON line per result, flushed at once, from any worker."""
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        cut = False
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                cut = f.read(1) != b"\n"
+        self.f = open(path, "a", encoding="utf-8")
+        if cut:
+            self.f.write("\n")  # a hard kill left half a line: start on a fresh one
+        self._lock = threading.Lock()
+
+    def write(self, rec: dict):
+        line = json.dumps(rec, ensure_ascii=False) + "\n"
+        with self._lock:
+            self.f.write(line)
+            self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+def save_audio(audio: bytes, path_stem: str) -> str:
+    """Write synthesized audio next to the results: WAV for pcm_* formats, else as is."""
+    rate = core.pcm_rate()
+    if rate:
+        path = path_stem + ".wav"
+        with wave.open(path, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(rate)
+            w.writeframes(audio)
+    else:
+        path = path_stem + "." + core.settings.tts_format.split("_")[0]
+        with open(path, "wb") as f:
+            f.write(audio)
+    return path
+
+def run_item(item_id: str, item: dict, tts_dir: str | None = None) -> dict:
+    """Answer one item; returns its result record (with "error" on failure)."""
+    trace = metrics.use(metrics.Trace())
+    rec = {"id": item_id, "session": item_id, "model": core.get_model()}
+    t0 = time.perf_counter()
+    try:
+        replies = []
+        if isinstance(item.get("messages"), list):
+            messages = list(item["messages"])
+            if not messages or messages[0].get("role") != "system":
+                messages.insert(0, {"role": "system", "content": item.get("system") or core.get_system_prompt()})
+            replies.append(core.ask_llm(messages))
+        else:
+            turns = user_turns(item)
+            if turns is None:
+                raise ValueError(f"no prompt, turns or messages (keys: {', '.join(item)})")
+            context = ContextWindow(item.get("system") or core.get_system_prompt(), core.get_input_budget())
+            for text in turns:
+                context.add("user", text)
+                reply = core.ask_llm(context.messages())
+                context.add("assistant", reply)
+                replies.append(reply)
+        rec["reply"] = replies[-1]
+        if len(replies) > 1:
+            rec["replies"] = replies
+        if tts_dir:
+            rec["audio"] = []
+            for i, reply in enumerate(replies):
+                stem = os.path.join(tts_dir, _safe_name(item_id) + (f"-{i + 1}" if len(replies) > 1 else ""))
+                rec["audio"].append(save_audio(core.synthesize(reply), stem))
+    except Exception as e:
+        rec["error"] = f"{type(e).__name__}: {e}"
+    metrics.record("item", time.perf_counter() - t0)
+    fields = metrics.fields(trace)
+    rec["model"] = core.reply_model(fields)  # the tier that answered (the last turn's, for conversations)
+    rec.update(fields)
+    rec["ts"] = datetime.now(UTC).isoformat()
+    return rec
+
+def _safe_name(item_id: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in item_id)[:100] or "item"
+
+def run(input_path: str, output_path: str, workers: int = 4, tts_dir: str | None = None,
+        limit: int | None = None, progress=print) -> dict:
+    """
+    Run every item of input_path not already completed in output_path.
+    At most `workers` items are in flight and twice that many are read
+    ahead, so large inputs are streamed. Returns counts for the run.
+    """
+    done = completed_ids(output_path)
+    if tts_dir:
+        os.makedirs(tts_dir, exist_ok=True)
+    writer = ResultWriter(output_path)
+    slots = threading.BoundedSemaphore(workers * 2)
+    counts = {"ok": 0, "error": 0, "skipped": 0}
+    lock = threading.Lock()
+    t0 = time.perf_counter()
+
+    def job(item_id, item):
+        try:
+            rec = run_item(item_id, item, tts_dir)
+            writer.write(rec)
+            with lock:
+                counts["error" if "error" in rec else "ok"] += 1
+                n = counts["ok"] + counts["error"]
+            if progress:
+                status = rec["error"] if "error" in rec else f"{rec.get('timing', {}).get('item_ms', 0):.0f} ms"
+                progress(f"[{n}] {item_id}: {status}")
+        finally:
+            slots.release()
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch")
+    submitted = 0
+    try:
+        for item_id, item in read_items(input_path):
+            if item_id in done:
+                counts["skipped"] += 1
+                continue
+            if limit is not None and submitted >= limit:
+                break
+            slots.acquire()
+            pool.submit(job, item_id, item)
+            submitted += 1
+        pool.shutdown(wait=True)
+    except KeyboardInterrupt:
+        # finished items are already on disk; the rest run next time
+        pool.shutdown(wait=True, cancel_futures=True)
+        counts["interrupted"] = True
+    finally:
+        writer.close()
+    counts["seconds"] = round(time.perf_counter() - t0, 2)
+    return counts
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m src.john.batch",
+                                 description="Run a JSONL file of prompts / conversations through John.")
+    ap.add_argument("input", help="JSONL: {id, prompt | turns | messages[, system]} per line")
+    ap.add_argument("-o", "--output", help="results JSONL (default: <input>.out.jsonl); reruns resume it")
+    ap.add_argument("--workers", type=int, default=int(core.settings.get("BATCH_WORKERS", 4)),
+                    help="items in flight (default: BATCH_WORKERS or 4)")
+    ap.add_argument("--tts", metavar="DIR", help="also synthesize every reply into DIR")
+    ap.add_argument("--limit", type=int, help="run at most N new items")
+    ap.add_argument("--quiet", action="store_true", help="no per-item progress")
+    args = ap.parse_args(argv)
+
+    output = args.output or os.path.splitext(args.input)[0] + ".out.jsonl"
+    counts = run(args.input, output, max(1, args.workers), args.tts, args.limit,
+                 progress=None if args.quiet else print)
+    print(f"{counts['ok']} ok, {counts['error']} failed, {counts['skipped']} already done "
+          f"in {counts['seconds']} s -> {output}")
+    if counts.get("interrupted"):
+        print("Interrupted: run the same command again to finish the rest.")
+    print(f"Latency / cost: python -m src.john.metrics --file {output}")
+
+if __name__ == "__main__":
+    main()
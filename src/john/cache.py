@@ -0,0 +1,227 @@
+# src/john/cache.py
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys: NFC, trimmed, single spaces."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+def make_key(*parts) -> str:
+    """Stable content hash of any JSON-serializable parts."""
+    blob = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+class DiskCache:
+    """
+    Content-addressed on-disk byte cache (used for TTS audio and LLM replies).
+    Entries are evicted least-recently-used first once the directory exceeds
+    `max_bytes`. Writes go to a temp file and are renamed into place, so
+    concurrent readers never see a partial entry.
+    """
+    def __init__(self, root: str, max_bytes: int, suffix: str = ".audio"):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # key -> size, least recently used first
+        self._size = 0
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key + self.suffix)
+
+    def _scan(self):
+        """Rebuild the LRU index from what's on disk (oldest mtime first)."""
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith(self.suffix):
+                continue
+            try:
+                st = os.stat(os.path.join(self.root, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name[:-len(self.suffix)], st.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._size += size
+        with self._lock:
+            self._evict()
+
+    def get(self, key: str) -> bytes | None:
+        """Return cached bytes or None; a hit refreshes the entry's recency."""
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # keep LRU order across restarts
+        except OSError:
+            with self._lock:
+                self._size -= self._index.pop(key, 0)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes):
+        """Store bytes atomically, then evict old entries over the cap."""
+        if len(data) > self.max_bytes:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self._size -= self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self._size += len(data)
+            self._evict()
+
+    def _evict(self):
+        # caller holds the lock
+        while self._size > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            for key in self._index:
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+            self._index.clear()
+            self._size = 0
+
+    def resize(self, max_bytes: int):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._index),
+                "bytes": self._size,
+            }
+
+class ResponseCache:
+    """
+    Two-tier cache for LLM replies: an in-memory LRU in front of an optional
+    on-disk DiskCache. Entries older than `ttl` seconds are treated as misses.
+    Each entry remembers how long the original call took, so stats() can
+    report the latency saved by hits.
+    """
+    def __init__(self, max_entries: int = 256, root: str | None = None,
+                 max_bytes: int = 0, ttl: float = 86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk = DiskCache(root, max_bytes, suffix=".json") if root and max_bytes > 0 else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.saved_s = 0.0
+        self._lock = threading.Lock()
+        self._mem = OrderedDict()  # key -> entry dict, least recently used first
+
+    def _fresh(self, entry: dict) -> bool:
+        return not self.ttl or time.time() - entry["ts"] < self.ttl
+
+    def get(self, key: str) -> str | None:
+        """Return a cached reply or None."""
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None and not self._fresh(entry):
+                del self._mem[key]
+                entry = None
+            if entry is not None:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                self.saved_s += entry["latency"]
+                return entry["reply"]
+        entry = self._disk_get(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self._remember(key, entry)
+            self.hits += 1
+            self.disk_hits += 1
+            self.saved_s += entry["latency"]
+        return entry["reply"]
+
+    def _disk_get(self, key: str) -> dict | None:
+        if self.disk is None:
+            return None
+        raw = self.disk.get(key)
+        if raw is None:
+            return None
+        try:
+            entry = json.loads(raw)
+        except ValueError:
+            return None
+        return entry if self._fresh(entry) else None
+
+    def put(self, key: str, reply: str, latency: float = 0.0):
+        """Store a reply along with how long it took to produce."""
+        entry = {"reply": reply, "latency": latency, "ts": time.time()}
+        with self._lock:
+            self._remember(key, entry)
+        if self.disk is not None:
+            self.disk.put(key, json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+
+    def _remember(self, key: str, entry: dict):
+        # caller holds the lock
+        self._mem[key] = entry
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def clear(self):
+        """Invalidate both tiers (e.g. after the prompt or model changed)."""
+        with self._lock:
+            self._mem.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._mem),
+                "latency_saved_s": round(self.saved_s, 3),
+            }
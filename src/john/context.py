@@ -0,0 +1,169 @@
+# src/john/context.py
+import threading
+
+_enc = None  # tiktoken encoding, loaded on first count (False if unavailable)
+
+MESSAGE_OVERHEAD = 4  # role + separators per chat message
+_MARKER = "\n[…truncated…]\n"
+
+def count_tokens(text: str) -> int:
+    """Token count of text (tiktoken if available, else ~4 chars per token)."""
+    global _enc
+    if _enc is None:
+        try:
+            import tiktoken  # optional: exact counts when installed
+            _enc = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _enc = False
+    if _enc:
+        return len(_enc.encode(text))
+    return (len(text) + 3) // 4
+
+def _entry(role: str, content: str) -> dict:
+    # the token count is computed once here and cached on the entry
+    return {"role": role, "content": content, "tokens": count_tokens(content) + MESSAGE_OVERHEAD}
+
+def _shorten(entry: dict, limit: int) -> dict:
+    """Cut an oversized message down to about `limit` tokens, keeping head and tail."""
+    text = entry["content"]
+    room = max(0, limit - MESSAGE_OVERHEAD - count_tokens(_MARKER))
+    keep = room * len(text) // max(1, entry["tokens"])
+    head, tail = text[:keep // 2], text[len(text) - keep // 2:]
+    return _entry(entry["role"], head + _MARKER + tail)
+
+class ContextWindow:
+    """
+    Conversation history trimmed to a token budget instead of a message count.
+    The system prompt (and the running summary and recalled memory, if
+    any) always stay; the oldest turns are evicted first until the rest
+    fits in `budget` input tokens. Shared by the GUI and the CLI.
+    """
+    SUMMARY_PREFIX = "Summary of the earlier conversation: "
+    MEMORY_PREFIX = "Possibly relevant notes from earlier conversations (may be outdated):\n"
+
+    def __init__(self, system_prompt: str, budget: int):
+        self.budget = budget
+        self.system = _entry("system", system_prompt)
+        self.summary = None  # kept right after the system prompt
+        self.memory = None  # recalled for the current turn, after the summary
+        self.turns = []
+        self._lock = threading.RLock()  # the summary is set from a worker thread
+
+    @property
+    def tokens(self) -> int:
+        head = sum(e["tokens"] for e in self._head())
+        return head + sum(e["tokens"] for e in self.turns)
+
+    def add(self, role: str, content: str) -> list[dict]:
+        """Append a message, trim to budget, and return the evicted messages."""
+        with self._lock:
+            self.turns.append(_entry(role, content))
+            return self.trim()
+
+    def discard_last(self, role: str):
+        """Drop the newest message if it is from `role` (a user turn whose reply never came)."""
+        with self._lock:
+            if self.turns and self.turns[-1]["role"] == role:
+                self.turns.pop()
+
+    def trim(self) -> list[dict]:
+        with self._lock:
+            evicted = []
+            while self.tokens > self.budget and len(self.turns) > 1:
+                e = self.turns.pop(0)
+                evicted.append({"role": e["role"], "content": e["content"]})
+            if self.turns and self.tokens > self.budget:
+                # a single huge message (pasted log etc.) still has to fit
+                room = self.budget - (self.tokens - self.turns[-1]["tokens"])
+                self.turns[-1] = _shorten(self.turns[-1], room)
+            return evicted
+
+    def messages(self) -> list[dict]:
+        """API-ready message list (without the cached counts)."""
+        with self._lock:
+            return [{"role": e["role"], "content": e["content"]} for e in self._head() + self.turns]
+
+    def _head(self) -> list[dict]:
+        return [e for e in (self.system, self.summary, self.memory) if e is not None]
+
+    def get_summary(self) -> str:
+        s = self.summary
+        return s["content"][len(self.SUMMARY_PREFIX):] if s else ""
+
+    def set_summary(self, text: str):
+        """Replace the running summary of evicted turns."""
+        with self._lock:
+            self.summary = _entry("system", self.SUMMARY_PREFIX + text) if text else None
+
+    def set_memory(self, notes: str | None):
+        """Replace the recalled notes (None / "" removes them); set before add() so trimming counts them."""
+        with self._lock:
+            self.memory = _entry("system", self.MEMORY_PREFIX + notes) if notes else None
+
+    def reset(self, system_prompt: str | None = None):
+        """Drop the conversation, optionally switching the system prompt."""
+        with self._lock:
+            if system_prompt is not None:
+                self.system = _entry("system", system_prompt)
+            self.summary = None
+            self.memory = None
+            self.turns = []
+
+class RollingSummarizer:
+    """
+    Fold turns evicted from a ContextWindow into its running summary.
+    Evicted turns are only collected by add(); the actual LLM call happens
+    on a worker thread started by kick() (call it after the reply is shown),
+    and only once at least `min_tokens` of new text has piled up
+    (`min_tokens <= 0` turns it off). `summarize(previous_summary, turns) -> str`
+    does the call.
+    """
+    def __init__(self, window: ContextWindow, summarize, min_tokens: int = 300):
+        self.window = window
+        self.summarize = summarize
+        self.min_tokens = min_tokens
+        self._pending = []
+        self._pending_tokens = 0
+        self._running = False
+        self._generation = 0  # bumped by reset() so stale results are dropped
+        self._lock = threading.Lock()
+
+    def add(self, evicted: list[dict]):
+        if not evicted:
+            return
+        with self._lock:
+            self._pending.extend(evicted)
+            self._pending_tokens += sum(count_tokens(m["content"]) for m in evicted)
+
+    def kick(self):
+        """Start a background re-summarization if enough new text was evicted."""
+        with self._lock:
+            if self.min_tokens <= 0 or self._running or self._pending_tokens < self.min_tokens:
+                return
+            batch, self._pending, self._pending_tokens = self._pending, [], 0
+            self._running = True
+            generation = self._generation
+        threading.Thread(target=self._run, args=(batch, generation), daemon=True).start()
+
+    def _run(self, batch: list[dict], generation: int):
+        try:
+            text = self.summarize(self.window.get_summary(), batch)
+            with self._lock:
+                if generation == self._generation and text:
+                    self.window.set_summary(text.strip())
+        except Exception as e:
+            print(f"[Summary error] {e}")
+            with self._lock:
+                if generation == self._generation:
+                    # retry with the next kick
+                    self._pending[:0] = batch
+                    self._pending_tokens += sum(count_tokens(m["content"]) for m in batch)
+        finally:
+            with self._lock:
+                self._running = False
+
+    def reset(self):
+        """Forget pending turns and ignore any summary still in flight."""
+        with self._lock:
+            self._pending, self._pending_tokens = [], 0
+            self._generation += 1
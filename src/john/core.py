@@ -1,58 +1,735 @@
 # src/john/core.py
+import io
+import os
 import json
-from openai import OpenAI
-from elevenlabs import ElevenLabs, play
+import time
+import threading
+import contextvars
+from datetime import datetime, timedelta, UTC
+from concurrent.futures import ThreadPoolExecutor
 
-import sounddevice as sd
-from scipy.io.wavfile import write
+from .cache import DiskCache, ResponseCache, make_key, normalize_text
+from .history import HistoryWriter
+from . import metrics
 
-# --- Load config ---
-with open("config.json", "r", encoding="utf-8") as f:
-    cfg = json.load(f)
+# Importing this module is cheap and has no side effects: config.json and
+# system_prompt.txt are read on first use, and openai / elevenlabs /
+# sounddevice / numpy are only imported when a client or the mic is needed
+# (or ahead of time by prewarm()).
 
-client = OpenAI(api_key=cfg["OPENAI_API_KEY"])
-MODEL = cfg.get("MODEL", "gpt-5-nano")
-SPEAK = bool(cfg.get("SPEAK", False))
+MAX_COMPLETION_TOKENS = 400
+REASONING_EFFORT = "minimal"
+DEFAULT_PROMPT = "You are John, a friendly, concise personal assistant."
 
-# --- Load system prompt ---
-with open("system_prompt.txt", "r", encoding="utf-8") as f:
-    SYSTEM_PROMPT = f.read().strip()
+# --- Settings (config.json + system_prompt.txt, loaded lazily) ---
+class Settings:
+    """Runtime settings; files are read on first access, and again by load()."""
+    def __init__(self, config_path: str = "config.json", prompt_path: str = "system_prompt.txt"):
+        self.config_path = config_path
+        self.prompt_path = prompt_path
+        self._cfg = None
+        self._prompt = DEFAULT_PROMPT
+        self._speak = False
+        self.default_voice_id = "Cb8NLd0sUB8jI4MW2f9M"  # used when config.json has no VOICE_ID
+        self._lock = threading.Lock()
 
-# --- Init ElevenLabs ---
-eleven = ElevenLabs(api_key=cfg.get("ELEVEN_API_KEY"))
+    def load(self):
+        """(Re-)read both files; a missing file means defaults."""
+        cfg = {}
+        if os.path.exists(self.config_path):
+            with open(self.config_path, "r", encoding="utf-8") as f:
+                cfg = json.load(f)
+        prompt = DEFAULT_PROMPT
+        if os.path.exists(self.prompt_path):
+            with open(self.prompt_path, "r", encoding="utf-8") as f:
+                prompt = f.read().strip()
+        with self._lock:
+            self._cfg, self._prompt = cfg, prompt
+            self._speak = bool(cfg.get("SPEAK", False))
 
-def say(text: str):
-    """Speak text using ElevenLabs if SPEAK=True in config."""
-    if not SPEAK or not cfg.get("ELEVEN_API_KEY"):
+    def _ensure(self):
+        if self._cfg is None:
+            self.load()
+
+    @property
+    def cfg(self) -> dict:
+        self._ensure()
+        return self._cfg
+
+    def get(self, key: str, default=None):
+        return self.cfg.get(key, default)
+
+    @property
+    def system_prompt(self) -> str:
+        self._ensure()
+        return self._prompt
+
+    @property
+    def speak(self) -> bool:
+        self._ensure()
+        return self._speak
+
+    @speak.setter
+    def speak(self, flag: bool):
+        self._ensure()
+        self._speak = bool(flag)
+
+    @property
+    def model(self) -> str:
+        return self.get("MODEL", "gpt-5-nano")
+
+    @property
+    def context_tokens(self) -> int:
+        return int(self.get("CONTEXT_TOKENS", 4000))  # prompt + reply budget per call
+
+    @property
+    def voice_id(self) -> str:
+        return self.get("VOICE_ID", self.default_voice_id)  # change to your voice ID
+
+    @property
+    def tts_model(self) -> str:
+        return self.get("TTS_MODEL", "eleven_multilingual_v2")
+
+    @property
+    def tts_format(self) -> str:
+        return self.get("TTS_FORMAT", "pcm_24000")  # raw PCM streams straight to the player
+
+    @property
+    def tts_prefetch(self) -> int:
+        return int(self.get("TTS_PREFETCH", 2))  # sentences synthesized and not yet played
+
+settings = Settings()
+
+# --- API clients: one long-lived HTTP connection pool per provider ---
+_HTTP_DEFAULTS = {
+    "max_connections": 10,
+    "max_keepalive": 5,
+    "keepalive_s": 90,
+    "connect_timeout": 5.0,
+    "read_timeout": 60.0,
+}
+_BASE_URLS = {  # override with OPENAI_BASE_URL / ELEVEN_BASE_URL (e.g. benchmarks/fake_server.py)
+    "OPENAI": "https://api.openai.com/v1",
+    "ELEVEN": "https://api.elevenlabs.io",
+}
+_WARMUP_PATHS = {"OPENAI": "/models", "ELEVEN": "/v1/models"}
+
+_client = None
+_client_sig = None
+_eleven = None
+_eleven_sig = None
+_http = {}  # provider -> the httpx.Client behind its SDK client
+_clients_lock = threading.Lock()
+
+def _http_options(provider: str) -> dict:
+    """Pool/timeout settings for "OPENAI" or "ELEVEN" (config.json: OPENAI_HTTP / ELEVEN_HTTP)."""
+    return {**_HTTP_DEFAULTS, **settings.get(f"{provider}_HTTP", {})}
+
+def _base_url(provider: str) -> str:
+    return settings.get(f"{provider}_BASE_URL") or _BASE_URLS[provider]
+
+def _client_signature(provider: str) -> str:
+    """Everything a client is built from; the client is only rebuilt when this changes."""
+    return json.dumps([settings.get(f"{provider}_API_KEY"), _base_url(provider), _http_options(provider)], sort_keys=True)
+
+def _make_http(provider: str):
+    import httpx
+    opts = _http_options(provider)
+    _http[provider] = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=int(opts["max_connections"]),
+            max_keepalive_connections=int(opts["max_keepalive"]),
+            keepalive_expiry=float(opts["keepalive_s"]),
+        ),
+        timeout=httpx.Timeout(float(opts["read_timeout"]), connect=float(opts["connect_timeout"])),
+    )
+    return _http[provider]
+
+def _retire_http(http, grace_s: float | None = None):
+    """Close a replaced pool once calls still running on it had time to finish."""
+    if http is None:
         return
+    if grace_s is None:
+        grace_s = float(_HTTP_DEFAULTS["read_timeout"])
+    timer = threading.Timer(grace_s, http.close)
+    timer.daemon = True
+    timer.start()
+
+def _timeout(provider: str):
+    import httpx
+    opts = _http_options(provider)
+    return httpx.Timeout(float(opts["read_timeout"]), connect=float(opts["connect_timeout"]))
+
+def get_client():
+    """The shared OpenAI client (pooled, keep-alive HTTP connections; retries are the gate's job)."""
+    global _client, _client_sig
+    with _clients_lock:
+        if _client is None:
+            from openai import OpenAI
+            _client_sig = _client_signature("OPENAI")
+            _client = OpenAI(
+                api_key=settings.get("OPENAI_API_KEY"),
+                base_url=_base_url("OPENAI"),
+                http_client=_make_http("OPENAI"),
+                timeout=_timeout("OPENAI"),
+                max_retries=0,
+            )
+        return _client
+
+def get_eleven():
+    """The shared ElevenLabs client (pooled, keep-alive HTTP connections)."""
+    global _eleven, _eleven_sig
+    with _clients_lock:
+        if _eleven is None:
+            from elevenlabs import ElevenLabs
+            _eleven_sig = _client_signature("ELEVEN")
+            _eleven = ElevenLabs(
+                api_key=settings.get("ELEVEN_API_KEY"),
+                base_url=_base_url("ELEVEN"),
+                httpx_client=_make_http("ELEVEN"),
+                timeout=float(_http_options("ELEVEN")["read_timeout"]),
+            )
+        return _eleven
+
+# --- call gates: rate limit, adaptive concurrency, retries, hedging per provider ---
+_LIMIT_DEFAULTS = {
+    "rps": 0,                 # requests per second (0 = no rate limit)
+    "burst": 10,
+    "max_concurrent": 8,      # AIMD ceiling; halved on 429, +1 per window of fast calls
+    "min_concurrent": 1,
+    "latency_target_s": 0,    # calls slower than this shrink the limit (0 = off)
+    "retries": 3,
+    "backoff_s": 0.5,
+    "max_backoff_s": 20,
+    "hedge": False,           # duplicate a call that runs past its p95
+    "hedge_min_samples": 20,
+}
+
+_gates = {}  # provider -> (options, Gate)
+_gates_lock = threading.Lock()
+
+def _limit_options(provider: str) -> dict:
+    """Gate settings for "OPENAI" or "ELEVEN" (config.json: OPENAI_LIMITS / ELEVEN_LIMITS)."""
+    return {**_LIMIT_DEFAULTS, **settings.get(f"{provider}_LIMITS", {})}
+
+def get_gate(provider: str):
+    """The provider's shared limits.Gate, rebuilt when its *_LIMITS settings change."""
+    from .limits import Gate  # pulls in asyncio; kept off the import path
+    opts = _limit_options(provider)
+    with _gates_lock:
+        cached = _gates.get(provider)
+        if cached is None or cached[0] != opts:
+            _gates[provider] = cached = (opts, Gate(
+                provider,
+                rps=float(opts["rps"]),
+                burst=float(opts["burst"]),
+                max_concurrent=int(opts["max_concurrent"]),
+                min_concurrent=int(opts["min_concurrent"]),
+                latency_target_s=float(opts["latency_target_s"]),
+                retries=int(opts["retries"]),
+                backoff_s=float(opts["backoff_s"]),
+                max_backoff_s=float(opts["max_backoff_s"]),
+                hedge=bool(opts["hedge"]),
+                hedge_min_samples=int(opts["hedge_min_samples"]),
+            ))
+        return cached[1]
+
+def get_limit_stats() -> dict:
+    """Per-provider call counts, retries, 429s, hedges, current limit and p50/p95."""
+    with _gates_lock:
+        return {name: gate.stats() for name, (_, gate) in _gates.items()}
+
+def warm_up(providers=("OPENAI", "ELEVEN")):
+    """
+    Open a connection per provider (DNS + TCP + TLS) with a cheap GET through
+    the shared pool, so the first real request doesn't pay for it.
+    """
+    for provider in providers:
+        key = settings.get(f"{provider}_API_KEY")
+        if not key:
+            continue
+        try:
+            if provider == "OPENAI":
+                get_client()
+                headers = {"Authorization": f"Bearer {key}"}
+            else:
+                get_eleven()
+                headers = {"xi-api-key": key}
+            _http[provider].get(_base_url(provider).rstrip("/") + _WARMUP_PATHS[provider], headers=headers)
+        except Exception as e:
+            print(f"[Warm-up error] {provider}: {e}")
+
+def _warmup_enabled() -> bool:
+    return bool(settings.get("HTTP_WARMUP", True))
+
+def prewarm():
+    """
+    Do the slow startup work ahead of the first request: read settings,
+    import the SDKs and audio stack, build clients and caches.
+    Meant for a background thread once the UI is up.
+    """
+    try:
+        settings.load()
+        _ensure_caches()
+        get_client()
+        get_eleven()
+        from . import audio  # numpy + sounddevice + scipy
+        if memory_enabled():
+            get_memory()  # starts loading the index and catching up, in the background
+        if tts_enabled() and pcm_rate():
+            get_player(pcm_rate()).open()  # output device ready before the first reply
+        if _warmup_enabled():
+            warm_up()
+    except Exception as e:
+        print(f"[Prewarm error] {e}")
+
+def prewarm_in_background() -> threading.Thread:
+    t = threading.Thread(target=prewarm, name="john-prewarm", daemon=True)
+    t.start()
+    return t
+
+# --- TTS audio cache (repeated short replies skip the network) ---
+tts_cache = None
+_caches_ready = False
+_caches_lock = threading.Lock()
+
+def _ensure_caches():
+    """Build both caches on first use (they scan their directories)."""
+    global _caches_ready
+    with _caches_lock:
+        if not _caches_ready:
+            _init_tts_cache()
+            _init_llm_cache()
+            _caches_ready = True
+
+def _init_tts_cache():
+    """Create, resize or drop the TTS cache to match TTS_CACHE_DIR / TTS_CACHE_MB."""
+    global tts_cache
+    root = settings.get("TTS_CACHE_DIR", "logs/tts_cache")
+    max_bytes = int(float(settings.get("TTS_CACHE_MB", 50)) * 1024 * 1024)
+    if max_bytes <= 0:
+        tts_cache = None
+    elif tts_cache is not None and tts_cache.root == root:
+        tts_cache.resize(max_bytes)
+    else:
+        tts_cache = DiskCache(root, max_bytes)
+
+# --- LLM response cache (opt-in via LLM_CACHE) ---
+llm_cache = None
+
+def _init_llm_cache():
+    """Create or drop the reply cache according to the LLM_CACHE* settings."""
+    global llm_cache
+    if not settings.get("LLM_CACHE", False):
+        llm_cache = None
+        return
+    llm_cache = ResponseCache(
+        max_entries=int(settings.get("LLM_CACHE_ENTRIES", 256)),
+        root=settings.get("LLM_CACHE_DIR", "logs/llm_cache"),
+        max_bytes=int(float(settings.get("LLM_CACHE_MB", 10)) * 1024 * 1024),
+        ttl=float(settings.get("LLM_CACHE_TTL", 86400)),
+    )
+
+def _llm_cache_settings() -> tuple:
+    llm_keys = sorted((k, v) for k, v in settings.cfg.items() if k.startswith("LLM_CACHE"))
+    return (settings.model, settings.system_prompt, llm_keys)
+
+def _llm_cache_key(messages: list[dict], decision) -> str:
+    trimmed = [{"role": m["role"], "content": m["content"]} for m in messages]
+    return make_key(decision.model, settings.system_prompt, trimmed, decision.max_completion_tokens,
+                    decision.reasoning_effort)
+
+# --- history log (background group-commit writer, shared by GUI and CLI) ---
+_history = None
+_history_lock = threading.Lock()
+
+def _get_history() -> HistoryWriter:
+    global _history
+    with _history_lock:
+        if _history is None:
+            _history = HistoryWriter(
+                get_log_dir(),
+                batch=int(settings.get("LOG_BATCH", 64)),
+                flush_ms=int(settings.get("LOG_FLUSH_MS", 200)),
+                fsync=settings.get("LOG_FSYNC", "off"),
+                segment_bytes=int(float(settings.get("LOG_SEGMENT_MB", 16)) * 1024 * 1024),
+                segment_s=float(settings.get("LOG_SEGMENT_HOURS", 24)) * 3600,
+                compress=bool(settings.get("LOG_COMPRESS", False)),
+            )
+            _history.subscribe(_feed_memory)  # memory is indexed off the logging thread
+        return _history
+
+def get_log_dir() -> str:
+    return settings.get("LOG_DIR", "logs/history")
+
+def begin_trace():
+    """
+    Start timing a turn (None when "TIMING" is false). Stages run in this
+    thread / task record onto it; attach them to a logged event with
+    metrics.fields(trace).
+    """
+    return metrics.use(metrics.Trace() if settings.get("TIMING", True) else None)
+
+def log_timing(session: str, trace, event: str = "timing"):
+    """Log what `trace` recorded since it was last attached, as a meta event."""
+    extra = metrics.fields(trace)
+    if extra:
+        log_event({"session": session, "role": "meta", "event": event, **extra})
+
+def log_event(event: dict):
+    """Queue one JSON object (with auto ts) for the history store."""
+    event = {**event, "ts": datetime.now(UTC).isoformat()}
+    _get_history().log(event)
+
+# --- long-term memory (opt-in: "MEMORY": true) ---
+_memory = None
+_memory_lock = threading.Lock()
+_memory_ready = threading.Event()
+_memory_started = False
+_memory_pending = []
+
+def memory_enabled() -> bool:
+    return bool(settings.get("MEMORY", False))
+
+def _feed_memory(events: list[dict]):
+    # on the history writer thread, after each group commit
+    turns = [e for e in events if e.get("role") in ("user", "assistant")]
+    if not turns:
+        return
+    with _memory_lock:
+        if not _memory_started:
+            return  # the catch-up will find them in the history store
+        if not _memory_ready.is_set():
+            _memory_pending.extend(turns)  # indexed once the catch-up is done
+            return
+    if _memory is not None:
+        _memory.add_many(turns)
+
+def get_memory():
+    """
+    The memory.MemoryIndex under MEMORY_DIR (default logs/memory), or None
+    while it is loading. The first call starts a background thread that
+    opens it and indexes whatever the history store logged since it was
+    last updated; it never blocks the caller. After that, turns are indexed
+    as the history writer commits them.
+    """
+    global _memory_started
+    if _memory_ready.is_set():
+        return _memory
+    with _memory_lock:
+        if not _memory_started:
+            _memory_started = True
+            threading.Thread(target=_load_memory, name="john-memory", daemon=True).start()
+    return None
+
+def _load_memory():
+    global _memory
+    index = None
     try:
-        audio = eleven.text_to_speech.convert(
-            voice_id="Cb8NLd0sUB8jI4MW2f9M",  # change to your voice ID
-            model_id="eleven_multilingual_v2",
+        from .memory import MemoryIndex
+        from .history import HistoryReader
+        index = MemoryIndex(settings.get("MEMORY_DIR", "logs/memory"), int(settings.get("MEMORY_DIM", 512)))
+        since = None
+        if index.last_ts:
+            # a little overlap: events are stamped before they are queued, so they can
+            # be committed slightly out of order; turns seen before are skipped
+            since = (datetime.fromisoformat(index.last_ts) - timedelta(seconds=60)).isoformat()
+        index.sync(HistoryReader(get_log_dir()).iter_events(since=since))
+    except Exception as e:
+        print(f"[Memory error] {e}")
+    finally:
+        with _memory_lock:
+            if index is not None:
+                index.add_many(_memory_pending)
+                _memory = index
+            _memory_pending.clear()
+            _memory_ready.set()
+
+def recall(query: str, session: str | None = None) -> str | None:
+    """
+    Notes from earlier sessions relevant to query, for ContextWindow.set_memory()
+    (None when memory is off, still loading or nothing scores MEMORY_MIN_SCORE).
+    At most MEMORY_TOP_K turns and MEMORY_CHARS characters; the search scans
+    only as many recent turns as fit in MEMORY_BUDGET_MS.
+    """
+    if not memory_enabled():
+        return None
+    index = get_memory()
+    if index is None:
+        return None
+    from .memory import format_notes
+    with metrics.span("memory"):
+        hits = index.search(query, k=int(settings.get("MEMORY_TOP_K", 3)),
+                            min_score=float(settings.get("MEMORY_MIN_SCORE", 0.15)),
+                            exclude_session=session, budget_ms=float(settings.get("MEMORY_BUDGET_MS", 10)))
+    return format_notes(hits, max_total=int(settings.get("MEMORY_CHARS", 800))) or None
+
+def flush_log():
+    """Write out everything queued and stop the writer (also runs at exit)."""
+    global _history
+    with _history_lock:
+        if _history is not None:
+            _history.close()
+            _history = None
+    if _memory is not None:
+        _memory.close()
+
+def tts_enabled() -> bool:
+    """True when replies should be spoken (SPEAK on and a key configured)."""
+    return settings.speak and bool(settings.get("ELEVEN_API_KEY"))
+
+def pcm_rate() -> int | None:
+    """Sample rate when TTS_FORMAT is raw PCM ("pcm_24000" -> 24000), else None."""
+    fmt = settings.tts_format
+    if fmt.startswith("pcm_"):
+        return int(fmt.split("_")[1])
+    return None
+
+def synthesize_stream(text: str):
+    """
+    Yield the audio for text in chunks as ElevenLabs streams it (TTS_FORMAT),
+    served from the cache when possible. A completed stream is cached.
+    """
+    _ensure_caches()
+    text = normalize_text(text)
+    voice_id, tts_model, tts_format = settings.voice_id, settings.tts_model, settings.tts_format
+    key = make_key(text, voice_id, tts_model, tts_format)
+    if tts_cache is not None:
+        audio = tts_cache.get(key)
+        if audio is not None:
+            yield audio
+            return
+    t0 = time.perf_counter()
+
+    def open_stream():
+        # the request goes out on the first next(); retries/hedging cover it
+        chunks = get_eleven().text_to_speech.stream(
+            voice_id=voice_id,
+            model_id=tts_model,
+            output_format=tts_format,
             text=text
         )
-        play(audio)
+        return chunks, next(chunks, b"")
+
+    chunks, first = get_gate("ELEVEN").call(open_stream, hedge=True, discard=lambda r: r[0].close(), stage="tts",
+                                            track="tts_open")
+    metrics.record("tts_ttfb", time.perf_counter() - t0)
+    parts = [first]
+    try:
+        if first:
+            yield first
+        for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+    finally:
+        chunks.close()
+    metrics.record("tts_synth", time.perf_counter() - t0)
+    if tts_cache is not None:
+        tts_cache.put(key, b"".join(parts))
+
+def synthesize(text: str) -> bytes:
+    """Render text to audio bytes with ElevenLabs, served from the cache when possible."""
+    return b"".join(synthesize_stream(text))
+
+# --- playback: raw PCM goes to one persistent output stream, anything else to ffplay ---
+_player = None
+_player_lock = threading.Lock()
+_ffplay = set()  # ffplay processes currently playing, so stop_playback() can cut them off
+_ffplay_lock = threading.Lock()
+
+def get_player(samplerate: int):
+    """The shared audio.PCMPlayer, reopened if the sample rate changed."""
+    global _player
+    with _player_lock:
+        if _player is None or _player.samplerate != samplerate:
+            from .audio import PCMPlayer
+            if _player is not None:
+                _player.close()
+            _player = PCMPlayer(samplerate)
+        return _player
+
+def play_audio(audio: bytes):
+    """Play synthesized audio, blocking until it finishes or stop_playback() is called."""
+    rate = pcm_rate()
+    with metrics.span("tts_play"):
+        if rate:
+            player = get_player(rate)
+            if player.write(audio):
+                player.drain()
+            return
+        _play_ffplay(audio)
+
+def _play_ffplay(audio: bytes):
+    # compressed formats (mp3_*, opus_*): same player as elevenlabs.play(), kept stoppable
+    import subprocess
+    try:
+        proc = subprocess.Popen(["ffplay", "-autoexit", "-nodisp", "-loglevel", "quiet", "-"],
+                                stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except FileNotFoundError:
+        raise RuntimeError("ffplay (from ffmpeg) not found; use a pcm_* TTS_FORMAT or install ffmpeg") from None
+    with _ffplay_lock:
+        _ffplay.add(proc)
+    try:
+        proc.communicate(input=audio)
+    finally:
+        with _ffplay_lock:
+            _ffplay.discard(proc)
+
+def stop_playback():
+    """Stop any audio that is playing right now (barge-in)."""
+    if _player is not None:
+        _player.stop()
+    with _ffplay_lock:
+        procs = list(_ffplay)
+    for proc in procs:
+        try:
+            proc.kill()
+        except OSError:
+            pass
+
+def say(text: str):
+    """Speak text using ElevenLabs if SPEAK=True in config."""
+    if not tts_enabled():
+        return
+    try:
+        play_audio(synthesize(text))
     except Exception as e:
         print(f"[TTS error] {e}")
 
-def ask_llm(messages: list[dict]) -> str:
-    """Send chat history to the LLM and return its reply."""
-    resp = client.chat.completions.create(
-        model=MODEL,
+# --- per-turn model / token-budget routing ---
+_tiers = None
+_tiers_lock = threading.Lock()
+
+def get_tier_router():
+    """
+    tiers.TierRouter from MODEL_TIERS / MODEL_RULES in config.json (merged over
+    the built-in tiers around MODEL; DEEP_MODEL sets the "deep" tier's model),
+    rebuilt after reload_config().
+    """
+    global _tiers
+    with _tiers_lock:
+        if _tiers is None:
+            from .tiers import TierRouter, default_tiers, DEFAULT_RULES
+            tiers = default_tiers(settings.model, MAX_COMPLETION_TOKENS, REASONING_EFFORT, settings.get("DEEP_MODEL"))
+            for name, spec in settings.get("MODEL_TIERS", {}).items():
+                tiers[name] = {**tiers.get(name, tiers["default"]), **spec}
+            _tiers = TierRouter(tiers, settings.get("MODEL_RULES", DEFAULT_RULES))
+        return _tiers
+
+def plan_llm(messages: list[dict]):
+    """
+    Model, completion-token cap and reasoning effort for this call
+    (a tiers.Decision). With "MODEL_ROUTING": false every call gets the
+    "default" tier. The decision goes on the turn's trace as "llm_route".
+    """
+    router = get_tier_router()
+    if settings.get("MODEL_ROUTING", True):
+        decision = router.decide(messages, speaking=tts_enabled())
+    else:
+        decision = router.fixed("default", messages, speaking=tts_enabled())
+    metrics.note("llm_route", decision.fields())
+    return decision
+
+def ask_llm(messages: list[dict], decision=None) -> str:
+    """Send chat history to the LLM and return its reply (decision: see plan_llm)."""
+    _ensure_caches()
+    decision = decision or plan_llm(messages)
+    key = _llm_cache_key(messages, decision) if llm_cache is not None else None
+    if key is not None:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            return cached
+    t0 = time.perf_counter()
+    resp = get_gate("OPENAI").call(lambda: get_client().chat.completions.create(
         messages=messages,
-        max_completion_tokens=400,
-        reasoning_effort="minimal"
-    )
-    return resp.choices[0].message.content
+        **decision.params()
+    ), hedge=True, stage="llm")
+    metrics.record("llm", time.perf_counter() - t0)
+    metrics.add_usage(decision.model, resp.usage)
+    reply = resp.choices[0].message.content
+    if key is not None and reply:
+        llm_cache.put(key, reply, time.perf_counter() - t0)
+    return reply
+
+def ask_llm_stream(messages: list[dict], decision=None):
+    """Stream the LLM reply, yielding text deltas as they arrive (decision: see plan_llm)."""
+    _ensure_caches()
+    decision = decision or plan_llm(messages)
+    key = _llm_cache_key(messages, decision) if llm_cache is not None else None
+    if key is not None:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+    t0 = time.perf_counter()
+    # the gate covers opening the stream (where 429s surface); a hedged
+    # duplicate that loses is closed straight away
+    stream = get_gate("OPENAI").call(lambda: get_client().chat.completions.create(
+        messages=messages,
+        **decision.params(),
+        stream=True,
+        stream_options={"include_usage": True},
+    ), hedge=True, discard=lambda s: s.close(), stage="llm", track="llm_open")
+    parts = []
+    try:
+        for chunk in stream:
+            if chunk.usage is not None:
+                metrics.add_usage(decision.model, chunk.usage)  # last chunk, no choices
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if not parts:
+                    metrics.record("llm_ttft", time.perf_counter() - t0)
+                parts.append(delta)
+                yield delta
+    finally:
+        # also runs when the caller closes the generator (barge-in): dropping
+        # the connection stops generation, so the rest isn't billed
+        stream.close()
+    metrics.record("llm", time.perf_counter() - t0)
+    if key is not None and parts:
+        llm_cache.put(key, "".join(parts), time.perf_counter() - t0)
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a chat between a user and John, their assistant. "
+    "Merge the new turns into the current summary. Keep facts about the user, names, "
+    "preferences, decisions and open questions; drop small talk. "
+    "Reply with the updated summary only, in under 120 words."
+)
+
+def summarize_turns(previous: str, turns: list[dict]) -> str:
+    """Fold evicted turns into the running summary (runs off the critical path)."""
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in turns)
+    resp = get_gate("OPENAI").call(lambda: get_client().chat.completions.create(
+        model=settings.model,
+        messages=[
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"Current summary:\n{previous or '(none)'}\n\nNew turns:\n{transcript}"},
+        ],
+        max_completion_tokens=MAX_COMPLETION_TOKENS,
+        reasoning_effort=REASONING_EFFORT
+    ), stage="summary")
+    return resp.choices[0].message.content or ""
 
 def get_system_prompt():
-    return SYSTEM_PROMPT
+    return settings.system_prompt
 
 def get_model():
-    return MODEL
+    return settings.model
+
+def reply_model(fields: dict) -> str:
+    """
+    The model that produced a reply, from its trace fields (metrics.fields):
+    the routed tier's model, else the one in the usage record, else MODEL.
+    """
+    return ((fields.get("llm_route") or {}).get("model") or (fields.get("usage") or {}).get("model")
+            or settings.model)
 
 def record_audio(filename="input.wav", duration=5, samplerate=16000):
     """Record audio from the mic and save as WAV."""
+    import sounddevice as sd
+    from scipy.io.wavfile import write
     print(f"[Recording for {duration} seconds...]")
     audio = sd.rec(int(duration * samplerate), samplerate=samplerate, channels=1, dtype="int16")
     sd.wait()
@@ -60,36 +737,200 @@ def record_audio(filename="input.wav", duration=5, samplerate=16000):
     print("[Recording complete]")
     return filename
 
-def transcribe_audio(path: str) -> str:
-    """Send audio file to OpenAI Whisper and return text."""
-    with open(path, "rb") as f:
-        tr = client.audio.transcriptions.create(
+def _make_recorder():
+    from .audio import VADRecorder
+    return VADRecorder(
+        pre_roll_s=float(settings.get("VAD_PRE_ROLL_S", 0.3)),
+        silence_s=float(settings.get("VAD_SILENCE_S", 0.8)),
+        max_s=float(settings.get("VAD_MAX_S", 15)),
+        min_rms=float(settings.get("VAD_MIN_RMS", 300)),
+    )
+
+def record_speech() -> io.BytesIO | None:
+    """
+    Record one utterance with voice-activity detection and return it as an
+    in-memory WAV (None if nobody spoke). Tunable via VAD_* keys in config.json.
+    """
+    print("[Listening...]")
+    with metrics.span("record"):
+        wav = _make_recorder().record()
+    print("[Recording complete]" if wav else "[No speech detected]")
+    return wav
+
+def listen_and_transcribe() -> str | None:
+    """
+    Record one utterance and transcribe it while it is still being spoken:
+    each segment closed at a pause is uploaded right away on a bounded pool
+    (STT_WORKERS, default 2) and the partial transcripts are joined in order.
+    Returns None if nobody spoke.
+    """
+    print("[Listening...]")
+    futures = []
+    with ThreadPoolExecutor(max_workers=int(settings.get("STT_WORKERS", 2))) as pool:
+        with metrics.span("record"):
+            _make_recorder().record_segments(
+                # each job carries this turn's trace into the pool
+                lambda wav: futures.append(pool.submit(contextvars.copy_context().run, transcribe_audio, wav)),
+                gap_s=float(settings.get("STT_SEGMENT_GAP_S", 0.35)),
+                min_segment_s=float(settings.get("STT_MIN_SEGMENT_S", 2.0)),
+            )
+        print("[Recording complete]" if futures else "[No speech detected]")
+        texts = [f.result() for f in futures]
+    if not futures:
+        return None
+    return " ".join(t for t in texts if t)
+
+def prepare_upload(name: str, data: bytes) -> tuple[str, bytes]:
+    """
+    Trim silence, normalize and re-encode captured audio before transcription
+    (STT_TRIM, STT_NORMALIZE, STT_ENCODING: flac | ogg | wav; flac and ogg need
+    the optional soundfile package). Time goes to the stt_prep stage and the
+    sizes before and after to bytes.stt_in / stt_out of the turn.
+    """
+    trim, level = bool(settings.get("STT_TRIM", True)), bool(settings.get("STT_NORMALIZE", True))
+    encoding = settings.get("STT_ENCODING", "flac")
+    if not trim and not level and encoding == "wav":
+        return name, data
+    from . import preprocess  # numpy
+    with metrics.span("stt_prep"):
+        name, data, stats = preprocess.prepare(name, data, trim=trim, level=level, encoding=encoding)
+    if stats:
+        metrics.add_bytes("stt_in", stats["in_bytes"])
+        metrics.add_bytes("stt_out", stats["out_bytes"])
+    return name, data
+
+def transcribe_audio(audio) -> str:
+    """Send audio (a file path or an in-memory WAV) to OpenAI and return text."""
+    if isinstance(audio, io.IOBase):
+        name, data = getattr(audio, "name", "speech.wav"), audio.getvalue()
+    else:
+        with open(audio, "rb") as f:
+            name, data = str(audio), f.read()
+    name, data = prepare_upload(name, data)
+    with metrics.span("stt"):
+        tr = get_gate("OPENAI").call(lambda: get_client().audio.transcriptions.create(
             model="gpt-4o-mini-transcribe",
-            file=f,
-        )
+            file=(name, data),
+        ), hedge=True, stage="stt")
     return tr.text.strip()
+
 # --- runtime toggles & reloads ---
 
+def barge_in_enabled() -> bool:
+    """Listen for the user while John speaks and cut him off (BARGE_IN_VAD)."""
+    return bool(settings.get("BARGE_IN_VAD", False))
+
+def make_barge_in_recorder():
+    """A VADRecorder for hearing the user over John's own voice (BARGE_IN_MIN_RMS)."""
+    from .audio import VADRecorder
+    # without echo cancellation the mic hears the speakers, so this needs to be louder
+    return VADRecorder(min_rms=float(settings.get("BARGE_IN_MIN_RMS", 900)))
+
+_router = None
+_router_lock = threading.Lock()
+
+def get_router():
+    """
+    The local intent router (router.default_router plus "ROUTES" from
+    config.json), built on first use and again after reload_config().
+    Register extra handlers on it with get_router().register(...).
+    """
+    global _router
+    with _router_lock:
+        if _router is None:
+            from .router import default_router
+            _router = default_router(float(settings.get("ROUTER_THRESHOLD", 0.85)), settings.get("ROUTES", {}))
+        return _router
+
+def route_intent(text: str):
+    """A router.Hit when text can be handled locally, else None (ROUTER: false turns it off)."""
+    if not settings.get("ROUTER", True):
+        return None
+    hit = get_router().route(text)
+    if hit is not None:
+        metrics.record("route", hit.latency_s)
+    return hit
+
+def log_routed(session: str, text: str, hit, trace=None):
+    """Log a turn the router handled without an LLM call (intent, score, route_ms)."""
+    log_event({"session": session, "role": "meta", "event": "routed", "content": text,
+               **hit.fields(), **metrics.fields(trace)})
+
+def get_input_budget() -> int:
+    """
+    Prompt tokens available once room for the reply is reserved: the
+    largest completion cap a model tier can ask for, so that a deep turn
+    stays within CONTEXT_TOKENS too.
+    """
+    router = get_tier_router()
+    if settings.get("MODEL_ROUTING", True):
+        reply = router.max_completion_tokens
+    else:
+        reply = int(router.tiers["default"]["max_completion_tokens"])
+    return settings.context_tokens - reply
+
+def get_transcript_lines() -> int:
+    """Lines kept in the GUI transcript (GUI_MAX_LINES); older ones stay in the history log."""
+    return int(settings.get("GUI_MAX_LINES", 2000))
+
+def get_request_timeout() -> float:
+    """Upper bound in seconds for one LLM or voice turn (REQUEST_TIMEOUT_S)."""
+    return float(settings.get("REQUEST_TIMEOUT_S", 90))
+
+def get_summary_min_tokens() -> int:
+    """New evicted tokens needed before re-summarizing (0 disables summaries)."""
+    return int(settings.get("SUMMARY_MIN_TOKENS", 300))
+
+def get_tts_prefetch() -> int:
+    return settings.tts_prefetch
+
+def get_tts_cache_stats() -> dict:
+    """Hit/miss counters and size of the TTS cache (empty if disabled)."""
+    _ensure_caches()
+    return tts_cache.stats() if tts_cache is not None else {}
+
+def get_llm_cache_stats() -> dict:
+    """Hit/miss counters and latency saved by the reply cache (empty if disabled)."""
+    _ensure_caches()
+    return llm_cache.stats() if llm_cache is not None else {}
+
 def get_speak() -> bool:
-    return SPEAK
+    return settings.speak
 
 def set_speak(flag: bool) -> None:
-    global SPEAK
-    SPEAK = bool(flag)
+    settings.speak = flag
 
 def reload_config() -> dict:
     """
     Re-read config.json and system_prompt.txt at runtime.
     Returns a small dict with current settings for the UI.
     """
-    global cfg, client, MODEL, SPEAK, SYSTEM_PROMPT, eleven
-    with open("config.json", "r", encoding="utf-8") as f:
-        cfg = json.load(f)
-    client = OpenAI(api_key=cfg["OPENAI_API_KEY"])
-    MODEL = cfg.get("MODEL", "gpt-5-nano")
-    SPEAK = bool(cfg.get("SPEAK", False))
-    with open("system_prompt.txt", "r", encoding="utf-8") as f:
-        SYSTEM_PROMPT = f.read().strip()
-    eleven = ElevenLabs(api_key=cfg.get("ELEVEN_API_KEY"))
-    return {"model": MODEL, "speak": SPEAK}
-
+    global _client, _eleven, _router, _tiers
+    old_llm = _llm_cache_settings()
+    settings.load()
+    with _router_lock:
+        _router = None  # ROUTES / ROUTER_THRESHOLD may have changed
+    with _tiers_lock:
+        _tiers = None  # so may MODEL / MODEL_TIERS / MODEL_RULES
+    # only clients whose key or HTTP settings changed are rebuilt; the others
+    # keep their pools (and open connections) across a prompt-only reload
+    rebuilt = []
+    with _clients_lock:
+        if _client is not None and _client_sig != _client_signature("OPENAI"):
+            _client = None
+            rebuilt.append("OPENAI")
+        if _eleven is not None and _eleven_sig != _client_signature("ELEVEN"):
+            _eleven = None
+            rebuilt.append("ELEVEN")
+        for provider in rebuilt:
+            _retire_http(_http.pop(provider, None))
+    if rebuilt and _warmup_enabled():
+        threading.Thread(target=warm_up, args=(rebuilt,), daemon=True).start()
+    _ensure_caches()
+    _init_tts_cache()
+    if _llm_cache_settings() != old_llm:
+        # replies cached for the old prompt/model are stale now
+        if llm_cache is not None:
+            llm_cache.clear()
+        _init_llm_cache()
+    return {"model": settings.model, "speak": settings.speak}
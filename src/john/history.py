@@ -0,0 +1,422 @@
+# src/john/history.py
+"""
+Chat history store.
+
+Events are appended to size/time-bounded JSONL segments under one
+directory, with an append-only sidecar index (index.jsonl) that maps each
+session to (segment, byte offset, length) spans and their time range, so a
+session can be read back without parsing everything ever logged.
+
+    logs/history/
+      000001-20250813T183907.jsonl.gz   # cold, compressed
+      000002-20250814T090000.jsonl      # active
+      index.jsonl
+
+CLI:
+    python -m src.john.history sessions [--since ISO] [--until ISO]
+    python -m src.john.history show SESSION
+    python -m src.john.history import logs/history.jsonl
+    python -m src.john.history reindex
+    python -m src.john.history compress
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import queue
+import atexit
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime, UTC
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+INDEX_NAME = "index.jsonl"
+
+def _segment_name(seq: int, started: float) -> str:
+    stamp = datetime.fromtimestamp(started, UTC).strftime("%Y%m%dT%H%M%S")
+    return f"{seq:06d}-{stamp}.jsonl"
+
+def _parse_segment(name: str) -> tuple[int, float] | None:
+    """(seq, start time) from a segment file name, or None."""
+    base = name[:-3] if name.endswith(".gz") else name
+    if not base.endswith(".jsonl") or base == INDEX_NAME:
+        return None
+    try:
+        seq, stamp = base[:-6].split("-", 1)
+        started = datetime.strptime(stamp, "%Y%m%dT%H%M%S").replace(tzinfo=UTC).timestamp()
+        return int(seq), started
+    except ValueError:
+        return None
+
+def _list_segments(root: str) -> list[tuple[int, float, str]]:
+    """All segments in `root` as (seq, start time, file name), oldest first."""
+    out = []
+    for name in os.listdir(root) if os.path.isdir(root) else []:
+        parsed = _parse_segment(name)
+        if parsed:
+            out.append((*parsed, name))
+    return sorted(out)
+
+def _spans(lines: list[tuple[dict, bytes]], segment: str, start: int) -> list[dict]:
+    """Index records for a run of encoded events written at byte `start` of `segment`."""
+    records = []
+    current = None
+    pos = start
+    for event, line in lines:
+        session = event.get("session")
+        ts = event.get("ts")
+        if current is not None and current["session"] == session and current["offset"] + current["length"] == pos:
+            current["length"] += len(line)
+            current["last_ts"] = ts or current["last_ts"]
+        else:
+            if current is not None and current["session"]:
+                records.append(current)
+            current = {"session": session, "segment": segment, "offset": pos,
+                       "length": len(line), "first_ts": ts, "last_ts": ts}
+        pos += len(line)
+    if current is not None and current["session"]:
+        records.append(current)
+    return records
+
+@contextmanager
+def _locked(f):
+    """Hold an exclusive lock on an open file, across processes (blocks until it's free)."""
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+    try:
+        yield
+    finally:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def compress_segment(root: str, name: str):
+    """Gzip a closed segment in place (atomically); offsets in the index stay valid."""
+    src = os.path.join(root, name)
+    tmp = src + ".gz.tmp"
+    with open(src, "rb") as fin, gzip.open(tmp, "wb") as fout:
+        while chunk := fin.read(1 << 20):
+            fout.write(chunk)
+    os.replace(tmp, src + ".gz")
+    os.remove(src)
+
+class HistoryWriter:
+    """
+    Append-only segmented JSONL writer that runs on a background thread.
+    log() only puts the event on a bounded queue; the writer thread
+    group-commits whatever is queued, flushing every `batch` events or
+    every `flush_ms` milliseconds, whichever comes first, then appends the
+    batch's session spans to the index.
+    A new segment starts once the active one reaches `segment_bytes` or is
+    older than `segment_s`; with `compress` the closed one is gzipped.
+    fsync policy: "off" (leave it to the OS), "batch" (after every group
+    commit) or "periodic" (at most every `fsync_s` seconds).
+    Pending events are flushed by close(), which also runs at exit.
+    Callbacks added with subscribe() get each committed batch, on the
+    writer thread.
+    Several processes can write to one directory: each commit holds an
+    exclusive lock on the index while it picks up the newest segment,
+    appends at its real end of file and indexes the batch.
+    """
+    _STOP = object()
+
+    def __init__(self, root: str, batch: int = 64, flush_ms: int = 200,
+                 fsync: str = "off", fsync_s: float = 5.0, max_queue: int = 10000,
+                 segment_bytes: int = 16 * 1024 * 1024, segment_s: float = 86400,
+                 compress: bool = False):
+        if fsync not in ("off", "batch", "periodic"):
+            raise ValueError(f"unknown fsync policy: {fsync!r}")
+        self.root = root
+        self.batch = batch
+        self.flush_s = flush_ms / 1000
+        self.fsync = fsync
+        self.fsync_s = fsync_s
+        self.segment_bytes = segment_bytes
+        self.segment_s = segment_s
+        self.compress = compress
+        self.written = 0
+        self._q = queue.Queue(maxsize=max_queue)
+        self._last_fsync = time.monotonic()
+        self._closed = False
+        self._listeners = []
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, event: dict):
+        """Queue one event (blocks only if the writer is far behind)."""
+        if self._closed:
+            raise RuntimeError("history writer is closed")
+        self._q.put(event)
+
+    def subscribe(self, fn):
+        """Call fn(events) after every group commit (keep it quick: it delays the next one)."""
+        self._listeners.append(fn)
+
+    def close(self, timeout: float = 5.0):
+        """Flush everything queued so far and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._q.put(self._STOP)
+        self._thread.join(timeout)
+
+    def _open_segment(self):
+        """Reopen the newest plain segment, or start the first one."""
+        segments = [s for s in _list_segments(self.root) if not s[2].endswith(".gz")]
+        if segments:
+            self._seq, self._started, self._name = segments[-1]
+        else:
+            last = _list_segments(self.root)
+            self._seq, self._started = (last[-1][0] + 1 if last else 1), time.time()
+            self._name = _segment_name(self._seq, self._started)
+        self._seg = open(os.path.join(self.root, self._name), "ab")
+
+    def _follow(self):
+        """Switch to a newer segment if another process has rotated since our last commit."""
+        newest = _list_segments(self.root)
+        if newest and newest[-1][0] > self._seq and not newest[-1][2].endswith(".gz"):
+            self._seg.close()
+            self._seq, self._started, self._name = newest[-1]
+            self._seg = open(os.path.join(self.root, self._name), "ab")
+
+    def _rotate(self):
+        old = self._name
+        self._seg.close()
+        self._seq, self._started = max(self._seq, _list_segments(self.root)[-1][0]) + 1, time.time()
+        self._name = _segment_name(self._seq, self._started)
+        self._seg = open(os.path.join(self.root, self._name), "ab")
+        if self.compress:
+            try:
+                compress_segment(self.root, old)
+            except OSError as e:
+                print(f"[Log error] {e}")
+
+    def _run(self):
+        os.makedirs(self.root, exist_ok=True)
+        self._open_segment()
+        with open(os.path.join(self.root, INDEX_NAME), "a", encoding="utf-8") as index:
+            stop = False
+            while not stop:
+                events = []
+                item = self._q.get()
+                deadline = time.monotonic() + self.flush_s
+                while True:
+                    if item is self._STOP:
+                        stop = True
+                        break
+                    events.append(item)
+                    remaining = deadline - time.monotonic()
+                    if len(events) >= self.batch or remaining <= 0:
+                        break
+                    try:
+                        item = self._q.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                self._commit(index, events, final=stop)
+        self._seg.close()
+
+    def _commit(self, index, events: list[dict], final: bool = False):
+        try:
+            if events:
+                lines = [(e, (json.dumps(e, ensure_ascii=False) + "\n").encode("utf-8")) for e in events]
+                with _locked(index):
+                    self._follow()
+                    # other processes append too: the real end of file, not our own tell()
+                    pos = os.fstat(self._seg.fileno()).st_size
+                    if pos and (pos >= self.segment_bytes or time.time() - self._started >= self.segment_s):
+                        self._rotate()
+                        pos = 0
+                    self._seg.write(b"".join(line for _, line in lines))
+                    self._seg.flush()
+                    # data first, then the index: a crash can only lose index entries (see reindex)
+                    index.write("".join(json.dumps(r) + "\n" for r in _spans(lines, self._name, pos)))
+                    index.flush()
+            now = time.monotonic()
+            due = self.fsync == "batch" or (self.fsync == "periodic" and (final or now - self._last_fsync >= self.fsync_s))
+            if due and (events or final):
+                os.fsync(self._seg.fileno())
+                os.fsync(index.fileno())
+                self._last_fsync = now
+            self.written += len(events)
+        except Exception as e:
+            print(f"[Log error] {e}")
+            return
+        if events:
+            for fn in self._listeners:
+                try:
+                    fn(events)
+                except Exception as e:
+                    print(f"[Log error] {e}")
+
+class HistoryReader:
+    """Look up and replay sessions using the sidecar index."""
+    def __init__(self, root: str):
+        self.root = root
+        self._spans = {}  # session -> [index records]
+        self._index_pos = 0
+        self.refresh()
+
+    def refresh(self):
+        """Pick up index entries appended since the last call."""
+        path = os.path.join(self.root, INDEX_NAME)
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            f.seek(self._index_pos)
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break  # partially written line; read it next time
+                self._index_pos += len(raw)
+                try:
+                    rec = json.loads(raw)
+                except ValueError:
+                    continue
+                self._spans.setdefault(rec["session"], []).append(rec)
+
+    def sessions(self, since: str | None = None, until: str | None = None) -> list[dict]:
+        """Sessions with their time range and event span count, oldest first."""
+        out = []
+        for session, spans in self._spans.items():
+            first = min((s["first_ts"] for s in spans if s["first_ts"]), default=None)
+            last = max((s["last_ts"] for s in spans if s["last_ts"]), default=None)
+            if since and last and last < since:
+                continue
+            if until and first and first > until:
+                continue
+            out.append({"session": session, "first_ts": first, "last_ts": last,
+                        "segments": sorted({s["segment"] for s in spans})})
+        return sorted(out, key=lambda s: s["first_ts"] or "")
+
+    def _open(self, segment: str):
+        path = os.path.join(self.root, segment)
+        if os.path.exists(path):
+            return open(path, "rb")
+        return gzip.open(path + ".gz", "rb")
+
+    def read_session(self, session: str):
+        """Yield a session's events in order, seeking straight to its spans."""
+        spans = self._spans.get(session, [])
+        by_segment = {}
+        for s in spans:
+            by_segment.setdefault(s["segment"], []).append(s)
+        for segment in sorted(by_segment):
+            with self._open(segment) as f:
+                for s in sorted(by_segment[segment], key=lambda s: s["offset"]):
+                    f.seek(s["offset"])
+                    for line in f.read(s["length"]).splitlines():
+                        try:
+                            event = json.loads(line)
+                        except ValueError:
+                            continue  # blank, torn or hand-edited line
+                        yield event
+
+    def iter_events(self, since: str | None = None, until: str | None = None):
+        """
+        Stream every event (optionally within a ts range), segment by
+        segment. With `since`, the index's time ranges are used to skip
+        segments, and the start of segments, that only hold older events.
+        """
+        by_segment = {}
+        if since:
+            for spans in self._spans.values():
+                for s in spans:
+                    by_segment.setdefault(s["segment"], []).append(s)
+        segments = _list_segments(self.root)
+        for i, (_, _, name) in enumerate(segments):
+            start = 0
+            spans = by_segment.get(name[:-3] if name.endswith(".gz") else name)
+            if spans:
+                newer = [s["offset"] for s in spans if (s["last_ts"] or "") >= since]
+                if newer:
+                    start = min(newer)
+                elif i < len(segments) - 1:
+                    continue  # closed, and everything in it is older
+                else:
+                    # the active segment: only a tail the index hasn't seen yet can be newer
+                    start = max(s["offset"] + s["length"] for s in spans)
+            opener = gzip.open if name.endswith(".gz") else open
+            with opener(os.path.join(self.root, name), "rb") as f:
+                f.seek(start)
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        continue
+                    ts = event.get("ts") or ""
+                    if (since and ts < since) or (until and ts > until):
+                        continue
+                    yield event
+
+def reindex(root: str):
+    """Rebuild index.jsonl from the segments (after a crash or a manual edit)."""
+    tmp = os.path.join(root, INDEX_NAME + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as index:
+        for _, _, name in _list_segments(root):
+            plain = name[:-3] if name.endswith(".gz") else name
+            opener = gzip.open if name.endswith(".gz") else open
+            with opener(os.path.join(root, name), "rb") as f:
+                lines = []
+                for line in f:
+                    try:
+                        lines.append((json.loads(line), line))
+                    except ValueError:
+                        lines.append(({}, line))
+            index.write("".join(json.dumps(r) + "\n" for r in _spans(lines, plain, 0)))
+    os.replace(tmp, os.path.join(root, INDEX_NAME))
+
+def import_file(root: str, path: str):
+    """Copy a flat history.jsonl (the old single-file format) into the store."""
+    writer = HistoryWriter(root, batch=1000, flush_ms=50)
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                writer.log(json.loads(line))
+    writer.close(timeout=None)
+
+def compress_cold(root: str):
+    """Gzip every closed segment (all but the newest plain one)."""
+    plain = [name for _, _, name in _list_segments(root) if not name.endswith(".gz")]
+    for name in plain[:-1]:
+        compress_segment(root, name)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m src.john.history", description="Inspect the John history store.")
+    ap.add_argument("--dir", default="logs/history")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("sessions")
+    p.add_argument("--since")
+    p.add_argument("--until")
+    sub.add_parser("show").add_argument("session")
+    sub.add_parser("import").add_argument("path")
+    sub.add_parser("reindex")
+    sub.add_parser("compress")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "sessions":
+        for s in HistoryReader(args.dir).sessions(args.since, args.until):
+            print(f"{s['session']}  {s['first_ts']}  {s['last_ts']}")
+    elif args.cmd == "show":
+        for event in HistoryReader(args.dir).read_session(args.session):
+            sys.stdout.write(json.dumps(event, ensure_ascii=False) + "\n")
+    elif args.cmd == "import":
+        import_file(args.dir, args.path)
+    elif args.cmd == "reindex":
+        reindex(args.dir)
+    elif args.cmd == "compress":
+        compress_cold(args.dir)
+
+if __name__ == "__main__":
+    main()
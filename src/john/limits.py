@@ -0,0 +1,398 @@
+# src/john/limits.py
+"""
+Call execution for provider APIs: a token bucket (requests per second), an
+AIMD concurrency limit, jittered retries that honour Retry-After, and
+optional hedged duplicates for calls that run past their p95 latency.
+One Gate per provider, shared by the sync core API and the async engine.
+"""
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from . import metrics
+
+class TokenBucket:
+    """`rate` requests per second with bursts of up to `burst`."""
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take one token; returns how long the caller must wait before using it."""
+        with self._lock:
+            if self.rate <= 0:
+                return 0.0
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def hold(self, seconds: float):
+        """Hand out nothing for `seconds` (a provider said Retry-After)."""
+        with self._lock:
+            if self.rate <= 0:
+                return
+            now = time.monotonic()
+            self._tokens = min(self._tokens, -seconds * self.rate)
+            self._stamp = now
+
+class AIMDLimit:
+    """
+    Concurrency limit that grows by one per "window" of fast successes and
+    is cut multiplicatively on overload (429) or slow calls.
+    """
+    def __init__(self, initial: int, min_limit: int, max_limit: int,
+                 latency_target_s: float, backoff: float = 0.5):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.latency_target_s = latency_target_s
+        self.backoff = backoff
+        self.in_flight = 0
+        self._waiters = deque()  # objects with .set(), woken in FIFO order
+        self._lock = threading.Lock()
+
+    def try_acquire(self, waiter=None) -> bool:
+        """Take a slot, or queue `waiter` to be set() when one frees up."""
+        with self._lock:
+            if self.in_flight < int(self.limit) and not self._waiters:
+                self.in_flight += 1
+                return True
+            if waiter is not None:
+                self._waiters.append(waiter)
+            return False
+
+    def acquire(self):
+        event = threading.Event()
+        if not self.try_acquire(event):
+            event.wait()  # release() handed its slot straight to us
+
+    def forget(self, waiter):
+        """Withdraw a queued waiter; gives its slot back if one was already handed over."""
+        with self._lock:
+            try:
+                self._waiters.remove(waiter)
+                return
+            except ValueError:
+                pass
+        self.release()
+
+    def release(self):
+        with self._lock:
+            if self._waiters and self.in_flight <= int(self.limit):
+                # pass the slot on without dropping in_flight
+                self._waiters.popleft().set()
+            else:
+                self.in_flight -= 1
+                self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            self._waiters.popleft().set()
+
+    def on_success(self, latency: float):
+        with self._lock:
+            if self.latency_target_s and latency > self.latency_target_s:
+                self.limit = max(self.min_limit, self.limit * 0.9)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self._wake()
+
+    def on_overload(self):
+        with self._lock:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+
+class LatencyTracker:
+    """Rolling window of call latencies."""
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, latency: float):
+        with self._lock:
+            self._samples.append(latency)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, p: float) -> float | None:
+        with self._lock:
+            if not self._samples:
+                return None
+            data = sorted(self._samples)
+        return data[min(len(data) - 1, int(p / 100 * len(data)))]
+
+class _AsyncWaiter:
+    """AIMDLimit waiter that resolves an asyncio future from any thread."""
+    def __init__(self, loop):
+        self.loop = loop
+        self.future = loop.create_future()
+
+    def set(self):
+        def resolve():
+            if not self.future.done():
+                self.future.set_result(None)
+        self.loop.call_soon_threadsafe(resolve)
+
+_RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+_RETRYABLE_ERRORS = {"APIConnectionError", "APITimeoutError", "TransportError", "TimeoutException"}
+
+def status_of(exc) -> int | None:
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+def retry_after(exc) -> float | None:
+    """Seconds from a Retry-After / retry-after-ms header on the error, if any."""
+    headers = getattr(exc, "headers", None) or getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass  # HTTP-date form: fall back to our own backoff
+    return None
+
+def is_retryable(exc) -> bool:
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    if any(c.__name__ in _RETRYABLE_ERRORS for c in type(exc).__mro__):
+        return True
+    return status_of(exc) in _RETRYABLE_STATUS
+
+class Gate:
+    """
+    Run provider calls through one rate limit, concurrency limit and retry
+    policy. `fn` is a zero-argument callable doing one request (a coroutine
+    function for acall). With `hedge`, a second copy is started once the
+    first has run longer than the observed p95, and the first result wins;
+    `discard` receives the loser's result (e.g. to close a stream). With
+    `stage`, the time spent waiting for the bucket and a slot is recorded
+    as "<stage>_queue" on the current metrics trace. Latencies are tracked
+    per `track` (default: the stage), so a hedge waits for the p95 of calls
+    like this one, not of everything sent to the provider.
+    """
+    def __init__(self, name: str, rps: float = 0, burst: float = 10,
+                 max_concurrent: int = 8, min_concurrent: int = 1,
+                 latency_target_s: float = 0, retries: int = 3,
+                 backoff_s: float = 0.5, max_backoff_s: float = 20,
+                 hedge: bool = False, hedge_min_samples: int = 20):
+        self.name = name
+        self.bucket = TokenBucket(rps, burst)
+        self.limit = AIMDLimit(max_concurrent, min_concurrent, max_concurrent, latency_target_s)
+        self.latency = LatencyTracker()  # all calls, for stats()
+        self._tracks = {}  # track -> LatencyTracker
+        self._tracks_lock = threading.Lock()
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.counts = {"calls": 0, "retries": 0, "throttled": 0, "failures": 0, "hedges": 0, "hedge_wins": 0}
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _count(self, key: str):
+        self.counts[key] += 1  # counters only; an occasional lost update is fine
+
+    def _tracker(self, track: str | None) -> LatencyTracker:
+        with self._tracks_lock:
+            tracker = self._tracks.get(track)
+            if tracker is None:
+                tracker = self._tracks[track] = LatencyTracker()
+            return tracker
+
+    def _observe(self, track: str | None, latency: float):
+        self.latency.add(latency)
+        self._tracker(track).add(latency)
+        self.limit.on_success(latency)
+
+    def _hedge_after(self, hedge: bool, track: str | None) -> float | None:
+        if not (hedge and self.hedge):
+            return None
+        tracker = self._tracker(track)
+        if len(tracker) < self.hedge_min_samples:
+            return None
+        if self.limit.in_flight >= int(self.limit.limit):
+            return None  # saturated: a duplicate would only add load
+        return tracker.percentile(95)
+
+    def _delay(self, attempt: int, exc) -> float:
+        wait_s = retry_after(exc)
+        if wait_s is not None:
+            return wait_s + random.uniform(0, min(1.0, wait_s * 0.1))
+        # "full jitter" exponential backoff
+        return random.uniform(0, min(self.max_backoff_s, self.backoff_s * 2 ** attempt))
+
+    def _failed(self, attempt: int, exc) -> float | None:
+        """Record a failure; returns the delay before the next try, or None to give up."""
+        if status_of(exc) == 429:
+            self._count("throttled")
+            self.limit.on_overload()
+            wait_s = retry_after(exc)
+            if wait_s:
+                self.bucket.hold(wait_s)
+        if attempt >= self.retries or not is_retryable(exc):
+            self._count("failures")
+            return None
+        self._count("retries")
+        return self._delay(attempt, exc)
+
+    # --- sync ---
+    def _once(self, fn, stage: str | None, track: str | None):
+        t0 = time.perf_counter()
+        time.sleep(self.bucket.reserve())
+        self.limit.acquire()
+        if stage:
+            metrics.record(f"{stage}_queue", time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        try:
+            result = fn()
+        finally:
+            self.limit.release()
+        self._observe(track, time.perf_counter() - t0)
+        return result
+
+    def call(self, fn, hedge: bool = False, discard=None, stage: str | None = None, track: str | None = None):
+        self._count("calls")
+        track = track or stage
+        attempt = 0
+        while True:
+            try:
+                after = self._hedge_after(hedge, track)
+                if after is None:
+                    return self._once(fn, stage, track)
+                return self._hedged(fn, after, discard, stage, track)
+            except Exception as e:
+                delay = self._failed(attempt, e)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+
+    def _hedged(self, fn, after: float, discard, stage: str | None, track: str | None):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix=f"john-hedge-{self.name}")
+        first = self._pool.submit(contextvars.copy_context().run, self._once, fn, stage, track)
+        done, _ = wait([first], timeout=after)
+        if done:
+            return first.result()
+        self._count("hedges")
+        second = self._pool.submit(contextvars.copy_context().run, self._once, fn, None, track)
+        pending = {first, second}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    if f is second:
+                        self._count("hedge_wins")
+                    for loser in pending:
+                        if not loser.cancel() and discard is not None:
+                            loser.add_done_callback(lambda l: _discard(l, discard))
+                    return f.result()
+        return first.result()  # both failed: raise the original error
+
+    # --- async ---
+    async def _aonce(self, fn, stage: str | None, track: str | None):
+        t0 = time.perf_counter()
+        await asyncio.sleep(self.bucket.reserve())
+        waiter = _AsyncWaiter(asyncio.get_running_loop())
+        if not self.limit.try_acquire(waiter):
+            try:
+                await asyncio.shield(waiter.future)
+            except asyncio.CancelledError:
+                self.limit.forget(waiter)
+                raise
+        if stage:
+            metrics.record(f"{stage}_queue", time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        try:
+            result = await fn()
+        finally:
+            self.limit.release()
+        self._observe(track, time.perf_counter() - t0)
+        return result
+
+    async def acall(self, fn, hedge: bool = False, discard=None, stage: str | None = None,
+                    track: str | None = None):
+        """Async call(); `fn` returns an awaitable, `discard` may be async."""
+        self._count("calls")
+        track = track or stage
+        attempt = 0
+        while True:
+            try:
+                after = self._hedge_after(hedge, track)
+                if after is None:
+                    return await self._aonce(fn, stage, track)
+                return await self._ahedged(fn, after, discard, stage, track)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                delay = self._failed(attempt, e)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def _ahedged(self, fn, after: float, discard, stage: str | None, track: str | None):
+        first = asyncio.ensure_future(self._aonce(fn, stage, track))
+        done, _ = await asyncio.wait({first}, timeout=after)
+        if done:
+            return first.result()
+        self._count("hedges")
+        second = asyncio.ensure_future(self._aonce(fn, None, track))
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.exception() is None:
+                        if t is second:
+                            self._count("hedge_wins")
+                        for loser in pending:
+                            loser.cancel()
+                        if discard is not None:
+                            for other in done - {t}:
+                                if other.exception() is None:
+                                    await _maybe_await(discard(other.result()))
+                        return t.result()
+            return first.result()
+        finally:
+            for t in (first, second):
+                t.cancel()
+
+    def stats(self) -> dict:
+        with self._tracks_lock:
+            tracks = dict(self._tracks)
+        return {
+            **self.counts,
+            "limit": round(self.limit.limit, 2),
+            "in_flight": self.limit.in_flight,
+            **_percentiles(self.latency),
+            "tracks": {str(name): {"n": len(t), **_percentiles(t)} for name, t in tracks.items()},
+        }
+
+def _percentiles(tracker: LatencyTracker) -> dict:
+    p50, p95 = tracker.percentile(50), tracker.percentile(95)
+    return {"p50_s": round(p50, 3) if p50 is not None else None,
+            "p95_s": round(p95, 3) if p95 is not None else None}
+
+def _discard(future, discard):
+    if not future.cancelled() and future.exception() is None:
+        discard(future.result())
+
+async def _maybe_await(value):
+    if asyncio.iscoroutine(value):
+        await value
@@ -0,0 +1,294 @@
+# src/john/memory.py
+"""
+Long-term memory: past user / assistant turns, retrieved by similarity.
+
+Every logged turn is embedded with a local hashing embedder (no model, no
+network): stemmed content words and word bigrams are hashed into `dim`
+signed buckets, log-scaled and L2-normalized. Rows are appended to one float32 matrix,
+and to disk, so the index grows incrementally and is never rebuilt:
+
+    logs/memory/
+      vectors.f32    # row-major float32, `dim` columns
+      items.jsonl    # one {session, role, ts, text} per row
+      state.json     # dim and the newest ts indexed
+
+Turns are identified by (session, ts, role), so events that arrive out of
+order or twice (a catch-up overlapping live logging) are indexed once.
+
+search() scores a query against the matrix in one matrix-vector product
+using the lnc.ltc TF-IDF scheme: document rows carry log tf only, the
+query is weighted by the current IDF of each bucket (document frequencies
+are updated on every add), so weights stay right as the index grows. To
+keep inside a latency budget only the newest rows that fit in it are
+scanned; the per-row cost is measured as it goes.
+"""
+import os
+import re
+import json
+import time
+import zlib
+import threading
+
+import numpy as np
+
+_WORD = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+a an the and or but if then than so of to in on at for with from by as into about up out over
+is are was were be been being am do does did have has had will would can could should shall may might
+i me my mine you your yours he him his she her it its we us our they them their this that these those
+what which who whom whose when where why how there here not no yes just also too very ok okay please
+""".split())
+
+def _stem(word: str) -> str:
+    # crude suffix stripping, enough for "packing" to meet "pack" and "horses" "horse"
+    if len(word) > 5 and word.endswith("ing"):
+        return word[:-3]
+    if len(word) > 4 and word.endswith("ed"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+class HashingEmbedder:
+    """Words and word bigrams (half weight) hashed into `dim` signed buckets; log tf, unit length."""
+    def __init__(self, dim: int = 512, bigram_weight: float = 0.5):
+        self.dim = dim
+        self.bigram_weight = bigram_weight
+
+    def words(self, text: str) -> list[str]:
+        text = text.lower().replace("’", "'").replace("'s ", " ").replace("'", "")
+        return [_stem(w) for w in _WORD.findall(text) if len(w) > 1 and w not in STOPWORDS]
+
+    def embed(self, text: str) -> np.ndarray | None:
+        """Unit vector for text, or None when it has no content words."""
+        words = self.words(text)
+        if not words:
+            return None
+        feats = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        h = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in feats), dtype=np.uint32, count=len(feats))
+        weights = np.full(len(feats), self.bigram_weight, dtype=np.float32)
+        weights[:len(words)] = 1.0
+        # the top bit picks the sign, so colliding features tend to cancel out
+        weights[(h >> 31).astype(bool)] *= -1
+        v = np.zeros(self.dim, dtype=np.float32)
+        np.add.at(v, (h % self.dim).astype(np.intp), weights)
+        v = np.sign(v) * np.log1p(np.abs(v))
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm else None
+
+class MemoryIndex:
+    """
+    Append-only similarity index over past turns, persisted under `root`.
+    add() embeds and appends one turn; search() returns the top-k rows.
+    """
+    def __init__(self, root: str, dim: int = 512, min_words: int = 2):
+        self.root = root
+        self.embedder = HashingEmbedder(dim)
+        self.dim = dim
+        self.min_words = min_words  # "ok thanks" is not worth remembering
+        self.items = []
+        self._seen = set()  # (session, ts, role) of every indexed turn
+        self.last_ts = ""
+        self._vecs = np.zeros((0, dim), dtype=np.float32)
+        self._sessions = np.zeros(0, dtype=np.int32)
+        self._session_ids = {}
+        self.n = 0
+        self._df = np.zeros(dim, dtype=np.int64)
+        self._ns_per_row = 200.0  # scan cost estimate, refined by every search
+        self._lock = threading.Lock()
+        self._vec_file = None
+        self._item_file = None
+        self._dirty_state = False
+        self._load()
+
+    # --- persistence ---
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _load(self):
+        os.makedirs(self.root, exist_ok=True)
+        try:
+            with open(self._path("state.json"), "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        if state.get("dim", self.dim) != self.dim:
+            # another dimension means other buckets: start over
+            for name in ("vectors.f32", "items.jsonl", "state.json"):
+                if os.path.exists(self._path(name)):
+                    os.remove(self._path(name))
+            state = {}
+        items = []
+        if os.path.exists(self._path("items.jsonl")):
+            with open(self._path("items.jsonl"), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        items.append(json.loads(line))
+                    except ValueError:
+                        break  # cut off by a crash; rows after it are dropped too
+        vecs = np.zeros((0, self.dim), dtype=np.float32)
+        if os.path.exists(self._path("vectors.f32")):
+            raw = np.fromfile(self._path("vectors.f32"), dtype=np.float32)
+            vecs = raw[:len(raw) // self.dim * self.dim].reshape(-1, self.dim)
+        n = min(len(items), len(vecs))
+        if n < len(items) or n < len(vecs):
+            # a crash between the two appends: rewrite both at the common length
+            items, vecs = items[:n], vecs[:n]
+            vecs.tofile(self._path("vectors.f32"))
+            with open(self._path("items.jsonl"), "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(it, ensure_ascii=False) + "\n" for it in items)
+        self._reserve(max(1024, n))
+        self._vecs[:n] = vecs
+        self.items = items
+        self.n = n
+        for i, it in enumerate(items):
+            self._sessions[i] = self._session_code(it.get("session"))
+            self._seen.add(_key(it))
+        self._df = np.count_nonzero(self._vecs[:n], axis=0).astype(np.int64)
+        self.last_ts = max([state.get("last_ts") or ""] + [it.get("ts", "") for it in items[-1:]])
+        self._vec_file = open(self._path("vectors.f32"), "ab")
+        self._item_file = open(self._path("items.jsonl"), "a", encoding="utf-8")
+
+    def close(self):
+        with self._lock:
+            self._save_state()
+            for f in (self._vec_file, self._item_file):
+                if f is not None:
+                    f.close()
+            self._vec_file = self._item_file = None
+
+    def _save_state(self):
+        tmp = self._path("state.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "last_ts": self.last_ts, "count": self.n}, f)
+        os.replace(tmp, self._path("state.json"))
+
+    # --- index ---
+    def _reserve(self, rows: int):
+        if rows <= len(self._vecs):
+            return
+        cap = max(rows, 2 * len(self._vecs))
+        vecs = np.zeros((cap, self.dim), dtype=np.float32)
+        vecs[:self.n] = self._vecs[:self.n]
+        sessions = np.zeros(cap, dtype=np.int32)
+        sessions[:self.n] = self._sessions[:self.n]
+        # searches in flight keep the old arrays; new ones see these
+        self._vecs, self._sessions = vecs, sessions
+
+    def _session_code(self, session) -> int:
+        return self._session_ids.setdefault(session, len(self._session_ids))
+
+    def add(self, event: dict) -> bool:
+        """Index one logged user / assistant event (already indexed: skipped)."""
+        return self.add_many([event]) == 1
+
+    def add_many(self, events) -> int:
+        """Index a batch of logged events with one write per file; returns how many were new."""
+        rows = []
+        for event in events:
+            text = (event.get("content") or "").strip()
+            if event.get("role") not in ("user", "assistant") or not text:
+                continue
+            item = {"session": event.get("session"), "role": event["role"], "ts": event.get("ts") or "",
+                    "text": text}
+            if _key(item) in self._seen or len(self.embedder.words(text)) < self.min_words:
+                continue
+            v = self.embedder.embed(text)
+            if v is not None:
+                rows.append((item, v))
+        added = 0
+        with self._lock:
+            vec_bytes, lines = [], []
+            for item, v in rows:
+                key = _key(item)
+                if key in self._seen:
+                    continue  # the same turn twice in one batch, or from another thread
+                self._seen.add(key)
+                self._reserve(self.n + 1)
+                self._vecs[self.n] = v
+                self._sessions[self.n] = self._session_code(item["session"])
+                self._df += v != 0
+                self.items.append(item)
+                self.n += 1
+                self.last_ts = max(self.last_ts, item["ts"])
+                vec_bytes.append(v.tobytes())
+                lines.append(json.dumps(item, ensure_ascii=False) + "\n")
+                added += 1
+                if self.n % 256 == 0:
+                    self._dirty_state = True
+            if added and self._vec_file is not None:
+                self._vec_file.write(b"".join(vec_bytes))
+                self._vec_file.flush()
+                self._item_file.write("".join(lines))
+                self._item_file.flush()
+                if self._dirty_state:
+                    self._save_state()
+                    self._dirty_state = False
+        return added
+
+    def search(self, query: str, k: int = 3, min_score: float = 0.2, exclude_session: str | None = None,
+               budget_ms: float | None = None) -> list[tuple[float, dict]]:
+        """Top-k (score, item) pairs above min_score, newest rows first when over budget."""
+        q = self.embedder.embed(query)
+        if q is None:
+            return []
+        with self._lock:
+            n, vecs, sessions, df = self.n, self._vecs, self._sessions, self._df.copy()
+            skip = self._session_ids.get(exclude_session) if exclude_session is not None else None
+            ns_per_row = self._ns_per_row
+        if n == 0:
+            return []
+        start = 0
+        if budget_ms is not None:
+            # never fewer than a handful of rows, however slow the last scan was
+            start = max(0, n - max(int(budget_ms * 1e6 / ns_per_row), min(n, 256)))
+        t0 = time.perf_counter_ns()
+        idf = np.log((n + 1) / (df + 1)).astype(np.float32) + 1.0
+        qw = q * idf
+        qw /= np.linalg.norm(qw)
+        scores = vecs[start:n] @ qw
+        if skip is not None:
+            scores[sessions[start:n] == skip] = -1.0
+        top = min(k, len(scores))
+        if top == 0:
+            return []
+        best = np.argpartition(-scores, top - 1)[:top]
+        best = best[np.argsort(-scores[best])]
+        elapsed = time.perf_counter_ns() - t0
+        with self._lock:
+            self._ns_per_row = 0.8 * self._ns_per_row + 0.2 * max(1.0, elapsed / max(1, n - start))
+        return [(float(scores[i]), self.items[start + i]) for i in best if scores[i] >= min_score]
+
+    def sync(self, events, batch: int = 256) -> int:
+        """Index events not indexed yet (e.g. replayed from the history store); returns how many."""
+        added, chunk = 0, []
+        for event in events:
+            chunk.append(event)
+            if len(chunk) >= batch:
+                added += self.add_many(chunk)
+                chunk = []
+        added += self.add_many(chunk)
+        with self._lock:
+            self._save_state()
+        return added
+
+def _key(item: dict) -> tuple:
+    return item.get("session"), item.get("ts") or "", item.get("role")
+
+def format_notes(hits: list[tuple[float, dict]], max_chars: int = 240, max_total: int = 1000) -> str:
+    """The memory message: one short dated line per retrieved turn, duplicates dropped."""
+    lines, seen, total = [], set(), 0
+    for _, item in hits:
+        text = " ".join(item["text"].split())
+        if text in seen:
+            continue
+        seen.add(text)
+        if len(text) > max_chars:
+            text = text[:max_chars].rsplit(" ", 1)[0] + " …"
+        who = "User" if item["role"] == "user" else "John"
+        line = f"- [{item.get('ts', '')[:10]}] {who}: {text}"
+        if total + len(line) > max_total:
+            break
+        lines.append(line)
+        total += len(line)
+    return "\n".join(lines)
@@ -0,0 +1,279 @@
+# src/john/metrics.py
+"""
+Per-stage timing for a turn, and a percentile report over the history store.
+
+A front-end starts a Trace per turn (core.begin_trace(); off with
+"TIMING": false). Core wraps each stage in span(); spans land on the trace
+of the current context and are summed per stage (a voice turn may
+transcribe several segments). take() hands over what was recorded since
+the last call, and the front-end attaches it to the event it logs:
+
+    {"role": "assistant", ..., "timing": {"llm_queue_ms": 3.1, "llm_ttft_ms": 412.0,
+     "llm_ms": 1830.5}, "usage": {"model": "gpt-5-nano", "prompt_tokens": 512,
+     "completion_tokens": 96}}
+
+Sizes go in "bytes" the same way (e.g. stt_in / stt_out: captured audio
+versus what was uploaded after preprocessing), and decisions made for the
+turn are attached with note() (e.g. "llm_route": the model tier it ran on).
+
+Report:
+    python -m src.john.metrics [--since ISO] [--until ISO] [--sessions]
+    python -m src.john.metrics --file logs/history.jsonl   # old single-file log
+"""
+import sys
+import json
+import time
+import argparse
+import threading
+import contextvars
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar("john_trace", default=None)
+
+class Trace:
+    """Stage durations (summed per stage) and token usage for one turn."""
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self._stages = {}
+        self._usage = {}
+        self._bytes = {}
+        self._notes = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self._stages[stage] = self._stages.get(stage, 0.0) + seconds
+
+    def mark(self, stage: str):
+        """Record the time since the turn started (first call wins)."""
+        with self._lock:
+            self._stages.setdefault(stage, time.perf_counter() - self.t0)
+
+    def note(self, key: str, value):
+        with self._lock:
+            self._notes[key] = value
+
+    def add_bytes(self, name: str, n: int):
+        with self._lock:
+            self._bytes[name] = self._bytes.get(name, 0) + n
+
+    def add_usage(self, model: str, prompt_tokens: int, completion_tokens: int):
+        with self._lock:
+            u = self._usage
+            u["model"] = model
+            u["prompt_tokens"] = u.get("prompt_tokens", 0) + (prompt_tokens or 0)
+            u["completion_tokens"] = u.get("completion_tokens", 0) + (completion_tokens or 0)
+
+    def take(self) -> dict:
+        """Event fields for everything recorded since the last take()."""
+        with self._lock:
+            stages, usage, sizes, notes = self._stages, self._usage, self._bytes, self._notes
+            self._stages, self._usage, self._bytes, self._notes = {}, {}, {}, {}
+        out = dict(notes)
+        if stages:
+            out["timing"] = {f"{k}_ms": round(v * 1000, 1) for k, v in stages.items()}
+        if usage:
+            out["usage"] = usage
+        if sizes:
+            out["bytes"] = sizes
+        return out
+
+def use(trace: Trace | None) -> Trace | None:
+    """Make `trace` the current one for this thread / task (None = not timing)."""
+    _current.set(trace)
+    return trace
+
+def current() -> Trace | None:
+    return _current.get()
+
+def fields(trace: Trace | None) -> dict:
+    return trace.take() if trace is not None else {}
+
+@contextmanager
+def span(stage: str):
+    """Time a block into the current trace (a no-op when there is none)."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(stage, time.perf_counter() - t0)
+
+def record(stage: str, seconds: float):
+    trace = _current.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+def mark(stage: str):
+    trace = _current.get()
+    if trace is not None:
+        trace.mark(stage)
+
+def note(key: str, value):
+    """Attach a decision or label to the current trace's next event."""
+    trace = _current.get()
+    if trace is not None:
+        trace.note(key, value)
+
+def add_bytes(name: str, n: int):
+    trace = _current.get()
+    if trace is not None:
+        trace.add_bytes(name, n)
+
+def add_usage(model: str, usage):
+    """Token usage from a completion response (`usage` object or None)."""
+    trace = _current.get()
+    if trace is not None and usage is not None:
+        trace.add_usage(model, getattr(usage, "prompt_tokens", 0), getattr(usage, "completion_tokens", 0))
+
+# --- report ---
+# USD per 1M tokens (input, output); override or extend with "PRICES" in config.json
+PRICES = {
+    "gpt-5-nano": (0.05, 0.40),
+    "gpt-5-mini": (0.25, 2.00),
+    "gpt-5": (1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+def _pct(values: list[float], p: float) -> float:
+    data = sorted(values)
+    return data[min(len(data) - 1, int(p / 100 * len(data)))]
+
+def cost(usage: dict, prices: dict) -> float | None:
+    price = prices.get(usage.get("model"))
+    if price is None:
+        return None
+    p_in, p_out = price
+    return (usage.get("prompt_tokens", 0) * p_in + usage.get("completion_tokens", 0) * p_out) / 1e6
+
+def report(events, prices: dict | None = None) -> dict:
+    """Per-stage p50/p95/p99 (ms), sizes, generation speed and cost per session for an event stream."""
+    prices = {**PRICES, **(prices or {})}
+    stages = {}
+    sizes = {}
+    tiers = {}
+    tok_rates = []
+    sessions = {}
+    unpriced = set()
+    for event in events:
+        timing = event.get("timing")
+        usage = event.get("usage")
+        for name, n in (event.get("bytes") or {}).items():
+            sizes.setdefault(name, []).append(n)
+        if not timing and not usage:
+            continue
+        for key, ms in (timing or {}).items():
+            stages.setdefault(key[:-3] if key.endswith("_ms") else key, []).append(ms)
+        s = sessions.setdefault(event.get("session"), {"turns": 0, "prompt_tokens": 0,
+                                                       "completion_tokens": 0, "cost_usd": 0.0})
+        if usage:
+            s["turns"] += 1
+            s["prompt_tokens"] += usage.get("prompt_tokens", 0)
+            s["completion_tokens"] += usage.get("completion_tokens", 0)
+            c = cost(usage, prices)
+            if c is None:
+                unpriced.add(usage.get("model"))
+            else:
+                s["cost_usd"] += c
+            route = event.get("llm_route")
+            if route:
+                t = tiers.setdefault(route.get("tier"), {"turns": 0, "llm_ms": [], "completion_tokens": 0,
+                                                         "cost_usd": 0.0})
+                t["turns"] += 1
+                t["completion_tokens"] += usage.get("completion_tokens", 0)
+                t["cost_usd"] += c or 0.0
+                if (timing or {}).get("llm_ms"):
+                    t["llm_ms"].append(timing["llm_ms"])
+            # generation speed: completion tokens over the time after the first token
+            gen_ms = (timing or {}).get("llm_ms", 0) - (timing or {}).get("llm_ttft_ms", 0)
+            if gen_ms > 0 and usage.get("completion_tokens"):
+                tok_rates.append(usage["completion_tokens"] / (gen_ms / 1000))
+    out = {
+        "stages": {name: {"n": len(v), **{f"p{p}": round(_pct(v, p), 1) for p in (50, 95, 99)}}
+                   for name, v in sorted(stages.items())},
+        "sessions": {k: v for k, v in sessions.items() if v["turns"]},
+    }
+    if tiers:
+        out["tiers"] = {name: {"turns": t["turns"], "mean_completion_tokens": round(t["completion_tokens"] / t["turns"], 1),
+                               "cost_usd": round(t["cost_usd"], 6),
+                               **({f"llm_p{p}": round(_pct(t["llm_ms"], p), 1) for p in (50, 95)} if t["llm_ms"] else {})}
+                        for name, t in sorted(tiers.items(), key=lambda kv: str(kv[0]))}
+    if sizes:
+        out["bytes"] = {name: {"n": len(v), "total": sum(v), "p50": _pct(v, 50), "p95": _pct(v, 95)}
+                        for name, v in sorted(sizes.items())}
+    if tok_rates:
+        out["tokens_per_s"] = {f"p{p}": round(_pct(tok_rates, p), 1) for p in (50, 95, 99)}
+    costs = [s["cost_usd"] for s in out["sessions"].values()]
+    if costs:
+        out["cost_usd"] = {"total": round(sum(costs), 6), "per_session_mean": round(sum(costs) / len(costs), 6),
+                           "per_session_p95": round(_pct(costs, 95), 6)}
+    if unpriced:
+        out["unpriced_models"] = sorted(m for m in unpriced if m)
+    return out
+
+def _iter_file(path: str, since: str | None, until: str | None):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            ts = event.get("ts") or ""
+            if (since and ts < since) or (until and ts > until):
+                continue
+            yield event
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m src.john.metrics",
+                                 description="Per-stage latency percentiles, token speed and cost from the history log.")
+    ap.add_argument("--dir", default=None, help="history store (default: LOG_DIR)")
+    ap.add_argument("--file", help="read a flat JSONL log instead of the store")
+    ap.add_argument("--since")
+    ap.add_argument("--until")
+    ap.add_argument("--sessions", action="store_true", help="list cost per session")
+    ap.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = ap.parse_args(argv)
+
+    from .core import settings, get_log_dir
+    from .history import HistoryReader
+    if args.file:
+        events = _iter_file(args.file, args.since, args.until)
+    else:
+        events = HistoryReader(args.dir or get_log_dir()).iter_events(args.since, args.until)
+    prices = {k: tuple(v) for k, v in settings.get("PRICES", {}).items()}
+    r = report(events, prices)
+
+    if args.json:
+        json.dump(r, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+    print(f"{'stage':16} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, s in r["stages"].items():
+        print(f"{name:16} {s['n']:>6} {s['p50']:>9} {s['p95']:>9} {s['p99']:>9}")
+    for name, b in r.get("bytes", {}).items():
+        print(f"{name + ' bytes':16} {b['n']:>6} {b['p50']:>9} {b['p95']:>9}   total {b['total']}")
+    if "stt_in" in r.get("bytes", {}) and "stt_out" in r["bytes"]:
+        saved = 1 - r["bytes"]["stt_out"]["total"] / max(1, r["bytes"]["stt_in"]["total"])
+        print(f"audio uploads {saved:.0%} smaller after preprocessing")
+    for name, t in r.get("tiers", {}).items():
+        print(f"tier {name}: {t['turns']} turns, llm p50 {t.get('llm_p50', '-')} ms / p95 {t.get('llm_p95', '-')} ms, "
+              f"{t['mean_completion_tokens']} tokens out on average, ${t['cost_usd']:.4f}")
+    if "tokens_per_s" in r:
+        t = r["tokens_per_s"]
+        print(f"\ngeneration: {t['p50']} tok/s p50, {t['p95']} p95, {t['p99']} p99")
+    if "cost_usd" in r:
+        c = r["cost_usd"]
+        print(f"cost: ${c['total']:.4f} over {len(r['sessions'])} sessions "
+              f"(mean ${c['per_session_mean']:.4f}, p95 ${c['per_session_p95']:.4f})")
+    if r.get("unpriced_models"):
+        print(f"no price for: {', '.join(r['unpriced_models'])} (add them to PRICES in config.json)")
+    if args.sessions:
+        for sid, s in r["sessions"].items():
+            print(f"{sid}  {s['turns']:>4} turns  {s['prompt_tokens']:>7} in  "
+                  f"{s['completion_tokens']:>6} out  ${s['cost_usd']:.5f}")
+
+if __name__ == "__main__":
+    main()
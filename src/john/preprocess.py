@@ -0,0 +1,125 @@
+# src/john/preprocess.py
+"""
+Shrink captured speech before it is uploaded for transcription.
+
+prepare() takes the WAV a recorder produced, trims leading and trailing
+silence (frame RMS, vectorized over the whole clip), normalizes the peak
+level and re-encodes it: FLAC (lossless, about half the size of WAV for
+speech) or Ogg Vorbis (lossy, much smaller) when the optional `soundfile`
+package is installed, plain WAV otherwise. Anything that is not 16-bit
+PCM WAV (e.g. an mp3 posted to the server) is passed through untouched.
+"""
+import io
+import wave
+
+import numpy as np
+
+ENCODINGS = ("flac", "ogg", "wav")
+
+def decode_wav(data: bytes) -> tuple[np.ndarray, int] | None:
+    """Mono int16 samples and sample rate of a 16-bit PCM WAV, or None."""
+    try:
+        with wave.open(io.BytesIO(data), "rb") as w:
+            if w.getsampwidth() != 2:
+                return None
+            rate, channels = w.getframerate(), w.getnchannels()
+            frames = w.readframes(w.getnframes())
+    except (wave.Error, EOFError):
+        return None
+    samples = np.frombuffer(frames, dtype="<i2")
+    if channels > 1:
+        samples = samples[:len(samples) // channels * channels].reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return samples, rate
+
+def trim_silence(samples: np.ndarray, samplerate: int, frame_ms: int = 20,
+                 min_rms: float = 200.0, rel_db: float = -35.0, pad_s: float = 0.2) -> np.ndarray:
+    """
+    Cut the silence before the first and after the last voiced frame,
+    keeping `pad_s` on each side. A frame is voiced above `min_rms` and
+    within `rel_db` of the loudest frame. Clips with no voiced frame are
+    returned as they are.
+    """
+    n = max(1, int(samplerate * frame_ms / 1000))
+    count = len(samples) // n
+    if count == 0:
+        return samples
+    frames = samples[:count * n].astype(np.float32).reshape(count, n)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    threshold = max(min_rms, float(rms.max()) * 10 ** (rel_db / 20))
+    voiced = np.flatnonzero(rms > threshold)
+    if len(voiced) == 0:
+        return samples
+    pad = int(pad_s * samplerate)
+    start = max(0, int(voiced[0]) * n - pad)
+    end = min(len(samples), (int(voiced[-1]) + 1) * n + pad)
+    return samples[start:end]
+
+def normalize(samples: np.ndarray, peak: float = 0.9, max_gain: float = 8.0,
+              min_rms: float = 200.0) -> np.ndarray:
+    """
+    Scale so the loudest sample sits at `peak` of full scale (gain capped
+    at `max_gain`). Clips quieter than `min_rms` overall are left alone:
+    boosting them would only amplify noise.
+    """
+    if len(samples) == 0:
+        return samples
+    x = samples.astype(np.float32)
+    if np.sqrt(np.mean(x * x)) < min_rms:
+        return samples
+    top = int(np.abs(samples.astype(np.int32)).max())
+    if top == 0:
+        return samples
+    gain = min(max_gain, peak * 32767 / top)
+    if abs(gain - 1.0) < 0.05:
+        return samples
+    return np.clip(np.rint(samples.astype(np.float32) * gain), -32768, 32767).astype(np.int16)
+
+def encode(samples: np.ndarray, samplerate: int, encoding: str = "flac") -> tuple[str, bytes]:
+    """(file name, bytes) of samples in `encoding`; falls back to WAV without soundfile."""
+    if encoding in ("flac", "ogg"):
+        try:
+            import soundfile as sf
+        except ImportError:
+            pass
+        else:
+            buf = io.BytesIO()
+            if encoding == "flac":
+                sf.write(buf, samples, samplerate, format="FLAC", subtype="PCM_16")
+            else:
+                sf.write(buf, samples, samplerate, format="OGG", subtype="VORBIS")
+            return f"speech.{encoding}", buf.getvalue()
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(samplerate)
+        w.writeframes(samples.astype("<i2").tobytes())
+    return "speech.wav", buf.getvalue()
+
+def prepare(name: str, data: bytes, trim: bool = True, level: bool = True,
+            encoding: str = "flac") -> tuple[str, bytes, dict]:
+    """
+    (name, data, stats) ready for upload. stats has the byte counts and
+    durations before and after, empty when the input was passed through.
+    """
+    decoded = decode_wav(data)
+    if decoded is None:
+        return name, data, {}
+    samples, rate = decoded
+    out = samples
+    if trim:
+        out = trim_silence(out, rate)
+    if level:
+        out = normalize(out)
+    stats = {"in_bytes": len(data), "in_s": round(len(samples) / rate, 2)}
+    if out is not samples or encoding != "wav":
+        # trimmed / leveled samples are always kept; size only picks the container
+        candidates = [encode(out, rate, encoding)]
+        if encoding != "wav":
+            candidates.append(encode(out, rate, "wav"))
+        if out is samples:
+            candidates.append((name, data))
+        name, data = min(candidates, key=lambda c: len(c[1]))
+        samples = out
+    stats.update(out_bytes=len(data), out_s=round(len(samples) / rate, 2))
+    return name, data, stats
@@ -0,0 +1,239 @@
+# src/john/router.py
+"""
+Local fast path in front of the LLM: typed or spoken commands ("exit",
+"clear", "mute", "reload") and trivial questions (time, date, greetings)
+are recognized by fuzzy matching and handled without a paid round-trip.
+
+Each route has example phrases and either an `action` (a command the
+front-end carries out) or an `answer(text)` callable (a canned local
+reply). The whole message is compared with every phrase (difflib ratio
+over normalized text); the best score wins if it reaches the route's
+threshold, anything else falls through to the LLM. Routes with keywords
+(time, date) also need one of them in the message, so "what is the rate"
+is not a date question. Strict routes (exit, clear: they end or wipe the
+conversation) only take an exact match or a single typo, see is_typo().
+More routes can be registered at runtime or with "ROUTES" in config.json:
+
+    "ROUTES": {"wifi": {"phrases": ["wifi password", "what is the wifi password"],
+                        "reply": "It's on the fridge."}}
+"""
+import re
+import time
+from datetime import datetime
+from difflib import SequenceMatcher
+
+_STRIP = re.compile(r"[^\w\s]")
+
+def normalize(text: str) -> str:
+    """Lowercase, drop punctuation and apostrophes, collapse whitespace."""
+    return " ".join(_STRIP.sub("", text.lower().replace("’", "'")).split())
+
+_KEYS = {c: (row, col) for row, keys in enumerate(("1234567890", "qwertyuiop", "asdfghjkl", "zxcvbnm"))
+         for col, c in enumerate(keys)}
+
+def _neighbours(a: str, b: str) -> bool:
+    if a not in _KEYS or b not in _KEYS:
+        return False
+    (r1, c1), (r2, c2) = _KEYS[a], _KEYS[b]
+    return abs(r1 - r2) <= 1 and abs(c1 - c2) <= 1
+
+def one_edit(word: str, target: str) -> bool:
+    """True if word is target with one letter changed, added or dropped, or two adjacent ones swapped."""
+    if word == target:
+        return True
+    if len(word) == len(target) + 1:
+        return any(word[:i] + word[i + 1:] == target for i in range(len(word)))
+    if len(word) + 1 == len(target):
+        return one_edit(target, word)
+    if len(word) != len(target):
+        return False
+    diff = [i for i, (a, b) in enumerate(zip(word, target)) if a != b]
+    return len(diff) == 1 or (len(diff) == 2 and diff[1] == diff[0] + 1
+                              and word[diff[0]] == target[diff[1]] and word[diff[1]] == target[diff[0]])
+
+# real words one letter away from a command word: never read as a typo of it
+_NEAR_WORDS = frozenset("""
+exist exits quite quiet quilt quint quirt squit clears cleary chats cheat chart chant
+resets resent preset johns
+""".split())
+
+def is_typo(word: str, target: str) -> bool:
+    """
+    One slip of the fingers in a word of four letters or more: a
+    neighbouring key hit instead ("exir"), two adjacent letters swapped
+    ("exti") or one extra letter ("exitr"). Missing letters don't count,
+    and neither do real words ("exits", "quilt", "chart"): those are
+    someone saying something else.
+    """
+    if len(target) < 4 or word in _NEAR_WORDS or word == target + "s":
+        return False
+    if len(word) == len(target) + 1:
+        return one_edit(word, target)
+    if len(word) != len(target):
+        return False
+    diff = [i for i, (a, b) in enumerate(zip(word, target)) if a != b]
+    if len(diff) == 1:
+        return _neighbours(word[diff[0]], target[diff[0]])
+    if len(diff) == 2 and diff[1] == diff[0] + 1:
+        i, j = diff
+        return word[i] == target[j] and word[j] == target[i]
+    return False
+
+def strict_score(query: str, phrase: str) -> float:
+    """1.0 for an exact match, 0.9 for one typo in one word (is_typo), else 0."""
+    if query == phrase:
+        return 1.0
+    words, targets = query.split(), phrase.split()
+    if len(words) != len(targets):
+        return 0.0
+    diff = [(w, t) for w, t in zip(words, targets) if w != t]
+    return 0.9 if len(diff) == 1 and is_typo(*diff[0]) else 0.0
+
+class Route:
+    def __init__(self, name: str, phrases: list[str], action: str | None = None,
+                 answer=None, threshold: float | None = None, strict: bool = False,
+                 keywords: list[str] | None = None):
+        if (action is None) == (answer is None):
+            raise ValueError(f"route {name!r} needs exactly one of action / answer")
+        self.name = name
+        self.phrases = [normalize(p) for p in phrases]
+        self.action = action
+        self.answer = answer
+        self.threshold = threshold
+        self.strict = strict  # exact / one-typo matching instead of fuzzy ratio
+        self.keywords = [normalize(k) for k in keywords or []]
+
+    def keyword_threshold(self, words: list[str], threshold: float) -> float | None:
+        """
+        The ratio the message needs given its words: `threshold` with a
+        keyword in it, a stricter 0.95 with only a misspelled one (edit
+        distance 1), None (no match) without any.
+        """
+        if not self.keywords or any(w in self.keywords for w in words):
+            return threshold
+        if any(one_edit(w, k) for w in words for k in self.keywords if len(k) >= 4):
+            return max(threshold, 0.95)
+        return None
+
+class Hit:
+    """A routed message: the route, how well it matched and how long routing took."""
+    def __init__(self, route: Route, score: float, phrase: str, latency_s: float, reply: str | None):
+        self.route = route
+        self.score = score
+        self.phrase = phrase
+        self.latency_s = latency_s
+        self.reply = reply  # canned answer (None for commands)
+
+    @property
+    def name(self) -> str:
+        return self.route.name
+
+    @property
+    def action(self) -> str | None:
+        return self.route.action
+
+    def fields(self) -> dict:
+        """What to attach to the logged event."""
+        return {"intent": self.name, "score": round(self.score, 3),
+                "route_ms": round(self.latency_s * 1000, 3)}
+
+class Router:
+    """Registry of routes; route(text) returns the best Hit above threshold, or None."""
+    def __init__(self, threshold: float = 0.85, max_chars: int = 60):
+        self.threshold = threshold
+        self.max_chars = max_chars  # longer messages are real questions: skip matching
+        self.routes = {}
+
+    def register(self, name: str, phrases: list[str], action: str | None = None,
+                 answer=None, threshold: float | None = None, strict: bool = False,
+                 keywords: list[str] | None = None) -> Route:
+        """Add or replace a route."""
+        route = Route(name, phrases, action=action, answer=answer, threshold=threshold, strict=strict,
+                      keywords=keywords)
+        self.routes[name] = route
+        return route
+
+    def unregister(self, name: str):
+        self.routes.pop(name, None)
+
+    def route(self, text: str) -> Hit | None:
+        t0 = time.perf_counter()
+        if len(text) > self.max_chars:
+            return None
+        query = normalize(text)
+        if not query:
+            return None
+        best, best_score, best_phrase = None, 0.0, ""
+        words = query.split()
+        matcher = SequenceMatcher(autojunk=False)
+        matcher.set_seq2(query)
+        for route in self.routes.values():
+            threshold = route.keyword_threshold(
+                words, route.threshold if route.threshold is not None else self.threshold)
+            if threshold is None:
+                continue
+            for phrase in route.phrases:
+                if route.strict:
+                    score = strict_score(query, phrase)
+                    if score and score > best_score:
+                        best, best_score, best_phrase = route, score, phrase
+                    continue
+                if phrase == query:
+                    score = 1.0
+                else:
+                    matcher.set_seq1(phrase)
+                    # cheap upper bounds first; most phrases are ruled out here
+                    if matcher.real_quick_ratio() < threshold or matcher.quick_ratio() < threshold:
+                        continue
+                    score = matcher.ratio()
+                if score >= threshold and score > best_score:
+                    best, best_score, best_phrase = route, score, phrase
+        if best is None:
+            return None
+        reply = best.answer(text) if best.answer is not None else None
+        return Hit(best, best_score, best_phrase, time.perf_counter() - t0, reply)
+
+# --- built-in routes ---
+def _time_answer(text: str) -> str:
+    now = datetime.now()
+    return f"It's {now:%I:%M %p}.".replace("It's 0", "It's ")
+
+def _date_answer(text: str) -> str:
+    now = datetime.now()
+    return f"Today is {now:%A, %B} {now.day}, {now.year}."
+
+def _greeting_answer(text: str) -> str:
+    hour = datetime.now().hour
+    part = "morning" if hour < 12 else "afternoon" if hour < 18 else "evening"
+    return f"Hi! Good {part}. What can I do for you?"
+
+def default_router(threshold: float = 0.85, extra: dict | None = None) -> Router:
+    """The built-in commands and answers, plus `extra` canned replies ({name: {"phrases", "reply"}})."""
+    r = Router(threshold)
+    # commands
+    # exit and clear end or wipe the conversation without asking: no fuzzy matching
+    r.register("exit", ["exit", "quit", "q", "exit john", "quit john"], action="exit", strict=True)
+    r.register("clear", ["clear", "clear chat", "clear history", "reset chat", "new chat"], action="clear",
+               strict=True)
+    r.register("speech_off", ["mute", "speech off", "turn speech off", "stop speaking", "quiet", "be quiet"],
+               action="speech_off")
+    r.register("speech_on", ["unmute", "speech on", "turn speech on"], action="speech_on")
+    r.register("toggle_speech", ["toggle speech", "toggle voice"], action="toggle_speech")
+    r.register("reload", ["reload", "reload config", "reload settings"], action="reload")
+    # answers: "what is the <x>" questions look alike, so these need their keyword and a close match
+    r.register("time", ["what time is it", "whats the time", "what is the time", "current time",
+                        "time please", "tell me the time"], answer=_time_answer,
+               threshold=0.9, keywords=["time"])
+    r.register("date", ["what is the date", "whats the date", "what day is it", "whats the date today",
+                        "todays date", "what is todays date", "what day is today"], answer=_date_answer,
+               threshold=0.9, keywords=["date", "day", "today", "todays"])
+    r.register("greeting", ["hi", "hello", "hey", "hi john", "hello john", "hey john", "hey there",
+                            "hi there", "good morning", "good afternoon", "good evening"],
+               answer=_greeting_answer, threshold=0.9)
+    r.register("thanks", ["thanks", "thank you", "thanks john", "thank you john", "thx"],
+               answer=lambda text: "You're welcome!", threshold=0.9)
+    for name, spec in (extra or {}).items():
+        reply = spec["reply"]
+        r.register(name, spec["phrases"], answer=lambda text, reply=reply: reply, threshold=spec.get("threshold"),
+                   keywords=spec.get("keywords"))
+    return r
@@ -0,0 +1,507 @@
+# src/john/server.py
+"""
+John as a multi-session HTTP service.
+
+    python -m src.john.server [--host 127.0.0.1] [--port 8765] [--stub]
+
+Endpoints (JSON in/out unless noted):
+    POST   /sessions                 -> {"session"}
+    DELETE /sessions/<id>
+    POST   /chat         {"session"?, "message"}   -> {"session", "reply"}
+    POST   /chat/stream  {"session"?, "message"}   -> text/event-stream of {"delta"} ... {"done", "reply"}
+                                                  (a failure mid-stream ends it with an "error" event)
+    GET    /ws           WebSocket; send {"session"?, "message"}, receive {"delta"} ... {"done", "reply"}
+    POST   /transcribe   raw audio body (e.g. audio/wav) -> {"text"}
+    POST   /tts          {"text"} -> audio bytes
+    GET    /health       -> sessions / load / cache stats
+
+Session ids are the same uuid hex used in the history log; an id that is
+not in memory but exists in the history store is resumed from it. Idle
+sessions are evicted after SERVER_IDLE_S. At most SERVER_MAX_CONCURRENT
+model calls run at once; a request that can't get a slot within
+SERVER_QUEUE_S gets 429 with Retry-After. Request bodies and WebSocket
+messages over SERVER_MAX_BODY_MB (default 25) are refused with 413 / close
+code 1009, WebSocket text that isn't UTF-8 with close code 1007. --stub answers locally (echo) so the server can be exercised
+without API keys.
+"""
+import io
+import json
+import time
+import uuid
+import base64
+import struct
+import hashlib
+import argparse
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import core, metrics
+from .context import ContextWindow, RollingSummarizer
+from .history import HistoryReader
+
+# --- model backends ---
+class CoreBackend:
+    """The real providers, through src/john/core.py."""
+    def ask_stream(self, messages):
+        return core.ask_llm_stream(messages)
+
+    def summarize(self, previous, turns):
+        return core.summarize_turns(previous, turns)
+
+    def transcribe(self, data: bytes, name: str) -> str:
+        buf = io.BytesIO(data)
+        buf.name = name
+        return core.transcribe_audio(buf)
+
+    def synthesize(self, text: str) -> bytes:
+        return core.synthesize(text)
+
+class StubBackend:
+    """Deterministic local stand-in: echoes the last user message word by word."""
+    def __init__(self, delay_s: float = 0.02):
+        self.delay_s = delay_s
+
+    def ask_stream(self, messages):
+        last = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        for word in f"You said: {last}".split(" "):
+            time.sleep(self.delay_s)
+            yield word + " "
+
+    def summarize(self, previous, turns):
+        return (previous + " " if previous else "") + " / ".join(m["content"][:40] for m in turns)
+
+    def transcribe(self, data: bytes, name: str) -> str:
+        return f"[{len(data)} bytes of audio]"
+
+    def synthesize(self, text: str) -> bytes:
+        return text.encode("utf-8")
+
+# --- sessions ---
+class Session:
+    def __init__(self, sid: str, backend):
+        self.id = sid
+        self.context = ContextWindow(core.get_system_prompt(), core.get_input_budget())
+        self.summarizer = RollingSummarizer(self.context, backend.summarize, core.get_summary_min_tokens())
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()  # one turn at a time per session
+
+class SessionStore:
+    """In-memory sessions with idle eviction; unknown ids are resumed from history."""
+    def __init__(self, backend, idle_s: float):
+        self.backend = backend
+        self.idle_s = idle_s
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._reader = None
+        threading.Thread(target=self._janitor, name="session-janitor", daemon=True).start()
+
+    def create(self) -> Session:
+        s = Session(uuid.uuid4().hex, self.backend)
+        with self._lock:
+            self._sessions[s.id] = s
+        core.log_event({"session": s.id, "role": "system", "content": core.get_system_prompt(), "model": core.get_model()})
+        return s
+
+    def get(self, sid: str | None) -> Session:
+        """The session for `sid`, resuming it from history or creating one if needed."""
+        if not sid:
+            return self.create()
+        with self._lock:
+            s = self._sessions.get(sid)
+            if s is not None:
+                s.last_used = time.monotonic()
+                return s
+        s = Session(sid, self.backend)
+        for event in self._history_events(sid):
+            if event.get("role") in ("user", "assistant"):
+                s.context.add(event["role"], event["content"])
+        with self._lock:
+            return self._sessions.setdefault(sid, s)
+
+    def _history_events(self, sid: str):
+        try:
+            if self._reader is None:
+                self._reader = HistoryReader(core.get_log_dir())
+            self._reader.refresh()
+            return list(self._reader.read_session(sid))
+        except OSError:
+            return []
+
+    def end(self, sid: str) -> bool:
+        with self._lock:
+            s = self._sessions.pop(sid, None)
+        if s is not None:
+            core.log_event({"session": sid, "role": "meta", "event": "end"})
+        return s is not None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _janitor(self):
+        while True:
+            time.sleep(min(60, max(1, self.idle_s / 4)))
+            cutoff = time.monotonic() - self.idle_s
+            with self._lock:
+                idle = [sid for sid, s in self._sessions.items() if s.last_used < cutoff and not s.lock.locked()]
+            for sid in idle:
+                self.end(sid)
+
+# --- HTTP handling ---
+def _unmask(data: bytes, mask: bytes) -> bytes:
+    """XOR a WebSocket payload with its 4-byte mask, as one big-int operation rather than per byte."""
+    n = len(data)
+    if not n or mask == b"\0\0\0\0":
+        return data
+    key = (mask * (n // 4 + 1))[:n]
+    return (int.from_bytes(data, "big") ^ int.from_bytes(key, "big")).to_bytes(n, "big")
+
+class Busy(Exception):
+    """No worker slot free (-> 429)."""
+
+class SessionBusy(Exception):
+    """The session is already in a turn (-> 409)."""
+    def __init__(self, sid: str):
+        super().__init__(sid)
+        self.session = sid
+
+class TooLarge(Exception):
+    """Request body over the size limit (-> 413)."""
+
+class App:
+    def __init__(self, backend, max_concurrent: int, queue_s: float, idle_s: float,
+                 max_body: int = 25 * 1024 * 1024):
+        self.backend = backend
+        self.max_body = max_body  # bytes per request body / WebSocket message
+        self.sessions = SessionStore(backend, idle_s)
+        self.max_concurrent = max_concurrent
+        self.queue_s = queue_s
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self.in_flight = 0
+        self.rejected = 0
+        self._count_lock = threading.Lock()
+
+    @contextmanager
+    def slot(self):
+        """Hold one provider-call slot; raises Busy when saturated."""
+        if not self._slots.acquire(timeout=self.queue_s):
+            with self._count_lock:
+                self.rejected += 1
+            raise Busy()
+        with self._count_lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._count_lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def chat(self, session: Session, message: str):
+        """
+        Run one turn, yielding deltas; the full reply is recorded at the end.
+        Raises SessionBusy (before the first delta) if the session is mid-turn.
+        If the model call fails the user message is taken back out of the
+        context, so the next turn doesn't carry an unanswered one.
+        """
+        if not session.lock.acquire(blocking=False):
+            raise SessionBusy(session.id)
+        try:
+            with self.slot():
+                session.summarizer.add(session.context.add("user", message))
+                trace = core.begin_trace()
+                core.log_event({"session": session.id, "role": "user", "content": message})
+                parts = []
+                try:
+                    for delta in self.backend.ask_stream(session.context.messages()):
+                        parts.append(delta)
+                        yield delta
+                except BaseException:  # incl. GeneratorExit when the client goes away
+                    session.context.discard_last("user")
+                    raise
+                reply = "".join(parts)
+                session.summarizer.add(session.context.add("assistant", reply))
+                fields = metrics.fields(trace)
+                core.log_event({"session": session.id, "role": "assistant", "content": reply,
+                                "model": core.reply_model(fields), **fields})
+                session.summarizer.kick()
+                session.last_used = time.monotonic()
+        finally:
+            session.lock.release()
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "John/1.0"
+    protocol_version = "HTTP/1.1"
+    app: App = None  # set by serve()
+
+    def log_message(self, fmt, *args):
+        pass  # requests end up in the history log instead
+
+    # --- helpers ---
+    def _send_json(self, status: int, obj, headers: dict | None = None):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _busy(self):
+        self._send_json(429, {"error": "server busy, retry shortly"}, {"Retry-After": "1"})
+
+    def _body(self) -> bytes:
+        try:
+            n = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            n = 0
+        if n > self.app.max_body:
+            self.close_connection = True  # the body is never read
+            raise TooLarge()
+        return self.rfile.read(n) if n > 0 else b""
+
+    def _json_body(self) -> dict:
+        try:
+            req = json.loads(self._body() or b"{}")
+        except ValueError:
+            return {}
+        return req if isinstance(req, dict) else {}
+
+    # --- routes ---
+    def do_GET(self):
+        if self.path == "/health":
+            app = self.app
+            self._send_json(200, {
+                "sessions": len(app.sessions),
+                "in_flight": app.in_flight,
+                "max_concurrent": app.max_concurrent,
+                "rejected": app.rejected,
+                "llm_cache": core.get_llm_cache_stats(),
+                "tts_cache": core.get_tts_cache_stats(),
+                "limits": core.get_limit_stats(),
+            })
+        elif self.path == "/ws" and self.headers.get("Upgrade", "").lower() == "websocket":
+            self._websocket()
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_DELETE(self):
+        if self.path.startswith("/sessions/"):
+            ok = self.app.sessions.end(self.path.rsplit("/", 1)[-1])
+            self._send_json(200 if ok else 404, {"ended": ok})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        try:
+            if self.path == "/sessions":
+                self._send_json(200, {"session": self.app.sessions.create().id})
+            elif self.path == "/chat":
+                self._chat(stream=False)
+            elif self.path == "/chat/stream":
+                self._chat(stream=True)
+            elif self.path == "/transcribe":
+                self._transcribe()
+            elif self.path == "/tts":
+                self._tts()
+            else:
+                self._send_json(404, {"error": "not found"})
+        except Busy:
+            self._busy()
+        except SessionBusy as e:
+            self._send_json(409, {"error": "session is busy", "session": e.session})
+        except TooLarge:
+            self._send_json(413, {"error": f"body over {self.app.max_body} bytes"})
+        except Exception as e:
+            self._send_json(502, {"error": str(e)})
+
+    def _chat(self, stream: bool):
+        req = self._json_body()
+        message = (req.get("message") or "").strip()
+        if not message:
+            self._send_json(400, {"error": "message is required"})
+            return
+        session = self.app.sessions.get(req.get("session"))
+        turn = self.app.chat(session, message)
+        if not stream:
+            self._send_json(200, {"session": session.id, "reply": "".join(turn)})
+            return
+        first = next(turn, None)  # may raise Busy / SessionBusy before any header is sent
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        parts = []
+        try:
+            if first is not None:
+                parts.append(first)
+                self._sse({"delta": first})
+            for delta in turn:
+                parts.append(delta)
+                self._sse({"delta": delta})
+            self._sse({"done": True, "session": session.id, "reply": "".join(parts)})
+        except (BrokenPipeError, ConnectionResetError):
+            turn.close()  # client went away: stop generating
+        except Exception as e:
+            # headers are out: report it in the stream, which then closes
+            turn.close()
+            try:
+                self._sse({"error": str(e), "session": session.id}, event="error")
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    def _sse(self, obj, event: str | None = None):
+        head = f"event: {event}\n" if event else ""
+        self.wfile.write(f"{head}data: {json.dumps(obj, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _transcribe(self):
+        data = self._body()
+        if not data:
+            self._send_json(400, {"error": "audio body is required"})
+            return
+        ext = {"audio/wav": "wav", "audio/x-wav": "wav", "audio/mpeg": "mp3", "audio/flac": "flac",
+               "audio/ogg": "ogg", "audio/webm": "webm"}.get(self.headers.get("Content-Type", ""), "wav")
+        with self.app.slot():
+            text = self.app.backend.transcribe(data, f"speech.{ext}")
+        self._send_json(200, {"text": text})
+
+    def _tts(self):
+        text = (self._json_body().get("text") or "").strip()
+        if not text:
+            self._send_json(400, {"error": "text is required"})
+            return
+        with self.app.slot():
+            audio = self.app.backend.synthesize(text)
+        rate = core.pcm_rate()
+        self.send_response(200)
+        self.send_header("Content-Type", f"audio/pcm;rate={rate}" if rate else "audio/mpeg")
+        self.send_header("Content-Length", str(len(audio)))
+        self.end_headers()
+        self.wfile.write(audio)
+
+    # --- minimal WebSocket (RFC 6455, text frames only) ---
+    _WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+    def _websocket(self):
+        key = self.headers.get("Sec-WebSocket-Key", "")
+        accept = base64.b64encode(hashlib.sha1((key + self._WS_GUID).encode()).digest()).decode()
+        self.send_response(101)
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.end_headers()
+        self.close_connection = True
+        while True:
+            msg = self._ws_recv()
+            if msg is None:
+                return
+            try:
+                try:
+                    req = json.loads(msg)
+                except ValueError:
+                    req = None
+                message = (req.get("message") or "").strip() if isinstance(req, dict) else ""
+                if not message:
+                    self._ws_send({"error": "message is required", "status": 400})
+                    continue
+                session = self.app.sessions.get(req.get("session"))
+                parts = []
+                for delta in self.app.chat(session, message):
+                    parts.append(delta)
+                    self._ws_send({"delta": delta})
+                self._ws_send({"done": True, "session": session.id, "reply": "".join(parts)})
+            except Busy:
+                self._ws_send({"error": "server busy, retry shortly", "status": 429})
+            except SessionBusy as e:
+                self._ws_send({"error": "session is busy", "session": e.session, "status": 409})
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            except Exception as e:
+                self._ws_send({"error": str(e)})
+
+    def _ws_recv(self) -> str | None:
+        """Read one (possibly fragmented) text message; None on close."""
+        chunks, size = [], 0
+        while True:
+            head = self.rfile.read(2)
+            if len(head) < 2:
+                return None
+            fin, opcode = head[0] & 0x80, head[0] & 0x0F
+            n = head[1] & 0x7F
+            if n == 126:
+                n = struct.unpack(">H", self.rfile.read(2))[0]
+            elif n == 127:
+                n = struct.unpack(">Q", self.rfile.read(8))[0]
+            size += n
+            if size > self.app.max_body:
+                self._ws_frame(0x8, struct.pack(">H", 1009) + b"message too big")
+                return None
+            mask = self.rfile.read(4) if head[1] & 0x80 else b"\0\0\0\0"
+            payload = _unmask(self.rfile.read(n), mask)
+            if opcode == 0x8:  # close
+                self._ws_frame(0x8, b"")
+                return None
+            if opcode == 0x9:  # ping
+                self._ws_frame(0xA, payload)
+                continue
+            if opcode in (0x0, 0x1):
+                chunks.append(payload)
+                if fin:
+                    try:
+                        return b"".join(chunks).decode("utf-8")
+                    except UnicodeDecodeError:
+                        self._ws_frame(0x8, struct.pack(">H", 1007) + b"invalid utf-8")
+                        return None
+
+    def _ws_send(self, obj):
+        self._ws_frame(0x1, json.dumps(obj, ensure_ascii=False).encode("utf-8"))
+
+    def _ws_frame(self, opcode: int, payload: bytes):
+        n = len(payload)
+        if n < 126:
+            head = struct.pack(">BB", 0x80 | opcode, n)
+        elif n < 1 << 16:
+            head = struct.pack(">BBH", 0x80 | opcode, 126, n)
+        else:
+            head = struct.pack(">BBQ", 0x80 | opcode, 127, n)
+        self.wfile.write(head + payload)
+        self.wfile.flush()
+
+def serve(host: str = "127.0.0.1", port: int = 8765, stub: bool = False) -> ThreadingHTTPServer:
+    """Build the server (call serve_forever() on the result)."""
+    backend = StubBackend() if stub else CoreBackend()
+    Handler.app = App(
+        backend,
+        max_concurrent=int(core.settings.get("SERVER_MAX_CONCURRENT", 8)),
+        queue_s=float(core.settings.get("SERVER_QUEUE_S", 0.5)),
+        idle_s=float(core.settings.get("SERVER_IDLE_S", 1800)),
+        max_body=int(float(core.settings.get("SERVER_MAX_BODY_MB", 25)) * 1024 * 1024),
+    )
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    return httpd
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m src.john.server", description="Run John as an HTTP/WebSocket service.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--stub", action="store_true", help="answer locally instead of calling the providers")
+    args = ap.parse_args(argv)
+    httpd = serve(args.host, args.port, args.stub)
+    if not args.stub:
+        core.prewarm_in_background()
+    print(f"John server on http://{args.host}:{args.port}" + (" (stub)" if args.stub else ""))
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        core.flush_log()
+
+if __name__ == "__main__":
+    main()
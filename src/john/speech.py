@@ -0,0 +1,208 @@
+# src/john/speech.py
+import re
+import queue
+import threading
+import contextvars
+from collections import deque
+
+from . import metrics
+from .core import (
+    synthesize_stream, play_audio, stop_playback, get_tts_prefetch, pcm_rate, get_player,
+    barge_in_enabled, make_barge_in_recorder,
+)
+
+# a sentence ends at . ! ? … (plus closing quotes/brackets) followed by whitespace, or at a newline
+_BOUNDARY = re.compile(r"(?<=[.!?…])[\"')\]]*\s+|\n+")
+
+class SentenceSplitter:
+    """Cut streamed text into sentences as soon as each one is complete."""
+    def __init__(self, min_chars: int = 12):
+        self.min_chars = min_chars  # merge tiny fragments like "Hi!" into the next sentence
+        self.buf = ""
+
+    def feed(self, text: str) -> list[str]:
+        """Add text, return any sentences that are now complete."""
+        self.buf += text
+        out = []
+        start = 0
+        for m in _BOUNDARY.finditer(self.buf):
+            piece = self.buf[start:m.end()].strip()
+            if len(piece) < self.min_chars:
+                continue
+            out.append(piece)
+            start = m.end()
+        self.buf = self.buf[start:]
+        return out
+
+    def flush(self) -> list[str]:
+        """Return whatever is left once the text is finished."""
+        rest, self.buf = self.buf.strip(), ""
+        return [rest] if rest else []
+
+class SpeechPipeline:
+    """
+    Speak a reply while it is still being generated.
+    Sentences are synthesized on one thread and played in order on another;
+    at most `prefetch` sentences are synthesized and not yet fully played
+    (the one playing included), so with the default of 2 sentence N plays
+    while N+1 is being synthesized. With a pcm_* TTS_FORMAT audio
+    chunks go to the output stream as they arrive, so speech starts on the
+    first chunk of the first sentence and sentences follow without a gap;
+    other formats are played a sentence at a time. Both threads record into the
+    creator's metrics trace; `on_done` is called once the last sentence
+    has played (or the pipeline was cancelled).
+
+    cancel() stops talking at once: queued sentences are dropped and the
+    current one is cut off. With `on_barge_in` and BARGE_IN_VAD on, the mic
+    is watched during playback and the user starting to talk cancels the
+    pipeline and calls `on_barge_in()`.
+    """
+    _DONE = object()
+    _EOS = object()  # end of one sentence's audio
+
+    def __init__(self, prefetch: int | None = None, min_chars: int = 12, on_done=None, on_barge_in=None):
+        self.splitter = SentenceSplitter(min_chars=min_chars)
+        self.on_done = on_done
+        self.on_barge_in = on_barge_in if barge_in_enabled() else None
+        self._texts = queue.Queue()
+        self._audio = queue.Queue()
+        self._ahead = threading.Semaphore(max(1, prefetch or get_tts_prefetch()))
+        self._cancelled = threading.Event()
+        self._monitor = None  # VADRecorder watching for barge-in
+        self._synth_thread = threading.Thread(target=contextvars.copy_context().run,
+                                              args=(self._synth_worker,), daemon=True)
+        self._play_thread = threading.Thread(target=contextvars.copy_context().run,
+                                             args=(self._play_worker,), daemon=True)
+        self._synth_thread.start()
+        self._play_thread.start()
+
+    @property
+    def active(self) -> bool:
+        """True until the last sentence has played (or cancel())."""
+        return self._play_thread.is_alive() and not self._cancelled.is_set()
+
+    def feed(self, text: str):
+        """Feed a chunk of reply text; complete sentences go to synthesis."""
+        for sentence in self.splitter.feed(text):
+            self._texts.put(sentence)
+
+    def close(self):
+        """Mark the reply finished and send the trailing fragment."""
+        for sentence in self.splitter.flush():
+            self._texts.put(sentence)
+        self._texts.put(self._DONE)
+
+    def wait(self, timeout: float | None = None):
+        """Block until every queued sentence has been played."""
+        self._play_thread.join(timeout)
+
+    def cancel(self):
+        """Stop talking now: drop what is queued and cut off the current sentence."""
+        if self._cancelled.is_set():
+            return
+        self._cancelled.set()
+        for q in (self._texts, self._audio):
+            while True:
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    break
+        self._texts.put(self._DONE)
+        if self._monitor is not None:
+            self._monitor.stop()
+        if self._play_thread.is_alive():
+            stop_playback()
+
+    def _reserve(self) -> bool:
+        # blocks once `prefetch` sentences are waiting, but gives up on cancel()
+        while not self._cancelled.is_set():
+            if self._ahead.acquire(timeout=0.1):
+                return True
+        return False
+
+    def _synth_worker(self):
+        while not self._cancelled.is_set():
+            text = self._texts.get()
+            if text is self._DONE or not self._reserve():
+                break
+            try:
+                for chunk in synthesize_stream(text):
+                    if self._cancelled.is_set():
+                        break
+                    self._audio.put(chunk)
+            except Exception as e:
+                print(f"[TTS error] {e}")
+            self._audio.put(self._EOS)
+        self._audio.put(self._DONE)
+
+    def _play_worker(self):
+        parts = []  # current sentence, when it is played whole
+        ends = deque()  # player position where each queued sentence ends
+        try:
+            rate = pcm_rate()
+            player = get_player(rate) if rate else None
+            while not self._cancelled.is_set():
+                # a sentence frees its prefetch slot once the device has played it,
+                # not when it is copied into the (much larger) ring buffer
+                while ends and player.played(ends[0]):
+                    ends.popleft()
+                    self._ahead.release()
+                try:
+                    item = self._audio.get(timeout=0.02 if ends else 0.1)
+                except queue.Empty:
+                    continue
+                if item is self._DONE or self._cancelled.is_set():
+                    break
+                if item is self._EOS:
+                    if player is not None:
+                        ends.append(player.position)
+                        continue
+                    if parts:
+                        self._play(b"".join(parts))
+                        parts = []
+                    self._ahead.release()
+                    continue
+                if player is None:
+                    parts.append(item)
+                    continue
+                self._started()
+                if not player.write(item):
+                    break
+            if player is not None and not self._cancelled.is_set():
+                with metrics.span("tts_play"):
+                    player.drain()
+        except Exception as e:
+            if not self._cancelled.is_set():
+                print(f"[TTS error] {e}")
+        finally:
+            if self._monitor is not None:
+                self._monitor.stop()
+            if self.on_done is not None:
+                self.on_done()
+
+    def _started(self):
+        metrics.mark("first_audio")
+        if self.on_barge_in is not None and self._monitor is None:
+            self._start_monitor()
+
+    def _play(self, audio: bytes):
+        self._started()
+        try:
+            play_audio(audio)
+        except Exception as e:
+            if not self._cancelled.is_set():
+                print(f"[TTS error] {e}")
+
+    def _start_monitor(self):
+        self._monitor = make_barge_in_recorder()
+        threading.Thread(target=self._watch, args=(self._monitor,), daemon=True).start()
+
+    def _watch(self, recorder):
+        try:
+            heard = recorder.wait_for_speech()
+        except Exception as e:
+            print(f"[Barge-in error] {e}")
+            return
+        if heard and not self._cancelled.is_set():
+            self.cancel()
+            self.on_barge_in()
@@ -0,0 +1,165 @@
+# src/john/tiers.py
+"""
+Per-turn choice of model, completion-token cap and reasoning effort.
+
+Cheap local features of the turn (length of the last user message, a
+rough question type, conversation length, whether the reply will be
+spoken) are matched against an ordered list of rules; the first rule that
+matches picks a tier, optionally overriding some of its fields. No rule
+matching means the "default" tier, which is the configured MODEL with
+the usual caps. Configured in config.json:
+
+    "MODEL_TIERS": {
+      "fast":    {"model": "gpt-5-nano", "max_completion_tokens": 200, "reasoning_effort": "minimal"},
+      "default": {"model": "gpt-5-nano", "max_completion_tokens": 400, "reasoning_effort": "minimal"},
+      "deep":    {"model": "gpt-5-mini", "max_completion_tokens": 1000, "reasoning_effort": "low"}
+    },
+    "MODEL_RULES": [
+      {"if": {"kind": ["code", "math", "analysis"]}, "tier": "deep"},
+      {"if": {"min_words": 60}, "tier": "deep"},
+      {"if": {"kind": ["chitchat"]}, "tier": "fast"},
+      {"if": {"speaking": true, "max_words": 25}, "tier": "fast", "max_completion_tokens": 250}
+    ]
+
+Conditions: kind (list), min_words / max_words, min_chars / max_chars,
+min_turns / max_turns (user turns so far), speaking (bool) and pattern
+(regex on the message). All conditions of a rule must hold.
+"""
+import re
+
+KINDS = ("chitchat", "code", "math", "analysis", "question", "statement")
+
+_CHITCHAT = re.compile(
+    r"^(hi|hey|hello|yo|thanks|thank you|thx|ok|okay|cool|nice|great|awesome|lol|haha|good (morning|afternoon|"
+    r"evening|night)|how are you|how's it going|what's up|bye|see you|sounds good|got it)\b", re.I)
+# code: snippets and unambiguous markers, not every sentence that says "api" or "class"
+_CODE = re.compile(
+    r"```|\b(def|function|fn)\s+\w+\s*\(|\bclass\s+\w+\s*[:({]|\b(import|from)\s+[\w.]+\s+import\b|"
+    r"^\s*(import|#include|using)\s+[\w.<>]+|\w+\.\w+\(.*\)|\b\w+\(\)|[{}]\s*$|[)\]]\s*;\s*$|"
+    r"\b(stack ?trace|traceback|segfault|syntax error|compile error|null pointer|regex|refactor|debug(ging)?)\b|"
+    r"\b(python|javascript|typescript|java|c\+\+|rust|golang|sql|bash|shell) (code|script|function|program|"
+    r"query|class|error|bug)|\b(write|fix|review|optimi[sz]e) (a |an |the |this |my )?(code|function|script|program|"
+    r"query|regex|unit tests?)\b", re.I | re.M)
+# math: an operator between numbers ("-" and "/" only with spaces, so "2-3 kids" and dates don't count)
+_MATH = re.compile(
+    r"\d\s*[+*^×÷=]\s*\d|\d\s+[-/]\s+\d|\b(calculate|compute|solve|equation|integral|derivative|"
+    r"probability|square root|factorial)\b", re.I)
+_ANALYSIS = re.compile(
+    r"\b(explain why|why does|why do|compare|comparison|pros and cons|trade-?offs?|analy[sz]e|analysis|"
+    r"step by step|in detail|make a plan|plan (for|my|out)|strategy|evaluate|critique|summari[sz]e|"
+    r"write (a|an|me a|me an) (essay|article|story|report|letter|proposal|review|script|program))\b", re.I)
+_QUESTION = re.compile(r"\?\s*$|^(what|who|when|where|which|why|how|is|are|can|could|should|do|does|did|will)\b", re.I)
+
+def classify(text: str) -> str:
+    """Rough question type of one message (one of KINDS)."""
+    t = text.strip()
+    if _CODE.search(t):
+        return "code"
+    if _MATH.search(t):
+        return "math"
+    if _ANALYSIS.search(t):
+        return "analysis"
+    if _CHITCHAT.match(t) and len(t.split()) <= 8:
+        return "chitchat"
+    if _QUESTION.search(t):
+        return "question"
+    return "statement"
+
+def features(messages: list[dict], speaking: bool = False) -> dict:
+    """Features of the turn: the last user message plus conversation length and output mode."""
+    last = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+    return {
+        "kind": classify(last),
+        "words": len(last.split()),
+        "chars": len(last),
+        "turns": sum(1 for m in messages if m["role"] == "user"),
+        "speaking": speaking,
+    }
+
+class Decision:
+    """What one LLM call runs with, and why."""
+    def __init__(self, tier: str, model: str, max_completion_tokens: int, reasoning_effort: str,
+                 rule: int | None, feats: dict):
+        self.tier = tier
+        self.model = model
+        self.max_completion_tokens = max_completion_tokens
+        self.reasoning_effort = reasoning_effort
+        self.rule = rule  # index into the rules; None = default tier
+        self.features = feats
+
+    def params(self) -> dict:
+        """Keyword arguments for chat.completions.create."""
+        return {"model": self.model, "max_completion_tokens": self.max_completion_tokens,
+                "reasoning_effort": self.reasoning_effort}
+
+    def fields(self) -> dict:
+        """What gets logged with the turn."""
+        return {"tier": self.tier, "rule": self.rule, **self.params(), "features": self.features}
+
+def _matches(cond: dict, feats: dict, text: str) -> bool:
+    if "kind" in cond and feats["kind"] not in cond["kind"]:
+        return False
+    for key, name in (("words", "words"), ("chars", "chars"), ("turns", "turns")):
+        if f"min_{key}" in cond and feats[name] < cond[f"min_{key}"]:
+            return False
+        if f"max_{key}" in cond and feats[name] > cond[f"max_{key}"]:
+            return False
+    if "speaking" in cond and feats["speaking"] != bool(cond["speaking"]):
+        return False
+    if "pattern" in cond and not re.search(cond["pattern"], text, re.I):
+        return False
+    return True
+
+class TierRouter:
+    """Ordered rules over turn features -> a Decision; the first matching rule wins."""
+    def __init__(self, tiers: dict, rules: list[dict]):
+        if "default" not in tiers:
+            raise ValueError("MODEL_TIERS needs a \"default\" tier")
+        for i, rule in enumerate(rules):
+            if rule.get("tier", "default") not in tiers:
+                raise ValueError(f"MODEL_RULES[{i}]: unknown tier {rule.get('tier')!r}")
+        self.tiers = tiers
+        self.rules = rules
+
+    @property
+    def max_completion_tokens(self) -> int:
+        """The largest completion cap any tier or rule can ask for (the reply room to reserve)."""
+        caps = [int(t["max_completion_tokens"]) for t in self.tiers.values()]
+        caps += [int(r["max_completion_tokens"]) for r in self.rules if "max_completion_tokens" in r]
+        return max(caps)
+
+    def decide(self, messages: list[dict], speaking: bool = False) -> Decision:
+        feats = features(messages, speaking)
+        last = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        for i, rule in enumerate(self.rules):
+            if _matches(rule.get("if", {}), feats, last):
+                return self._decision(rule.get("tier", "default"), rule, i, feats)
+        return self._decision("default", {}, None, feats)
+
+    def fixed(self, tier: str, messages: list[dict], speaking: bool = False) -> Decision:
+        """A Decision for `tier` regardless of the rules (routing switched off)."""
+        return self._decision(tier, {}, None, features(messages, speaking))
+
+    def _decision(self, tier: str, rule: dict, index: int | None, feats: dict) -> Decision:
+        spec = {**self.tiers[tier], **{k: rule[k] for k in ("model", "max_completion_tokens", "reasoning_effort")
+                                       if k in rule}}
+        return Decision(tier, spec["model"], int(spec["max_completion_tokens"]), spec["reasoning_effort"],
+                        index, feats)
+
+DEFAULT_RULES = [
+    {"if": {"kind": ["code", "math", "analysis"]}, "tier": "deep"},
+    {"if": {"min_words": 60}, "tier": "deep"},
+    {"if": {"kind": ["chitchat"]}, "tier": "fast"},
+    {"if": {"speaking": True, "max_words": 25}, "tier": "fast"},
+]
+
+def default_tiers(model: str, max_completion_tokens: int, reasoning_effort: str, deep_model: str | None = None) -> dict:
+    """The built-in tiers around the configured model; "deep" only changes model if one is given."""
+    return {
+        "fast": {"model": model, "max_completion_tokens": min(200, max_completion_tokens),
+                 "reasoning_effort": "minimal"},
+        "default": {"model": model, "max_completion_tokens": max_completion_tokens,
+                    "reasoning_effort": reasoning_effort},
+        "deep": {"model": deep_model or model, "max_completion_tokens": max(1000, max_completion_tokens),
+                 "reasoning_effort": "low"},
+    }